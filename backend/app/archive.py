@@ -0,0 +1,343 @@
+"""Append-only columnar archive for anonymized events."""
+from __future__ import annotations
+
+import json
+import os
+import struct
+import sys
+import threading
+import zlib
+from array import array
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - exercised only on platforms without flock (Windows)
+    fcntl = None
+
+# Every segment starts with: magic, row count, metadata length, column block length.
+SEGMENT_MAGIC = b"EVA1"
+_SEGMENT_HEADER = struct.Struct("<4sIII")
+_EPOCH = datetime(1970, 1, 1)
+_FILE_SUFFIX = ".evarc"
+_LOCK_FILE = ".archive.lock"
+
+
+class ArchiveFormatError(RuntimeError):
+    """Raised when an archive file does not contain valid segments."""
+
+
+class ArchivedEvent(NamedTuple):
+    id: int
+    event_type: str
+    created_at: datetime
+
+
+@dataclass(frozen=True)
+class SegmentInfo:
+    """Location and summary of one segment, read without decompressing its columns."""
+
+    path: Path
+    offset: int
+    rows: int
+    counts: Dict[str, int]
+    min_created_at: datetime
+    max_created_at: datetime
+    meta_length: int
+    body_length: int
+
+    @property
+    def body_offset(self) -> int:
+        return self.offset + _SEGMENT_HEADER.size + self.meta_length
+
+
+def _to_micros(value: datetime) -> int:
+    return (value - _EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(value: int) -> datetime:
+    return _EPOCH + timedelta(microseconds=value)
+
+
+def _delta_encode(values: Sequence[int]) -> array:
+    encoded = array("q", [0] * len(values))
+    previous = 0
+    for index, value in enumerate(values):
+        encoded[index] = value - previous
+        previous = value
+    return encoded
+
+
+def _delta_decode(encoded: array) -> List[int]:
+    values = []
+    running = 0
+    for delta in encoded:
+        running += delta
+        values.append(running)
+    return values
+
+
+def _little_endian(column: array) -> bytes:
+    if sys.byteorder == "big":
+        column = array(column.typecode, column)
+        column.byteswap()
+    return column.tobytes()
+
+
+def _column_from_bytes(typecode: str, raw: bytes) -> array:
+    column = array(typecode)
+    column.frombytes(raw)
+    if sys.byteorder == "big":
+        column.byteswap()
+    return column
+
+
+def encode_segment(rows: Sequence[Tuple[int, str, datetime]]) -> bytes:
+    """Pack ``(id, event_type, created_at)`` rows into one compressed segment.
+
+    Rows are stored column by column: delta-encoded ids and microsecond timestamps, and event
+    types as indexes into a per-segment dictionary. Per-type counts and the timestamp range go
+    into an uncompressed JSON header, so counting never has to inflate the columns.
+    """
+
+    ids = [row[0] for row in rows]
+    micros = [_to_micros(row[2]) for row in rows]
+    types: Dict[str, int] = {}
+    type_indexes = array("I", (types.setdefault(row[1], len(types)) for row in rows))
+    counts = Counter(row[1] for row in rows)
+    meta = json.dumps(
+        {
+            "types": list(types),
+            "counts": [counts[event_type] for event_type in types],
+            "min_created_at": min(micros),
+            "max_created_at": max(micros),
+        },
+        separators=(",", ":"),
+    ).encode()
+    id_column = _little_endian(_delta_encode(ids))
+    time_column = _little_endian(_delta_encode(micros))
+    body = zlib.compress(id_column + time_column + _little_endian(type_indexes), 6)
+    return _SEGMENT_HEADER.pack(SEGMENT_MAGIC, len(rows), len(meta), len(body)) + meta + body
+
+
+def decode_segment_body(rows: int, meta: Dict, body: bytes) -> List[ArchivedEvent]:
+    raw = zlib.decompress(body)
+    width = rows * 8
+    ids = _delta_decode(_column_from_bytes("q", raw[:width]))
+    micros = _delta_decode(_column_from_bytes("q", raw[width : 2 * width]))
+    type_indexes = _column_from_bytes("I", raw[2 * width :])
+    types = meta["types"]
+    return [
+        ArchivedEvent(event_id, types[type_index], _from_micros(created))
+        for event_id, created, type_index in zip(ids, micros, type_indexes)
+    ]
+
+
+class EventArchive:
+    """Directory of monthly archive files (``events-YYYY-MM.evarc``).
+
+    Files are append-only sequences of self-describing segments. A segment that was only
+    partially written (e.g. the process died mid-append) is ignored by readers and cut off by
+    :meth:`repair`, so a crash never corrupts the segments before it.
+
+    Writers serialize on an ``flock`` of a lock file in the directory, so several worker
+    processes may share one archive; see :meth:`exclusive`.
+    """
+
+    def __init__(self, directory: os.PathLike) -> None:
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.RLock()
+        self._depth = 0
+
+    @contextmanager
+    def exclusive(self) -> Iterator[None]:
+        """Hold the archive against every other writer, in this process or any other.
+
+        Blocks until the lock is free. Re-entrant within a thread, so a caller can hold it across
+        :meth:`repair`, :meth:`append` and its own database work as one step.
+        """
+
+        with self._lock:
+            self._depth += 1
+            try:
+                if self._depth > 1 or fcntl is None:
+                    yield
+                    return
+                with (self.directory / _LOCK_FILE).open("ab") as handle:
+                    fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+                    try:
+                        yield
+                    finally:
+                        fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+            finally:
+                self._depth -= 1
+
+    def path_for(self, month: str) -> Path:
+        return self.directory / f"events-{month}{_FILE_SUFFIX}"
+
+    def months(self) -> List[str]:
+        paths = self.directory.glob(f"events-*{_FILE_SUFFIX}")
+        return sorted(path.stem[len("events-") :] for path in paths)
+
+    def append(self, rows: Iterable[Tuple[int, str, datetime]]) -> Dict[str, SegmentInfo]:
+        """Append rows as one segment per calendar month and flush them to disk.
+
+        Returns the segment written for each month. Once this returns, the rows are durable and
+        may be deleted from the live table.
+        """
+
+        by_month: Dict[str, List[Tuple[int, str, datetime]]] = defaultdict(list)
+        for row in rows:
+            by_month[row[2].strftime("%Y-%m")].append(row)
+
+        written: Dict[str, SegmentInfo] = {}
+        with self.exclusive():
+            for month, month_rows in sorted(by_month.items()):
+                segment = encode_segment(month_rows)
+                path = self.path_for(month)
+                with path.open("ab") as handle:
+                    offset = handle.tell()
+                    handle.write(segment)
+                    handle.flush()
+                    os.fsync(handle.fileno())
+                header = segment[: _SEGMENT_HEADER.size]
+                written[month] = self._read_segment_info(path, offset, header, segment)
+        return written
+
+    def _read_segment_info(self, path: Path, offset: int, header: bytes, data: bytes) -> SegmentInfo:
+        magic, rows, meta_length, body_length = _SEGMENT_HEADER.unpack(header)
+        if magic != SEGMENT_MAGIC:
+            raise ArchiveFormatError(f"{path} has no segment at offset {offset}")
+        meta = json.loads(data[_SEGMENT_HEADER.size : _SEGMENT_HEADER.size + meta_length])
+        return SegmentInfo(
+            path=path,
+            offset=offset,
+            rows=rows,
+            counts=dict(zip(meta["types"], meta["counts"])),
+            min_created_at=_from_micros(meta["min_created_at"]),
+            max_created_at=_from_micros(meta["max_created_at"]),
+            meta_length=meta_length,
+            body_length=body_length,
+        )
+
+    def segments(self, month: str) -> Iterator[SegmentInfo]:
+        """Yield the complete segments of one month, reading only their headers."""
+
+        path = self.path_for(month)
+        if not path.exists():
+            return
+        size = path.stat().st_size
+        with path.open("rb") as handle:
+            offset = 0
+            while offset + _SEGMENT_HEADER.size <= size:
+                header = handle.read(_SEGMENT_HEADER.size)
+                _, _, meta_length, body_length = _SEGMENT_HEADER.unpack(header)
+                end = offset + _SEGMENT_HEADER.size + meta_length + body_length
+                if end > size:
+                    break
+                meta = handle.read(meta_length)
+                yield self._read_segment_info(path, offset, header, header + meta)
+                handle.seek(end)
+                offset = end
+
+    def repair(self) -> int:
+        """Truncate partially written trailing segments; returns the number of bytes removed."""
+
+        removed = 0
+        with self.exclusive():
+            for month in self.months():
+                path = self.path_for(month)
+                end = 0
+                for segment in self.segments(month):
+                    end = segment.body_offset + segment.body_length
+                size = path.stat().st_size
+                if end < size:
+                    with path.open("r+b") as handle:
+                        handle.truncate(end)
+                    removed += size - end
+        return removed
+
+    def last_segments(self) -> List[SegmentInfo]:
+        """Most recent segment of every month, i.e. the only ones whose delete may be pending."""
+
+        last = []
+        for month in self.months():
+            segment = None
+            for segment in self.segments(month):
+                pass
+            if segment is not None:
+                last.append(segment)
+        return last
+
+    def read_segment(self, segment: SegmentInfo) -> List[ArchivedEvent]:
+        with segment.path.open("rb") as handle:
+            handle.seek(segment.offset + _SEGMENT_HEADER.size)
+            meta = json.loads(handle.read(segment.meta_length))
+            body = handle.read(segment.body_length)
+        return decode_segment_body(segment.rows, meta, body)
+
+    def iter_events(
+        self,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+    ) -> Iterator[ArchivedEvent]:
+        """Yield archived events with ``created_from <= created_at < created_to``."""
+
+        for segment in self._segments_in_range(created_from, created_to):
+            for event in self.read_segment(segment):
+                if created_from is not None and event.created_at < created_from:
+                    continue
+                if created_to is not None and event.created_at >= created_to:
+                    continue
+                yield event
+
+    def count_by_type(
+        self,
+        created_from: Optional[datetime] = None,
+        created_to: Optional[datetime] = None,
+    ) -> Dict[str, int]:
+        """Per event type counts of archived events with ``created_from <= created_at < created_to``.
+
+        Segments entirely inside the range are answered from their headers; only segments
+        straddling a bound are decompressed.
+        """
+
+        counts: Counter = Counter()
+        for segment in self._segments_in_range(created_from, created_to):
+            inside = (created_from is None or segment.min_created_at >= created_from) and (
+                created_to is None or segment.max_created_at < created_to
+            )
+            if inside:
+                counts.update(segment.counts)
+                continue
+            for event in self.read_segment(segment):
+                if (created_from is None or event.created_at >= created_from) and (
+                    created_to is None or event.created_at < created_to
+                ):
+                    counts[event.event_type] += 1
+        return dict(counts)
+
+    def _segments_in_range(
+        self,
+        created_from: Optional[datetime],
+        created_to: Optional[datetime],
+    ) -> Iterator[SegmentInfo]:
+        first_month = created_from.strftime("%Y-%m") if created_from is not None else None
+        last_month = created_to.strftime("%Y-%m") if created_to is not None else None
+        for month in self.months():
+            if first_month is not None and month < first_month:
+                continue
+            if last_month is not None and month > last_month:
+                continue
+            for segment in self.segments(month):
+                if created_from is not None and segment.max_created_at < created_from:
+                    continue
+                if created_to is not None and segment.min_created_at >= created_to:
+                    continue
+                yield segment
@@ -1,53 +1,347 @@
 """JWT authentication utilities."""
 from __future__ import annotations
 
+import asyncio
+import hashlib
+import heapq
+import json
+import logging
 import os
+import random
+import tempfile
 import threading
+import time
+import urllib.request
+from collections import OrderedDict
+from dataclasses import dataclass
 from datetime import datetime, timezone
 from functools import lru_cache
-from typing import Dict
+from pathlib import Path
+from types import MappingProxyType
+from typing import Callable, Dict, List, Mapping, Optional, Tuple, Union
 
 import jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from sqlalchemy import DateTime, bindparam, delete, func, insert, select, text, update
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.exc import IntegrityError
+
+from .metrics import stage_timer
+from .models import UsedNonce
 
 ALGORITHM = "RS256"
 REQUIRED_CLAIMS = ("exp", "iss", "aud", "nonce")
 INTEGRITY_CLAIM = "device_integrity"
 REQUIRED_INTEGRITY_VERDICT = "MEETS_DEVICE_INTEGRITY"
+UNKNOWN_SIGNING_KEY_DETAIL = "Unknown signing key"
 auth_scheme = HTTPBearer(auto_error=False)
+logger = logging.getLogger(__name__)
 
 
 class NonceReplayError(Exception):
     """Raised when a nonce has already been observed."""
 
 
-class NonceCache:
-    """Tracks previously observed nonces to prevent replay attacks."""
+class NonceCacheFullError(Exception):
+    """Raised when the nonce cache is at capacity and configured to reject new nonces."""
+
 
-    def __init__(self) -> None:
-        self._entries: Dict[str, datetime] = {}
+NONCE_OVERFLOW_POLICIES = ("reject", "evict")
+
+
+class NonceCache:
+    """Tracks previously observed nonces to prevent replay attacks.
+
+    Expiries are kept in a min-heap alongside the lookup dict, so each ``register`` only pops
+    the entries that actually expired instead of scanning every live nonce. At ``capacity``
+    the ``overflow`` policy either rejects the new nonce (fail closed) or evicts the nonce
+    closest to expiry, which only shortens replay protection for that nonce.
+    """
+
+    def __init__(self, capacity: int = 1_000_000, overflow: str = "reject") -> None:
+        if overflow not in NONCE_OVERFLOW_POLICIES:
+            raise ValueError(f"Unknown nonce overflow policy {overflow!r}")
+        self._capacity = capacity
+        self._overflow = overflow
+        self._entries: Dict[str, float] = {}
+        self._expiries: List[Tuple[float, str]] = []
         self._lock = threading.Lock()
+        self.expirations = 0
+        self.evictions = 0
+        self.rejections = 0
 
-    def _purge(self, now: datetime) -> None:
-        expired = [nonce for nonce, expiry in self._entries.items() if expiry <= now]
-        for nonce in expired:
-            self._entries.pop(nonce, None)
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _pop_earliest(self) -> str:
+        expiry, nonce = heapq.heappop(self._expiries)
+        if self._entries.get(nonce) == expiry:
+            del self._entries[nonce]
+        return nonce
+
+    def _purge(self, now: float) -> None:
+        while self._expiries and self._expiries[0][0] <= now:
+            self._pop_earliest()
+            self.expirations += 1
 
     def register(self, nonce: str, expires_at: datetime) -> None:
-        now = datetime.now(timezone.utc)
+        now = time.time()
         if expires_at.tzinfo is None:
             expires_at = expires_at.replace(tzinfo=timezone.utc)
+        expiry = expires_at.timestamp()
 
         with self._lock:
             self._purge(now)
-            expiry = self._entries.get(nonce)
-            if expiry and expiry > now:
+            if nonce in self._entries:
                 raise NonceReplayError(f"Nonce {nonce!r} has already been used")
-            self._entries[nonce] = expires_at
+            if len(self._entries) >= self._capacity:
+                if self._overflow == "reject":
+                    self.rejections += 1
+                    raise NonceCacheFullError(f"Nonce cache is full ({self._capacity} live nonces)")
+                self._pop_earliest()
+                self.evictions += 1
+            self._entries[nonce] = expiry
+            heapq.heappush(self._expiries, (expiry, nonce))
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "capacity": self._capacity,
+                "expirations": self.expirations,
+                "evictions": self.evictions,
+                "rejections": self.rejections,
+            }
+
+
+# SQLite and PostgreSQL share the upsert syntax. Written as ``text`` because the dialect
+# ``insert()`` constructs are not cacheable and would be recompiled on every request.
+_CLAIM_NONCE_UPSERT = text(
+    "INSERT INTO used_nonces (nonce, expires_at) VALUES (:nonce, :expires_at) "
+    "ON CONFLICT (nonce) DO UPDATE SET expires_at = excluded.expires_at "
+    "WHERE used_nonces.expires_at <= :now"
+).bindparams(bindparam("expires_at", type_=DateTime()), bindparam("now", type_=DateTime()))
+
+
+def _claim_nonce(connection: Connection, nonce: str, expires_at: datetime, now: datetime) -> bool:
+    """Insert ``nonce`` or take over its expired row; ``False`` means it is still live."""
+
+    if connection.dialect.name in {"sqlite", "postgresql"}:
+        params = {"nonce": nonce, "expires_at": expires_at, "now": now}
+        return connection.execute(_CLAIM_NONCE_UPSERT, params).rowcount == 1
+
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(UsedNonce).values(nonce=nonce, expires_at=expires_at))
+        return True
+    except IntegrityError:
+        stmt = (
+            update(UsedNonce)
+            .where(UsedNonce.nonce == nonce, UsedNonce.expires_at <= now)
+            .values(expires_at=expires_at)
+        )
+        return connection.execute(stmt).rowcount == 1
+
+
+class DatabaseNonceStore:
+    """Nonce store backed by the ``used_nonces`` table, shared by every process using it.
+
+    The primary key makes claiming a nonce a single atomic statement, so replay protection
+    holds across uvicorn workers and replicas. Expired rows are deleted in batches at most
+    once per ``cleanup_interval_seconds`` per process.
+
+    ``len()`` does not scan the table: it is the row count taken after the last cleanup plus
+    the nonces this process has claimed since, so nonces claimed by other workers show up
+    after the next cleanup.
+    """
+
+    def __init__(
+        self,
+        engine_factory: Callable[[], Engine],
+        cleanup_interval_seconds: float = 60.0,
+        cleanup_batch_size: int = 1000,
+    ) -> None:
+        self._engine_factory = engine_factory
+        self._cleanup_interval_seconds = cleanup_interval_seconds
+        self._cleanup_batch_size = cleanup_batch_size
+        self._next_cleanup = time.monotonic() + cleanup_interval_seconds
+        self._cleanup_lock = threading.Lock()
+        self._table_ready = False
+        self._size: Optional[int] = None
+        self.expirations = 0
+        self.cleanups = 0
+
+    def _engine(self) -> Engine:
+        engine = self._engine_factory()
+        if not self._table_ready:
+            UsedNonce.__table__.create(engine, checkfirst=True)
+            self._table_ready = True
+        return engine
+
+    def register(self, nonce: str, expires_at: datetime) -> None:
+        if expires_at.tzinfo is not None:
+            expires_at = expires_at.astimezone(timezone.utc).replace(tzinfo=None)
+        now = datetime.utcnow()
+
+        with self._engine().begin() as connection:
+            claimed = _claim_nonce(connection, nonce, expires_at, now)
+        if not claimed:
+            raise NonceReplayError(f"Nonce {nonce!r} has already been used")
+        if self._size is not None:
+            self._size += 1
+
+        if time.monotonic() >= self._next_cleanup and self._cleanup_lock.acquire(blocking=False):
+            try:
+                self._next_cleanup = time.monotonic() + self._cleanup_interval_seconds
+                self.purge_expired(now)
+            finally:
+                self._cleanup_lock.release()
+
+    def purge_expired(self, now: Optional[datetime] = None) -> int:
+        """Delete expired nonces in ``cleanup_batch_size`` chunks, one transaction each."""
+
+        now = now or datetime.utcnow()
+        expired = (
+            select(UsedNonce.nonce)
+            .where(UsedNonce.expires_at <= now)
+            .limit(self._cleanup_batch_size)
+            .scalar_subquery()
+        )
+        engine = self._engine()
+        deleted_total = 0
+        while True:
+            with engine.begin() as connection:
+                deleted = connection.execute(delete(UsedNonce).where(UsedNonce.nonce.in_(expired))).rowcount
+            deleted_total += deleted
+            if deleted < self._cleanup_batch_size:
+                break
+        self._size = self._count_rows(engine)
+        self.expirations += deleted_total
+        self.cleanups += 1
+        return deleted_total
+
+    @staticmethod
+    def _count_rows(engine: Engine) -> int:
+        with engine.connect() as connection:
+            return connection.execute(select(func.count()).select_from(UsedNonce)).scalar_one()
+
+    def __len__(self) -> int:
+        if self._size is None:
+            self._size = self._count_rows(self._engine())
+        return self._size
+
+    def stats(self) -> Dict[str, int]:
+        return {"size": len(self), "expirations": self.expirations, "cleanups": self.cleanups}
+
+
+NONCE_BACKENDS = ("memory", "database", "sqlite")
+
+
+def _get_database_engine() -> Engine:
+    # Imported lazily so the application engine is only created when this backend is used.
+    from . import database
+
+    return database.engine
+
+
+@lru_cache(maxsize=None)
+def _get_sqlite_nonce_engine(path: str) -> Engine:
+    from .database import create_engine_from_env
+
+    return create_engine_from_env(f"sqlite:///{path}")
+
+
+def _default_sqlite_nonce_path() -> str:
+    # /dev/shm keeps the shared file in memory on Linux hosts.
+    directory = Path("/dev/shm") if Path("/dev/shm").is_dir() else Path(tempfile.gettempdir())
+    return str(directory / "laurel-nonces.db")
+
+
+def _get_nonce_cache() -> Union[NonceCache, DatabaseNonceStore]:
+    backend = os.environ.get("INGESTION_NONCE_BACKEND", "memory").lower()
+    if backend not in NONCE_BACKENDS:
+        raise RuntimeError(f"INGESTION_NONCE_BACKEND must be one of {list(NONCE_BACKENDS)}, got {backend!r}")
+    if backend == "memory":
+        capacity = int(os.environ.get("INGESTION_NONCE_CACHE_CAPACITY", "1000000"))
+        overflow = os.environ.get("INGESTION_NONCE_CACHE_OVERFLOW", "reject").lower()
+        return NonceCache(capacity, overflow)
+
+    cleanup_interval = float(os.environ.get("INGESTION_NONCE_CLEANUP_INTERVAL_SECONDS", "60"))
+    cleanup_batch_size = int(os.environ.get("INGESTION_NONCE_CLEANUP_BATCH_SIZE", "1000"))
+    if backend == "database":
+        return DatabaseNonceStore(_get_database_engine, cleanup_interval, cleanup_batch_size)
+    path = os.environ.get("INGESTION_NONCE_SQLITE_PATH") or _default_sqlite_nonce_path()
+    return DatabaseNonceStore(lambda: _get_sqlite_nonce_engine(path), cleanup_interval, cleanup_batch_size)
+
+
+_nonce_cache = _get_nonce_cache()
+
+
+@dataclass(frozen=True)
+class TokenVerdict:
+    """Outcome of verifying a token's signature and registered claims."""
+
+    payload: Optional[Dict]
+    error: Optional[str]
+    expires_at: float
+
+
+class TokenVerdictCache:
+    """Bounded LRU of token digests to their verification verdict.
+
+    Valid verdicts live until the token's ``exp``; rejections live for a short TTL so that a
+    token signed with a key that is not yet published in the JWKS can succeed after rotation.
+    """
+
+    def __init__(self, max_entries: int, rejection_ttl_seconds: float) -> None:
+        self._max_entries = max_entries
+        self._rejection_ttl_seconds = rejection_ttl_seconds
+        self._entries: OrderedDict[bytes, TokenVerdict] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest: bytes) -> Optional[TokenVerdict]:
+        with self._lock:
+            verdict = self._entries.get(digest)
+            if verdict is not None and verdict.expires_at <= time.time():
+                del self._entries[digest]
+                verdict = None
+            if verdict is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+            return verdict
+
+    def accept(self, digest: bytes, payload: Dict) -> None:
+        self._store(digest, TokenVerdict(payload=dict(payload), error=None, expires_at=float(payload["exp"])))
+
+    def reject(self, digest: bytes, error: str) -> None:
+        expires_at = time.time() + self._rejection_ttl_seconds
+        self._store(digest, TokenVerdict(payload=None, error=error, expires_at=expires_at))
+
+    def _store(self, digest: bytes, verdict: TokenVerdict) -> None:
+        if self._max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[digest] = verdict
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
 
 
-_nonce_cache = NonceCache()
+def _get_verdict_cache() -> TokenVerdictCache:
+    max_entries = int(os.environ.get("INGESTION_JWT_VERDICT_CACHE_SIZE", "10000"))
+    rejection_ttl = float(os.environ.get("INGESTION_JWT_REJECTION_TTL_SECONDS", "60"))
+    return TokenVerdictCache(max_entries, rejection_ttl)
+
+
+_verdict_cache = _get_verdict_cache()
 
 
 def _get_env_setting(name: str) -> str:
@@ -69,24 +363,130 @@ def _get_expected_audience() -> str:
     return _get_env_setting("INGESTION_JWT_AUDIENCE")
 
 
+class UnknownSigningKeyError(jwt.PyJWTError):
+    """Raised when a token's ``kid`` is not in the current JWKS snapshot."""
+
+
+class JWKSKeyStore:
+    """Immutable ``kid -> key`` snapshot of the JWKS endpoint, replaced wholesale on refresh.
+
+    Lookups never touch the network. Refreshes run at startup and on a timer; an unknown
+    ``kid`` only schedules a background refresh, at most one at a time and no more often than
+    ``min_refresh_interval_seconds``, so a stream of forged kids cannot hammer the endpoint.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        timeout_seconds: float = 10.0,
+        min_refresh_interval_seconds: float = 30.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.url = url
+        self._timeout_seconds = timeout_seconds
+        self._min_refresh_interval_seconds = min_refresh_interval_seconds
+        self._keys: Mapping[str, jwt.PyJWK] = MappingProxyType({})
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._last_attempt: Optional[float] = None
+        self._clock = clock
+        self.refreshes = 0
+        self.failures = 0
+
+    @property
+    def loaded(self) -> bool:
+        return bool(self._keys)
+
+    def _fetch(self) -> Mapping[str, jwt.PyJWK]:
+        request = urllib.request.Request(self.url, headers={"User-Agent": "laurel-ingestion-api"})
+        with urllib.request.urlopen(request, timeout=self._timeout_seconds) as response:
+            jwk_set = jwt.PyJWKSet.from_dict(json.load(response))
+        return MappingProxyType({key.key_id: key for key in jwk_set.keys if key.key_id is not None})
+
+    def refresh(self) -> bool:
+        """Fetch the JWKS and swap in the new snapshot; keeps the old one if the fetch fails."""
+
+        # Startup and timer refreshes count too, so an unknown kid right after them waits out
+        # the minimum interval instead of fetching the same document again.
+        with self._lock:
+            self._last_attempt = self._clock()
+        try:
+            keys = self._fetch()
+        except Exception:  # noqa: BLE001 - any fetch/parse failure keeps serving the old keys
+            self.failures += 1
+            logger.warning("Refreshing JWKS from %s failed", self.url, exc_info=True)
+            return False
+        self._keys = keys
+        self.refreshes += 1
+        return True
+
+    def _refresh_in_background(self) -> None:
+        try:
+            self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def request_refresh(self) -> bool:
+        """Start a single-flight background refresh unless one ran too recently."""
+
+        now = self._clock()
+        with self._lock:
+            recently = (
+                self._last_attempt is not None
+                and now - self._last_attempt < self._min_refresh_interval_seconds
+            )
+            if self._refreshing or recently:
+                return False
+            self._refreshing = True
+            self._last_attempt = now
+        threading.Thread(target=self._refresh_in_background, name="jwks-refresh", daemon=True).start()
+        return True
+
+    def get(self, kid: Optional[str]) -> jwt.PyJWK:
+        key = self._keys.get(kid) if kid is not None else None
+        if key is None:
+            self.request_refresh()
+            raise UnknownSigningKeyError(f"No signing key matches kid {kid!r}")
+        return key
+
+
 @lru_cache(maxsize=1)
-def _get_jwks_client(url: str) -> jwt.PyJWKClient:
-    return jwt.PyJWKClient(url)
+def _get_jwks_store(url: str) -> JWKSKeyStore:
+    timeout = float(os.environ.get("INGESTION_JWKS_TIMEOUT_SECONDS", "10"))
+    min_refresh_interval = float(os.environ.get("INGESTION_JWKS_MIN_REFRESH_SECONDS", "30"))
+    return JWKSKeyStore(url, timeout, min_refresh_interval)
 
 
-def _get_signing_key(token: str) -> jwt.PyJWK:
-    jwks_client = _get_jwks_client(_get_jwks_url())
-    return jwks_client.get_signing_key_from_jwt(token)
+def prefetch_signing_keys() -> bool:
+    """Load the JWKS once, typically at startup, so the first request finds warm keys."""
 
+    return _get_jwks_store(_get_jwks_url()).refresh()
 
-def verify_jwt(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)) -> Dict:
-    if credentials is None or credentials.scheme.lower() != "bearer":
-        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing token")
 
-    token = credentials.credentials
+async def jwks_refresh_worker() -> None:
+    """Refresh the JWKS every ``INGESTION_JWKS_REFRESH_SECONDS`` with +/- jitter."""
+
+    interval = float(os.environ.get("INGESTION_JWKS_REFRESH_SECONDS", "300"))
+    jitter = float(os.environ.get("INGESTION_JWKS_REFRESH_JITTER", "0.1"))
+    try:
+        while True:
+            # Jitter spreads refreshes from many workers so they do not hit the JWKS host together.
+            await asyncio.sleep(interval * random.uniform(1 - jitter, 1 + jitter))
+            await asyncio.to_thread(prefetch_signing_keys)
+    except asyncio.CancelledError:  # pragma: no cover - cooperative cancellation
+        pass
+
+
+def _get_signing_key(token: str) -> jwt.PyJWK:
+    store = _get_jwks_store(_get_jwks_url())
+    return store.get(jwt.get_unverified_header(token).get("kid"))
+
+
+def _decode_token(token: str) -> Dict:
     try:
         signing_key = _get_signing_key(token)
-        payload = jwt.decode(
+        return jwt.decode(
             token,
             signing_key.key,
             algorithms=[ALGORITHM],
@@ -102,9 +502,39 @@ def verify_jwt(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme))
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid issuer") from exc
     except jwt.MissingRequiredClaimError as exc:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing claim") from exc
+    except UnknownSigningKeyError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail=UNKNOWN_SIGNING_KEY_DETAIL,
+        ) from exc
     except jwt.PyJWTError as exc:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Invalid token") from exc
 
+
+def verify_jwt(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme)) -> Dict:
+    if credentials is None or credentials.scheme.lower() != "bearer":
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Missing token")
+
+    token = credentials.credentials
+    # Replays and repeated bad tokens are answered from the verdict cache instead of paying
+    # for another JWKS lookup and RSA verification; the nonce check below still runs.
+    digest = hashlib.sha256(token.encode()).digest()
+    verdict = _verdict_cache.get(digest)
+    if verdict is None:
+        try:
+            with stage_timer("jwt_decode"):
+                payload = _decode_token(token)
+        except HTTPException as exc:
+            # An unknown kid may become valid as soon as the background JWKS refresh lands.
+            if exc.detail != UNKNOWN_SIGNING_KEY_DETAIL:
+                _verdict_cache.reject(digest, exc.detail)
+            raise
+        _verdict_cache.accept(digest, payload)
+    elif verdict.error is not None:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=verdict.error)
+    else:
+        payload = dict(verdict.payload)
+
     nonce = payload.get("nonce")
     exp = payload.get("exp")
     if nonce is None or exp is None:
@@ -119,16 +549,33 @@ def verify_jwt(credentials: HTTPAuthorizationCredentials = Depends(auth_scheme))
 
     expires_at = datetime.fromtimestamp(exp, tz=timezone.utc)
     try:
-        _nonce_cache.register(nonce, expires_at)
+        with stage_timer("nonce_register"):
+            _nonce_cache.register(nonce, expires_at)
     except NonceReplayError as exc:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Nonce already used") from exc
+    except NonceCacheFullError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Replay protection is at capacity",
+        ) from exc
 
     return payload
 
 
+def nonce_cache_size() -> int:
+    return len(_nonce_cache)
+
+
+def nonce_cache_stats() -> Dict[str, int]:
+    """Counters of the active nonce backend; which keys exist depends on the backend."""
+
+    return _nonce_cache.stats()
+
+
 def reset_auth_state() -> None:
     """Reset cached authentication state. Intended for use in tests."""
 
-    global _nonce_cache
-    _get_jwks_client.cache_clear()
-    _nonce_cache = NonceCache()
+    global _nonce_cache, _verdict_cache
+    _get_jwks_store.cache_clear()
+    _nonce_cache = _get_nonce_cache()
+    _verdict_cache = _get_verdict_cache()
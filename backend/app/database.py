@@ -3,21 +3,148 @@ from __future__ import annotations
 
 import os
 from contextlib import contextmanager
+from typing import Any, Dict
 
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
 from sqlalchemy.orm import sessionmaker
 
 DATABASE_URL = os.environ.get("INGESTION_DATABASE_URL", "sqlite:///./ingestion.db")
 
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if DATABASE_URL.startswith("sqlite") else {},
-    future=True,
-)
+_ASYNC_DRIVERS = {"sqlite": "sqlite+aiosqlite", "postgresql": "postgresql+asyncpg"}
+_SQLITE_JOURNAL_MODES = {"DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"}
+_SQLITE_SYNCHRONOUS_LEVELS = {"OFF", "NORMAL", "FULL", "EXTRA"}
+
+
+def _env_flag(name: str, default: bool) -> bool:
+    return os.environ.get(name, str(default)).lower() in {"1", "true", "yes"}
+
+
+def _env_int(name: str, default: int) -> int:
+    return int(os.environ.get(name, str(default)))
+
+
+def _env_choice(name: str, default: str, choices: set) -> str:
+    value = os.environ.get(name, default).upper()
+    if value not in choices:
+        raise RuntimeError(f"{name} must be one of {sorted(choices)}, got {value!r}")
+    return value
+
+
+ASYNC_DATABASE_ENABLED = _env_flag("INGESTION_DATABASE_ASYNC", False)
+
+
+def _is_sqlite_memory(url: str) -> bool:
+    database = make_url(url).database
+    return not database or database == ":memory:" or "mode=memory" in url
+
+
+def pool_settings(url: str) -> Dict[str, Any]:
+    """Pool options for ``create_engine``, driven by ``INGESTION_DB_POOL_*`` variables."""
+
+    if make_url(url).get_backend_name() == "sqlite" and _is_sqlite_memory(url):
+        # In-memory SQLite uses a singleton/static pool that takes no sizing options.
+        return {}
+    settings: Dict[str, Any] = {
+        "pool_size": _env_int("INGESTION_DB_POOL_SIZE", 10),
+        "max_overflow": _env_int("INGESTION_DB_MAX_OVERFLOW", 20),
+        "pool_timeout": _env_int("INGESTION_DB_POOL_TIMEOUT_SECONDS", 30),
+    }
+    if make_url(url).get_backend_name() != "sqlite":
+        settings["pool_pre_ping"] = _env_flag("INGESTION_DB_POOL_PRE_PING", True)
+        settings["pool_recycle"] = _env_int("INGESTION_DB_POOL_RECYCLE_SECONDS", 1800)
+    return settings
+
+
+def sqlite_pragmas() -> Dict[str, Any]:
+    """PRAGMAs applied to every new SQLite connection, driven by ``INGESTION_SQLITE_*``."""
+
+    return {
+        "journal_mode": _env_choice("INGESTION_SQLITE_JOURNAL_MODE", "WAL", _SQLITE_JOURNAL_MODES),
+        "synchronous": _env_choice("INGESTION_SQLITE_SYNCHRONOUS", "NORMAL", _SQLITE_SYNCHRONOUS_LEVELS),
+        "busy_timeout": _env_int("INGESTION_SQLITE_BUSY_TIMEOUT_MS", 5000),
+        "mmap_size": _env_int("INGESTION_SQLITE_MMAP_SIZE", 256 * 1024 * 1024),
+        # Negative values are KiB, so this is a 64 MiB page cache per connection.
+        "cache_size": _env_int("INGESTION_SQLITE_CACHE_SIZE", -64 * 1024),
+    }
+
+
+def _install_sqlite_pragmas(target: Engine, pragmas: Dict[str, Any]) -> None:
+    @event.listens_for(target, "connect")
+    def _apply_pragmas(dbapi_connection, _connection_record) -> None:
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f"PRAGMA {name}={value}")
+        finally:
+            cursor.close()
+
+
+def create_engine_from_env(url: str) -> Engine:
+    """Create the sync engine with pool sizing and, for SQLite, performance PRAGMAs."""
+
+    is_sqlite = make_url(url).get_backend_name() == "sqlite"
+    new_engine = create_engine(
+        url,
+        connect_args={"check_same_thread": False} if is_sqlite else {},
+        future=True,
+        **pool_settings(url),
+    )
+    if is_sqlite:
+        _install_sqlite_pragmas(new_engine, sqlite_pragmas())
+    return new_engine
+
+
+def describe_engine(target: Engine) -> Dict[str, Any]:
+    """Report the effective pool settings and, for SQLite, the PRAGMAs a connection sees."""
+
+    pool = target.pool
+    description: Dict[str, Any] = {
+        "url": target.url.render_as_string(hide_password=True),
+        "pool": type(pool).__name__,
+    }
+    pool_attributes = (("size", "pool_size"), ("_max_overflow", "max_overflow"), ("_timeout", "pool_timeout"))
+    for attribute, key in pool_attributes:
+        value = getattr(pool, attribute, None)
+        if value is not None:
+            description[key] = value() if callable(value) else value
+    description["pool_pre_ping"] = pool._pre_ping
+    description["pool_recycle"] = pool._recycle
+    if target.dialect.name == "sqlite":
+        with target.connect() as connection:
+            for name in sqlite_pragmas():
+                description[name] = connection.exec_driver_sql(f"PRAGMA {name}").scalar()
+    return description
+
+
+engine = create_engine_from_env(DATABASE_URL)
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
 
+def async_database_url(url: str) -> str:
+    """Translate a sync SQLAlchemy URL to the matching asyncio driver (aiosqlite/asyncpg)."""
+
+    parsed = make_url(url)
+    driver = _ASYNC_DRIVERS.get(parsed.get_backend_name())
+    if driver is None:
+        raise RuntimeError(f"No async driver is configured for {parsed.get_backend_name()!r} databases.")
+    return parsed.set(drivername=driver).render_as_string(hide_password=False)
+
+
+async_engine = None
+AsyncSessionLocal = None
+if ASYNC_DATABASE_ENABLED:
+    # Imported lazily so aiosqlite/asyncpg stay optional for the default sync mode.
+    from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+
+    _async_url = os.environ.get("INGESTION_ASYNC_DATABASE_URL") or async_database_url(DATABASE_URL)
+    async_engine = create_async_engine(_async_url, **pool_settings(_async_url))
+    if async_engine.dialect.name == "sqlite":
+        _install_sqlite_pragmas(async_engine.sync_engine, sqlite_pragmas())
+    AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
 @contextmanager
 def session_scope():
     """Provide a transactional scope for database operations."""
@@ -0,0 +1,45 @@
+"""JSON encoding for request bodies, stored payloads and responses.
+
+Uses ``orjson`` when it is installed and the standard library otherwise. Both produce compact
+UTF-8 text (no spaces, non-ASCII kept as-is), so stored payloads look the same either way.
+"""
+from __future__ import annotations
+
+import json
+from typing import Any, Union
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - exercised only where orjson is not installed
+    orjson = None
+
+BACKEND = "orjson" if orjson is not None else "json"
+
+
+# Built once: json.dumps with non-default arguments constructs a new encoder on every call.
+_stdlib_dumps = json.JSONEncoder(separators=(",", ":"), ensure_ascii=False).encode
+
+
+if orjson is not None:
+    from fastapi.responses import ORJSONResponse as JSONResponse
+
+    def dumps(value: Any) -> str:
+        try:
+            return orjson.dumps(value, option=orjson.OPT_NON_STR_KEYS).decode()
+        except TypeError:
+            # orjson refuses integers beyond 64 bits, which the stdlib parser accepts.
+            return _stdlib_dumps(value)
+
+    def loads(data: Union[bytes, str]) -> Any:
+        # Raises orjson.JSONDecodeError, a ValueError like the stdlib's.
+        return orjson.loads(data)
+
+else:
+    from fastapi.responses import JSONResponse  # noqa: F401 - re-exported
+
+    dumps = _stdlib_dumps
+    loads = json.loads
+
+
+def dumps_optional(value: Any) -> Union[str, None]:
+    return None if value is None else dumps(value)
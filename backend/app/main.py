@@ -2,23 +2,86 @@
 from __future__ import annotations
 
 import asyncio
+import base64
+import csv
+import hashlib
+import io
 import json
 import logging
+import math
 import os
 import time
 import threading
+import zlib
+from collections import Counter, OrderedDict, deque
 from contextlib import suppress
-from datetime import datetime, timedelta
-from typing import List, Optional
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta, timezone
+from typing import (
+    Annotated,
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    FrozenSet,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Mapping,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
-from fastapi import Depends, FastAPI, HTTPException, Query, Request, status
-from sqlalchemy import Select, select
+from fastapi import Depends, FastAPI, Header, HTTPException, Query, Request, Response, status
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from sqlalchemy import (
+    Date,
+    Select,
+    case,
+    cast,
+    delete,
+    func,
+    insert,
+    literal_column,
+    or_,
+    select,
+    text,
+    tuple_,
+    type_coerce,
+    update,
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.event import listens_for
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from . import schemas
-from .auth import verify_jwt
-from .database import SessionLocal, engine
-from .models import Base, Event, EventStat
+from . import jsoncodec, schemas
+from .archive import EventArchive
+from .auth import (
+    jwks_refresh_worker,
+    nonce_cache_size,
+    nonce_cache_stats,
+    prefetch_signing_keys,
+    verify_jwt,
+)
+from .database import ASYNC_DATABASE_ENABLED, AsyncSessionLocal, SessionLocal, describe_engine, engine
+from .metrics import (
+    CONTENT_TYPE as METRICS_CONTENT_TYPE,
+    REGISTRY,
+    RETENTION_ROWS,
+    RETENTION_SECONDS,
+    Gauge,
+    MetricsMiddleware,
+    stage_timer,
+)
+from .models import Base, Event, EventStat, RateLimitCounter, RetentionState
+from .sketches import RELATIVE_ERROR, HyperLogLog, RegisterUpdates, merge_updates, register_updates
 
 logger = logging.getLogger(__name__)
 
@@ -28,8 +91,13 @@ app = FastAPI(
     title="LaurelID Ingestion API",
     description="API for collecting kiosk events and retrieving aggregate statistics.",
     version="0.1.0",
+    default_response_class=jsoncodec.JSONResponse,
 )
 
+_metrics_enabled = os.environ.get("INGESTION_METRICS_ENABLED", "true").lower() in {"1", "true", "yes"}
+if _metrics_enabled:
+    app.add_middleware(MetricsMiddleware)
+
 
 def get_db() -> Session:
     db = SessionLocal()
@@ -39,86 +107,1193 @@ def get_db() -> Session:
         db.close()
 
 
+async def get_async_db() -> AsyncIterator[AsyncSession]:
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+ANONYMIZED_EVENT_VALUES = {"user_id": None, "payload": "{}", "metadata_json": None, "anonymized": True}
+
+
 def anonymize_event(event: Event) -> None:
-    event.user_id = None
-    event.payload = "{}"
-    event.metadata_json = None
-    event.anonymized = True
+    for attribute, value in ANONYMIZED_EVENT_VALUES.items():
+        setattr(event, attribute, value)
+
+
+@dataclass
+class RetentionResult:
+    """Outcome of a retention run."""
+
+    rows: int = 0
+    chunks: int = 0
+    elapsed_seconds: float = 0.0
+    paused_seconds: float = 0.0
+    watermark: Optional[datetime] = None
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.elapsed_seconds if self.elapsed_seconds > 0 else 0.0
+
+
+RETENTION_WATERMARK_NAME = "anonymize_events"
+
+
+def _dialect_insert(dialect_name: str):
+    """The dialect's ``insert`` construct with ``ON CONFLICT`` support, or ``None``."""
+
+    if dialect_name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect_name == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    return dialect_insert
+
+
+def _store_retention_watermark(db: Session, watermark: datetime) -> None:
+    """Advance the watermark, never moving it back.
+
+    On SQLite and PostgreSQL this is one ``INSERT ... ON CONFLICT DO UPDATE`` keeping the later
+    value, so workers that all start retention on a fresh database don't race to insert the
+    first row.
+    """
+
+    dialect_insert = _dialect_insert(db.get_bind().dialect.name)
+    if dialect_insert is None:
+        state = db.get(RetentionState, RETENTION_WATERMARK_NAME)
+        if state is None:
+            db.add(RetentionState(name=RETENTION_WATERMARK_NAME, watermark=watermark))
+        elif watermark > state.watermark:
+            state.watermark = watermark
+        return
+
+    now = datetime.utcnow()
+    stmt = dialect_insert(RetentionState).values(
+        name=RETENTION_WATERMARK_NAME, watermark=watermark, updated_at=now
+    )
+    # ON CONFLICT DO UPDATE does not apply Column.onupdate, so updated_at is set explicitly.
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[RetentionState.name],
+        set_={
+            "watermark": case(
+                (stmt.excluded.watermark > RetentionState.watermark, stmt.excluded.watermark),
+                else_=RetentionState.watermark,
+            ),
+            "updated_at": now,
+        },
+    )
+    db.execute(stmt)
+
+
+def enforce_retention_policy(
+    db: Session,
+    chunk_size: Optional[int] = None,
+    full_sweep: bool = False,
+    throttle: Optional[Callable[[], float]] = None,
+) -> RetentionResult:
+    """Anonymize events older than 30 days in bounded chunks, committing after each chunk.
+
+    Chunks are selected by keyset on ``(created_at, id)`` and anonymized with a single
+    ``UPDATE ... WHERE id IN (...)``. Only the keys of one chunk are held in memory, so the
+    memory ceiling and lock duration depend on ``chunk_size`` rather than on the backlog.
+
+    Progress is persisted as a ``created_at`` watermark in ``retention_state`` together with
+    each chunk, so a run only scans events created since the previous one. Pass
+    ``full_sweep=True`` to ignore the watermark and re-check the whole table, e.g. for audits.
 
+    ``throttle`` is called between chunks and may block to yield to foreground traffic; it
+    returns the seconds it paused.
+    """
 
-def enforce_retention_policy(db: Session) -> None:
+    chunk_size = chunk_size or _retention_chunk_size
     cutoff = datetime.utcnow() - timedelta(days=30)
-    stale_events: List[Event] = (
+    result = RetentionResult()
+    started = time.perf_counter()
+
+    state = None if full_sweep else db.get(RetentionState, RETENTION_WATERMARK_NAME)
+    lower_bound = state.watermark if state is not None else None
+    last_key: Optional[Tuple[datetime, int]] = None
+
+    while True:
+        stmt = select(Event.created_at, Event.id).where(
+            Event.created_at < cutoff, Event.anonymized.is_(False)
+        )
+        if lower_bound is not None:
+            stmt = stmt.where(Event.created_at >= lower_bound)
+        if last_key is not None:
+            stmt = stmt.where(tuple_(Event.created_at, Event.id) > tuple_(*last_key))
+        keys = db.execute(stmt.order_by(Event.created_at, Event.id).limit(chunk_size)).all()
+        if not keys:
+            break
+
         db.execute(
-            select(Event).where(Event.created_at < cutoff, Event.anonymized.is_(False))
+            update(Event)
+            .where(Event.id.in_([key.id for key in keys]))
+            .values(ANONYMIZED_EVENT_VALUES)
+            .execution_options(synchronize_session=False)
         )
-        .scalars()
-        .all()
+        # Everything created before this chunk's last timestamp is now anonymized.
+        _store_retention_watermark(db, keys[-1].created_at)
+        db.commit()
+
+        result.rows += len(keys)
+        result.chunks += 1
+        last_key = (keys[-1].created_at, keys[-1].id)
+        if len(keys) < chunk_size:
+            break
+        if throttle is not None:
+            result.paused_seconds += throttle()
+
+    _store_retention_watermark(db, cutoff)
+    db.commit()
+    result.watermark = cutoff
+    result.elapsed_seconds = time.perf_counter() - started
+    return result
+
+
+def _delete_archived_events(db: Session, ids: Sequence[int], created_until: datetime) -> int:
+    # The extra predicates keep a reused id of a newer, live row from ever matching.
+    result = db.execute(
+        delete(Event)
+        .where(Event.id.in_(ids), Event.anonymized.is_(True), Event.created_at <= created_until)
+        .execution_options(synchronize_session=False)
     )
-    if not stale_events:
+    return result.rowcount
+
+
+def archive_anonymized_events(
+    db: Session,
+    archive: EventArchive,
+    older_than_days: Optional[int] = None,
+    chunk_size: Optional[int] = None,
+    throttle: Optional[Callable[[], float]] = None,
+) -> RetentionResult:
+    """Move anonymized events older than ``older_than_days`` from ``events`` into ``archive``.
+
+    Each chunk of up to ``chunk_size`` rows (oldest first) is appended to the monthly archive
+    files and flushed to disk before the same rows are deleted and the chunk is committed. If
+    the process dies between the two steps the rows exist in both places, so every run first
+    deletes any live rows still listed in each month's last segment, which makes the move
+    idempotent without tracking extra state. ``throttle`` behaves as in
+    :func:`enforce_retention_policy`.
+
+    The whole move holds :meth:`EventArchive.exclusive`, so workers sharing the archive
+    directory run one at a time; a worker that waited finds the rows already moved.
+    """
+
+    chunk_size = chunk_size or _retention_chunk_size
+    cutoff = datetime.utcnow() - timedelta(days=older_than_days or _archive_after_days)
+    result = RetentionResult()
+    started = time.perf_counter()
+
+    with archive.exclusive():
+        archive.repair()
+        for segment in archive.last_segments():
+            ids = [event.id for event in archive.read_segment(segment)]
+            _delete_archived_events(db, ids, segment.max_created_at)
+        db.commit()
+
+        while True:
+            rows = db.execute(
+                select(Event.id, Event.event_type, Event.created_at)
+                .where(Event.anonymized.is_(True), Event.created_at < cutoff)
+                .order_by(Event.created_at, Event.id)
+                .limit(chunk_size)
+            ).all()
+            if not rows:
+                break
+
+            archive.append(rows)
+            _delete_archived_events(db, [row.id for row in rows], rows[-1].created_at)
+            db.commit()
+
+            result.rows += len(rows)
+            result.chunks += 1
+            if len(rows) < chunk_size:
+                break
+            if throttle is not None:
+                result.paused_seconds += throttle()
+
+    result.watermark = cutoff
+    result.elapsed_seconds = time.perf_counter() - started
+    return result
+
+
+def _stat_upsert(dialect_name: str, increments: Mapping[Tuple[str, date], int]):
+    """Build the ``ON CONFLICT`` upsert and its parameter sets, or ``None`` if unsupported."""
+
+    dialect_insert = _dialect_insert(dialect_name)
+    if dialect_insert is None:
+        return None
+
+    # Sorted keys give concurrent transactions a consistent lock order.
+    rows = [
+        {"event_type": event_type, "event_date": event_date, "count": amount}
+        for (event_type, event_date), amount in sorted(increments.items())
+    ]
+    stmt = dialect_insert(EventStat)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[EventStat.event_type, EventStat.event_date],
+        set_={"count": EventStat.count + stmt.excluded["count"]},
+    )
+    return stmt, rows
+
+
+_TOUCHED_STAT_DATES_KEY = "touched_stat_dates"
+
+
+def increment_stats(db: Session, increments: Mapping[Tuple[str, date], int]) -> None:
+    """Add pre-aggregated ``(event_type, event_date) -> count`` deltas to the daily stats.
+
+    On SQLite and PostgreSQL each key is applied with a single atomic
+    ``INSERT ... ON CONFLICT DO UPDATE SET count = count + :n`` so concurrent writers
+    never lose increments. Other dialects fall back to a read-modify-write.
+    """
+
+    if not increments:
+        return
+    db.info.setdefault(_TOUCHED_STAT_DATES_KEY, set()).update(event_date for _, event_date in increments)
+
+    upsert = _stat_upsert(db.get_bind().dialect.name, increments)
+    if upsert is not None:
+        db.execute(*upsert)
         return
-    for event in stale_events:
-        anonymize_event(event)
+
+    for (event_type, event_date), amount in increments.items():
+        select_stmt: Select[EventStat] = select(EventStat).where(
+            EventStat.event_type == event_type,
+            EventStat.event_date == event_date,
+        )
+        stat = db.execute(select_stmt).scalar_one_or_none()
+        if stat is None:
+            stat = EventStat(event_type=event_type, event_date=event_date, count=amount)
+            db.add(stat)
+        else:
+            stat.count += amount
     db.flush()
 
 
+async def increment_stats_async(db: AsyncSession, increments: Mapping[Tuple[str, date], int]) -> None:
+    """Async counterpart of :func:`increment_stats` for the aiosqlite and asyncpg drivers."""
+
+    if not increments:
+        return
+    upsert = _stat_upsert(db.bind.dialect.name, increments)
+    if upsert is None:
+        raise RuntimeError(f"Stat upserts are not supported on {db.bind.dialect.name!r}")
+    await db.execute(*upsert)
+
+
+_STAGED_STATS_KEY = "staged_stat_increments"
+
+
+def record_stat_increments(db: Session, increments: Mapping[Tuple[str, date], int]) -> None:
+    """Apply stat increments now, or defer them to the write-behind buffer.
+
+    Deferred increments are staged on the session and only handed to the buffer once the
+    surrounding transaction commits, so events that are rolled back are never counted.
+    """
+
+    if not _stats_write_behind:
+        increment_stats(db, increments)
+        return
+    db.info.setdefault(_STAGED_STATS_KEY, Counter()).update(increments)
+
+
+_STAGED_REGISTERS_KEY = "staged_user_registers"
+_MERGED_SKETCHES_KEY = "merged_user_sketches"
+
+
+class UserSketchCache:
+    """Bounded LRU of the stored ``user_sketch`` of recently touched ``event_stats`` rows.
+
+    Entries are only replaced by sketches read back from the database after their transaction
+    commits, so a cached sketch is never ahead of the stored one. When it already covers an
+    event's register, writing that register would change nothing and is skipped; once a day has
+    seen most of its returning users, nearly every event is.
+    """
+
+    def __init__(self, max_keys: int) -> None:
+        self._max_keys = max_keys
+        self._sketches: OrderedDict[Tuple[str, date], HyperLogLog] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def covers(self, key: Tuple[str, date], updates: RegisterUpdates) -> bool:
+        with self._lock:
+            sketch = self._sketches.get(key)
+            if sketch is None or not sketch.covers(updates):
+                return False
+            self._sketches.move_to_end(key)
+            return True
+
+    def store(self, sketches: Mapping[Tuple[str, date], HyperLogLog]) -> None:
+        if self._max_keys <= 0:
+            return
+        with self._lock:
+            for key, sketch in sketches.items():
+                self._sketches[key] = sketch
+                self._sketches.move_to_end(key)
+            while len(self._sketches) > self._max_keys:
+                self._sketches.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._sketches)
+
+
+def _get_user_sketch_cache() -> UserSketchCache:
+    return UserSketchCache(int(os.environ.get("INGESTION_UNIQUE_SKETCH_CACHE_KEYS", "1024")))
+
+
+def _pending_register_updates(
+    users_by_key: Mapping[Tuple[str, date], Iterable[Optional[str]]],
+) -> Dict[Tuple[str, date], RegisterUpdates]:
+    """Register updates per key, minus those the cached sketches show are already stored."""
+
+    pending: Dict[Tuple[str, date], RegisterUpdates] = {}
+    for key, user_ids in users_by_key.items():
+        updates = register_updates(user_ids)
+        if updates and not _user_sketches.covers(key, updates):
+            pending[key] = updates
+    return pending
+
+
+def _user_sketch_rows(keys: Iterable[Tuple[str, date]]) -> Select:
+    # Rows are locked in key order, matching the stat upserts, so writers cannot deadlock.
+    return (
+        select(EventStat.id, EventStat.event_type, EventStat.event_date, EventStat.user_sketch)
+        .where(tuple_(EventStat.event_type, EventStat.event_date).in_(sorted(keys)))
+        .order_by(EventStat.event_type, EventStat.event_date)
+        .with_for_update()
+    )
+
+
+def _merge_sketch_rows(
+    rows: Iterable,
+    updates: Mapping[Tuple[str, date], RegisterUpdates],
+) -> Tuple[List[Dict[str, Any]], Dict[Tuple[str, date], HyperLogLog]]:
+    changed: List[Dict[str, Any]] = []
+    merged: Dict[Tuple[str, date], HyperLogLog] = {}
+    for row in rows:
+        key = (row.event_type, row.event_date)
+        sketch = HyperLogLog.from_bytes(row.user_sketch)
+        if sketch.apply(updates[key]):
+            changed.append({"id": row.id, "user_sketch": sketch.to_bytes()})
+        merged[key] = sketch
+    return changed, merged
+
+
+def merge_user_sketches(db: Session, updates: Mapping[Tuple[str, date], RegisterUpdates]) -> None:
+    """Fold register updates into the ``user_sketch`` of existing ``event_stats`` rows.
+
+    Call it after the stats upsert for the same keys, in the same transaction: the rows then
+    exist and are already locked on PostgreSQL (SQLite serialises writers), so this
+    read-modify-write cannot lose a concurrent merge. The merged sketches are cached on commit.
+    """
+
+    if not updates:
+        return
+    changed, merged = _merge_sketch_rows(db.execute(_user_sketch_rows(updates)), updates)
+    if changed:
+        db.execute(update(EventStat), changed)
+    db.info.setdefault(_MERGED_SKETCHES_KEY, {}).update(merged)
+
+
+async def merge_user_sketches_async(
+    db: AsyncSession,
+    updates: Mapping[Tuple[str, date], RegisterUpdates],
+) -> Dict[Tuple[str, date], HyperLogLog]:
+    """Async counterpart of :func:`merge_user_sketches`; the caller caches the result after commit."""
+
+    if not updates:
+        return {}
+    changed, merged = _merge_sketch_rows((await db.execute(_user_sketch_rows(updates))).all(), updates)
+    if changed:
+        await db.execute(update(EventStat), changed)
+    return merged
+
+
+def record_unique_users(
+    db: Session,
+    users_by_key: Mapping[Tuple[str, date], Iterable[Optional[str]]],
+) -> None:
+    """Add the users of newly stored events to the daily sketches, or stage them for write-behind.
+
+    Follows :func:`record_stat_increments` for the same keys. Only register indexes and ranks
+    derived from hashed ids are kept; raw ``user_id`` values never reach the sketches.
+    """
+
+    pending = _pending_register_updates(users_by_key)
+    if not pending:
+        return
+    if not _stats_write_behind:
+        merge_user_sketches(db, pending)
+        return
+    staged = db.info.setdefault(_STAGED_REGISTERS_KEY, {})
+    for key, updates in pending.items():
+        merge_updates(staged.setdefault(key, {}), updates)
+
+
 def update_stats(db: Session, event: Event) -> None:
-    event_date = event.created_at.date()
-    stmt: Select[EventStat] = select(EventStat).where(
-        EventStat.event_type == event.event_type,
-        EventStat.event_date == event_date,
-    )
-    stat = db.execute(stmt).scalar_one_or_none()
-    if stat is None:
-        stat = EventStat(event_type=event.event_type, event_date=event_date, count=1)
-        db.add(stat)
+    key = (event.event_type, event.created_at.date())
+    record_stat_increments(db, {key: 1})
+    record_unique_users(db, {key: (event.user_id,)})
+
+
+class StatsBuffer:
+    """Process-local write-behind buffer of pending ``(event_type, date)`` count deltas.
+
+    Sketch register updates for the same events travel with the counts, so a flush always
+    creates the ``event_stats`` rows before merging into their sketches.
+    """
+
+    def __init__(self, flush_threshold: int) -> None:
+        self._flush_threshold = flush_threshold
+        self._pending: Counter[Tuple[str, date]] = Counter()
+        self._registers: Dict[Tuple[str, date], RegisterUpdates] = {}
+        self._pending_events = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending_events(self) -> int:
+        return self._pending_events
+
+    def add(
+        self,
+        increments: Mapping[Tuple[str, date], int],
+        registers: Optional[Mapping[Tuple[str, date], RegisterUpdates]] = None,
+    ) -> bool:
+        """Buffer increments and report whether the flush threshold has been reached."""
+
+        with self._lock:
+            self._pending.update(increments)
+            for key, updates in (registers or {}).items():
+                merge_updates(self._registers.setdefault(key, {}), updates)
+            self._pending_events += sum(increments.values())
+            return self._pending_events >= self._flush_threshold
+
+    def drain(self) -> Tuple[Counter[Tuple[str, date]], Dict[Tuple[str, date], RegisterUpdates]]:
+        with self._lock:
+            pending, self._pending = self._pending, Counter()
+            registers, self._registers = self._registers, {}
+            self._pending_events = 0
+        return pending, registers
+
+
+@listens_for(SessionLocal, "after_commit")
+def _buffer_committed_stats(session: Session) -> None:
+    touched = session.info.pop(_TOUCHED_STAT_DATES_KEY, None)
+    if touched:
+        _stats_cache.invalidate_dates(touched)
+    merged = session.info.pop(_MERGED_SKETCHES_KEY, None)
+    if merged:
+        _user_sketches.store(merged)
+    staged = session.info.pop(_STAGED_STATS_KEY, None)
+    registers = session.info.pop(_STAGED_REGISTERS_KEY, None)
+    if staged and _stats_buffer.add(staged, registers):
+        _request_stats_flush()
+
+
+@listens_for(SessionLocal, "after_rollback")
+def _discard_staged_stats(session: Session) -> None:
+    for key in (_TOUCHED_STAT_DATES_KEY, _STAGED_STATS_KEY, _STAGED_REGISTERS_KEY, _MERGED_SKETCHES_KEY):
+        session.info.pop(key, None)
+
+
+def insert_events(db: Session, events_in: Sequence[schemas.EventIn]) -> List[Event]:
+    """Bulk insert events in a single statement and fold them into the daily stats."""
+
+    if not events_in:
+        return []
+
+    created_at = datetime.utcnow()
+    rows = [
+        {
+            "event_type": event_in.event_type,
+            "user_id": event_in.user_id,
+            "payload": jsoncodec.dumps(event_in.payload),
+            "metadata_json": jsoncodec.dumps_optional(event_in.metadata),
+            "created_at": created_at,
+            "anonymized": False,
+            "event_id": event_in.event_id,
+        }
+        for event_in in events_in
+    ]
+    events = list(
+        db.scalars(insert(Event).returning(Event, sort_by_parameter_order=True), rows)
+    )
+    record_stat_increments(
+        db, Counter((event_in.event_type, created_at.date()) for event_in in events_in)
+    )
+    users_by_key: Dict[Tuple[str, date], List[Optional[str]]] = {}
+    for event_in in events_in:
+        users_by_key.setdefault((event_in.event_type, created_at.date()), []).append(event_in.user_id)
+    record_unique_users(db, users_by_key)
+    return events
+
+
+NDJSON_MEDIA_TYPES = frozenset({"application/x-ndjson", "application/ndjson", "application/jsonl"})
+_INVALID_JSON_LINE = object()
+
+
+def _format_validation_error(exc: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(part) for part in error['loc'])}: {error['msg']}" for error in exc.errors()
+    )
+
+
+def parse_event_batch(raw_body: bytes, content_type: str) -> List[Union[schemas.EventIn, str]]:
+    """Decode a JSON array or NDJSON body, returning an event or an error message per item."""
+
+    media_type = content_type.split(";", 1)[0].strip().lower()
+    decoded: List[object] = []
+    if media_type in NDJSON_MEDIA_TYPES:
+        for line in raw_body.splitlines():
+            if not line.strip():
+                continue
+            try:
+                decoded.append(jsoncodec.loads(line))
+            except ValueError:
+                decoded.append(_INVALID_JSON_LINE)
     else:
-        stat.count += 1
-    db.flush()
+        try:
+            body = jsoncodec.loads(raw_body or b"null")
+        except ValueError:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON body")
+        if not isinstance(body, list):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="Expected a JSON array or NDJSON stream of events",
+            )
+        decoded = body
+
+    if len(decoded) > _batch_max_events:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Batch exceeds the limit of {_batch_max_events} events",
+        )
+
+    items: List[Union[schemas.EventIn, str]] = []
+    for item in decoded:
+        if item is _INVALID_JSON_LINE:
+            items.append("Invalid JSON")
+            continue
+        try:
+            items.append(schemas.EventIn.parse_obj(item))
+        except ValidationError as exc:
+            items.append(_format_validation_error(exc))
+    return items
+
+
+def _batch_too_large(what: str) -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"{what} exceeds {_batch_max_body_bytes} bytes",
+    )
+
+
+def decode_batch_body(raw_body: bytes, content_encoding: Optional[str]) -> bytes:
+    """Undo ``Content-Encoding: gzip``; the decoded body is refused past the configured limit."""
+
+    encoding = (content_encoding or "identity").strip().lower()
+    if encoding == "identity":
+        if len(raw_body) > _batch_max_body_bytes:
+            raise _batch_too_large("Batch body")
+        return raw_body
+    if encoding != "gzip":
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail=f"Unsupported Content-Encoding {encoding!r}",
+        )
+    # Inflate incrementally with a cap so a small compressed body cannot expand without bound.
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        body = decompressor.decompress(raw_body, _batch_max_body_bytes + 1)
+    except zlib.error:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid gzip body")
+    if len(body) > _batch_max_body_bytes:
+        raise _batch_too_large("Decompressed batch")
+    if not decompressor.eof or decompressor.unused_data:
+        # Truncated stream, or trailing members this single-member reader would silently drop.
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid gzip body")
+    return body
+
+
+async def read_batch_body(request: Request) -> Tuple[bytes, str]:
+    # The wire body is capped too: refuse a declared oversize body unread, and stop buffering a
+    # chunked one as soon as it passes the limit.
+    declared = request.headers.get("content-length", "")
+    if declared.isdigit() and int(declared) > _batch_max_body_bytes:
+        raise _batch_too_large("Batch body")
+    chunks: List[bytes] = []
+    size = 0
+    async for chunk in request.stream():
+        size += len(chunk)
+        if size > _batch_max_body_bytes:
+            raise _batch_too_large("Batch body")
+        chunks.append(chunk)
+    body = decode_batch_body(b"".join(chunks), request.headers.get("content-encoding"))
+    return body, request.headers.get("content-type", "application/json")
+
+
+@dataclass
+class StatsCacheEntry:
+    """A rendered ``GET /stats`` page and the ``event_date`` window it depends on."""
+
+    items: List[schemas.EventStatOut]
+    etag: str
+    next_cursor: Optional[str]
+    lower_date: Optional[date]
+    upper_date: Optional[date]
+    expires_at: float
+
+    def depends_on(self, event_date: date) -> bool:
+        if self.lower_date is not None and event_date < self.lower_date:
+            return False
+        if self.upper_date is not None and event_date > self.upper_date:
+            return False
+        return True
+
+
+class StatsResponseCache:
+    """In-process TTL/LRU cache of ``GET /stats`` pages keyed by query parameters.
+
+    Writes invalidate only the pages whose date window contains a touched date, so pages of
+    past days stay cached until they expire. Every invalidation bumps ``generation`` and is
+    logged with its dates. A reader takes the generation before querying, and ``put`` drops
+    the page only if an invalidation logged since then touched a date the page depends on: the
+    query may have run before that write committed. Writes to other dates leave it cacheable.
+    """
+
+    # Invalidations remembered for readers still in flight; a reader older than the whole log
+    # cannot tell what it missed and does not cache its page.
+    INVALIDATION_LOG_SIZE = 1024
+
+    def __init__(self, max_entries: int, ttl_seconds: float) -> None:
+        self._max_entries = max_entries
+        self._ttl_seconds = ttl_seconds
+        self._entries: OrderedDict[tuple, StatsCacheEntry] = OrderedDict()
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._invalidations: Deque[Tuple[int, FrozenSet[date]]] = deque(maxlen=self.INVALIDATION_LOG_SIZE)
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def ttl_seconds(self) -> float:
+        return self._ttl_seconds
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: tuple) -> Optional[StatsCacheEntry]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry.expires_at <= now:
+                del self._entries[key]
+                entry = None
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key: tuple, entry: StatsCacheEntry, generation: int) -> None:
+        if self._max_entries <= 0 or self._ttl_seconds <= 0:
+            return
+        with self._lock:
+            if self._invalidated_since(generation, entry):
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+
+    def _invalidated_since(self, generation: int, entry: StatsCacheEntry) -> bool:
+        if generation == self._generation:
+            return False
+        if not self._invalidations or self._invalidations[0][0] > generation + 1:
+            return True
+        return any(
+            logged > generation and any(entry.depends_on(event_date) for event_date in dates)
+            for logged, dates in self._invalidations
+        )
+
+    def invalidate_dates(self, dates: Iterable[date]) -> None:
+        dates = frozenset(dates)
+        with self._lock:
+            self._generation += 1
+            self._invalidations.append((self._generation, dates))
+            stale = [
+                key
+                for key, entry in self._entries.items()
+                if any(entry.depends_on(event_date) for event_date in dates)
+            ]
+            for key in stale:
+                del self._entries[key]
+
+    def snapshot(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
+
+
+def _get_stats_cache() -> StatsResponseCache:
+    max_entries = int(os.environ.get("INGESTION_STATS_CACHE_MAX_ENTRIES", "256"))
+    ttl_seconds = float(os.environ.get("INGESTION_STATS_CACHE_TTL_SECONDS", "30"))
+    return StatsResponseCache(max_entries, ttl_seconds)
+
+
+class RecentEventCache:
+    """Bounded LRU of recently stored events keyed by their client ``event_id``.
+
+    Retries usually arrive within seconds, so answering them from memory keeps them off the
+    database entirely. Only committed events are cached; the unique index on ``event_id``
+    remains the source of truth for anything that has been evicted.
+    """
+
+    def __init__(self, max_entries: int) -> None:
+        self._max_entries = max_entries
+        self._entries: OrderedDict[str, schemas.EventOut] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+
+    def get(self, event_id: str) -> Optional[schemas.EventOut]:
+        with self._lock:
+            event_out = self._entries.get(event_id)
+            if event_out is not None:
+                self._entries.move_to_end(event_id)
+                self.hits += 1
+            return event_out
+
+    def put(self, event_out: schemas.EventOut) -> schemas.EventOut:
+        if event_out.event_id is None or self._max_entries <= 0:
+            return event_out
+        with self._lock:
+            self._entries[event_out.event_id] = event_out
+            self._entries.move_to_end(event_out.event_id)
+            while len(self._entries) > self._max_entries:
+                self._entries.popitem(last=False)
+        return event_out
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _get_recent_event_cache() -> RecentEventCache:
+    return RecentEventCache(int(os.environ.get("INGESTION_IDEMPOTENCY_CACHE_SIZE", "10000")))
+
+
+class IngestOverloadedError(Exception):
+    """Raised when an ingest request cannot be admitted; carries the suggested retry delay."""
+
+    def __init__(self, retry_after_seconds: int) -> None:
+        super().__init__("Ingestion is overloaded")
+        self.retry_after_seconds = retry_after_seconds
+
+
+class AdmissionController:
+    """Caps concurrent ingest requests and sheds load once the wait queue is full.
+
+    Up to ``max_in_flight`` requests run at once; up to ``max_queue`` more wait on the event
+    loop (not in the threadpool) for at most ``queue_timeout_seconds``. Anything beyond that is
+    rejected immediately, so a slow database turns into fast 503s instead of a pile of
+    requests that all time out. Ingest latency is tracked as an exponentially weighted moving
+    average, which background jobs use to back off while ingestion is struggling.
+
+    ``acquire``/``release`` must be called from the event loop; ``congested`` and
+    :meth:`throttle_background_work` are safe to use from worker threads.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int,
+        max_queue: int,
+        queue_timeout_seconds: float,
+        latency_target_seconds: float,
+        smoothing: float = 0.2,
+    ) -> None:
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self._queue_timeout_seconds = queue_timeout_seconds
+        self.latency_target_seconds = latency_target_seconds
+        self._smoothing = smoothing
+        self._waiters: deque[asyncio.Future] = deque()
+        self.in_flight = 0
+        self.latency_seconds = 0.0
+        self.admitted = 0
+        self.shed = 0
+
+    @property
+    def queued(self) -> int:
+        return len(self._waiters)
+
+    @property
+    def congested(self) -> bool:
+        busy = self.in_flight > 0 or bool(self._waiters)
+        return busy and self.latency_seconds > self.latency_target_seconds
+
+    def _reject(self) -> IngestOverloadedError:
+        self.shed += 1
+        # Rough time to drain the queue at the current latency.
+        slots = max(self.max_in_flight, 1)
+        return IngestOverloadedError(max(1, math.ceil(self.latency_seconds * (self.queued + 1) / slots)))
+
+    async def acquire(self) -> None:
+        if self.max_in_flight <= 0 or (self.in_flight < self.max_in_flight and not self._waiters):
+            self.in_flight += 1
+            self.admitted += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._reject()
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), self._queue_timeout_seconds)
+        except asyncio.TimeoutError:
+            if not waiter.done():
+                waiter.cancel()
+                raise self._reject() from None
+            # The slot was handed over just as the timeout fired; keep it.
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self.release(None)
+            else:
+                waiter.cancel()
+            raise
+        finally:
+            with suppress(ValueError):
+                self._waiters.remove(waiter)
+        self.admitted += 1
+
+    def release(self, elapsed_seconds: Optional[float]) -> None:
+        if elapsed_seconds is not None:
+            self.latency_seconds += self._smoothing * (elapsed_seconds - self.latency_seconds)
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                # Hand the slot straight to the oldest waiter; in_flight is unchanged.
+                waiter.set_result(None)
+                return
+        self.in_flight -= 1
+
+    def throttle_background_work(self, max_pause_seconds: float, poll_seconds: float = 0.05) -> float:
+        """Block while ingestion is congested, for at most ``max_pause_seconds``.
+
+        Returns the time spent waiting. Meant to be called between chunks of background jobs
+        running in worker threads.
+        """
+
+        started = time.monotonic()
+        while self.congested:
+            waited = time.monotonic() - started
+            if waited >= max_pause_seconds:
+                break
+            time.sleep(min(poll_seconds, max_pause_seconds - waited))
+        return time.monotonic() - started
+
+    def snapshot(self) -> Dict[str, Any]:
+        return {
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "latency_seconds": self.latency_seconds,
+            "latency_target_seconds": self.latency_target_seconds,
+            "congested": self.congested,
+        }
+
+
+def _get_admission_controller() -> AdmissionController:
+    return AdmissionController(
+        max_in_flight=int(os.environ.get("INGESTION_INGEST_MAX_IN_FLIGHT", "32")),
+        max_queue=int(os.environ.get("INGESTION_INGEST_MAX_QUEUE", "64")),
+        queue_timeout_seconds=float(os.environ.get("INGESTION_INGEST_QUEUE_TIMEOUT_SECONDS", "1")),
+        latency_target_seconds=float(os.environ.get("INGESTION_INGEST_LATENCY_TARGET_SECONDS", "0.25")),
+    )
+
+
+@dataclass(frozen=True)
+class RateLimitStatus:
+    """Quota left for a key, rendered as ``X-RateLimit-*`` headers."""
+
+    limit: int
+    remaining: int
+    reset_seconds: float
+
+    def headers(self) -> Dict[str, str]:
+        return {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_seconds)),
+        }
 
 
 class RateLimitError(Exception):
     """Raised when a caller exceeds the configured rate limit."""
 
+    def __init__(self, message: str, status: Optional[RateLimitStatus] = None) -> None:
+        super().__init__(message)
+        self.status = status
+
+
+def _sliding_window_estimate(previous: int, current: int, elapsed_fraction: float) -> float:
+    # Weight the previous window by how much of it still overlaps the sliding window; this
+    # avoids the 2x burst a fixed window allows at its edges while keeping O(1) state per key.
+    return previous * (1 - elapsed_fraction) + current
+
+
+class SlidingWindowRateLimiter:
+    """In-memory sliding-window rate limiter keyed by identifier.
+
+    Keys are kept in least-recently-used order. A key idle for two windows carries no state
+    the estimate needs, so each ``check`` evicts such keys from the cold end. ``max_keys`` caps
+    memory even when every key is active.
+    """
 
-class FixedWindowRateLimiter:
-    """Simple in-memory fixed window rate limiter keyed by identifier."""
+    shared = False
 
-    def __init__(self, max_requests: int, window_seconds: int) -> None:
+    def __init__(
+        self,
+        max_requests: int,
+        window_seconds: int,
+        max_keys: int = 100_000,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
         self._max_requests = max_requests
         self._window_seconds = window_seconds
-        self._counters: dict[str, tuple[int, float]] = {}
+        self._max_keys = max_keys
+        self._clock = clock
+        # key -> [window index, count in that window, count in the window before it]
+        self._counters: OrderedDict[str, List[int]] = OrderedDict()
         self._lock = threading.Lock()
+        self._swept_window: Optional[int] = None
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+    def _evict(self, window: int) -> None:
+        if window != self._swept_window:
+            # Keys are in last-use order, so the sweep stops at the first key still in use.
+            self._swept_window = window
+            while self._counters:
+                key, state = next(iter(self._counters.items()))
+                if state[0] >= window - 1:
+                    break
+                del self._counters[key]
+                self.evictions += 1
+        while len(self._counters) > self._max_keys:
+            self._counters.popitem(last=False)
+            self.evictions += 1
+
+    def check(self, key: str) -> RateLimitStatus:
+        now = self._clock()
+        window, offset = divmod(now, self._window_seconds)
+        window = int(window)
+        elapsed_fraction = offset / self._window_seconds
+        reset_seconds = self._window_seconds - offset
 
-    def check(self, key: str) -> None:
-        now = time.monotonic()
         with self._lock:
-            count, window_start = self._counters.get(key, (0, now))
-            if now - window_start >= self._window_seconds:
-                count = 0
-                window_start = now
-            if count >= self._max_requests:
-                raise RateLimitError(f"Rate limit exceeded for key {key}")
-            self._counters[key] = (count + 1, window_start)
+            state = self._counters.get(key)
+            if state is None:
+                state = self._counters[key] = [window, 0, 0]
+            elif state[0] != window:
+                state[:] = [window, 0, state[1] if state[0] == window - 1 else 0]
+            # Rejected calls count as use too, so the max_keys cap never evicts a throttled key.
+            self._counters.move_to_end(key)
+            estimate = _sliding_window_estimate(state[2], state[1], elapsed_fraction)
+            if estimate + 1 > self._max_requests:
+                limit_status = RateLimitStatus(self._max_requests, 0, reset_seconds)
+                raise RateLimitError(f"Rate limit exceeded for key {key}", limit_status)
+            state[1] += 1
+            self._evict(window)
+        remaining = max(0, math.floor(self._max_requests - estimate - 1))
+        return RateLimitStatus(self._max_requests, remaining, reset_seconds)
+
+
+# Plain SQL so the statement stays in SQLAlchemy's compiled cache; SQLite and PostgreSQL
+# share the upsert syntax. The WHERE clause makes the increment conditional on the quota.
+_RATE_LIMIT_INCREMENT = text(
+    "INSERT INTO rate_limit_counters (key, window_start, count) VALUES (:key, :window, 1) "
+    "ON CONFLICT (key, window_start) DO UPDATE SET count = rate_limit_counters.count + 1 "
+    "WHERE rate_limit_counters.count < :allowed"
+)
+
+
+class DatabaseRateLimiter:
+    """Sliding-window rate limiter whose counters live in the ``rate_limit_counters`` table.
+
+    Every worker sharing the database enforces one limit. Windows are aligned to wall-clock
+    time so processes agree on them; rows older than the previous window are deleted in
+    batches at most once per window per process.
+    """
+
+    shared = True
+
+    def __init__(
+        self,
+        bind: Engine,
+        max_requests: int,
+        window_seconds: int,
+        cleanup_batch_size: int = 1000,
+        clock: Callable[[], float] = time.time,
+    ) -> None:
+        if bind.dialect.name not in {"sqlite", "postgresql"}:
+            raise RuntimeError(f"Shared rate limiting is not supported on {bind.dialect.name!r}")
+        self._engine = bind
+        self._max_requests = max_requests
+        self._window_seconds = window_seconds
+        self._cleanup_batch_size = cleanup_batch_size
+        self._clock = clock
+        self._next_cleanup_window: Optional[int] = None
+
+    def check(self, key: str) -> RateLimitStatus:
+        now = self._clock()
+        window, offset = divmod(now, self._window_seconds)
+        window = int(window)
+        elapsed_fraction = offset / self._window_seconds
+        reset_seconds = self._window_seconds - offset
+
+        with self._engine.begin() as connection:
+            counts = dict(
+                connection.execute(
+                    select(RateLimitCounter.window_start, RateLimitCounter.count).where(
+                        RateLimitCounter.key == key,
+                        RateLimitCounter.window_start.in_([window - 1, window]),
+                    )
+                ).all()
+            )
+            previous, current = counts.get(window - 1, 0), counts.get(window, 0)
+            # Requests this window may still make before the sliding estimate hits the limit.
+            allowed = self._max_requests - previous * (1 - elapsed_fraction)
+            claimed = current + 1 <= allowed and connection.execute(
+                _RATE_LIMIT_INCREMENT, {"key": key, "window": window, "allowed": allowed}
+            ).rowcount == 1
+        if not claimed:
+            limit_status = RateLimitStatus(self._max_requests, 0, reset_seconds)
+            raise RateLimitError(f"Rate limit exceeded for key {key}", limit_status)
+
+        if self._next_cleanup_window is None or window >= self._next_cleanup_window:
+            self._next_cleanup_window = window + 1
+            self.purge_expired(window)
+        estimate = _sliding_window_estimate(previous, current, elapsed_fraction)
+        remaining = max(0, math.floor(self._max_requests - estimate - 1))
+        return RateLimitStatus(self._max_requests, remaining, reset_seconds)
+
+    def purge_expired(self, window: int) -> int:
+        """Delete counters older than the previous window, one short transaction per batch."""
+
+        stale = (
+            select(RateLimitCounter.key, RateLimitCounter.window_start)
+            .where(RateLimitCounter.window_start < window - 1)
+            .limit(self._cleanup_batch_size)
+        )
+        deleted_total = 0
+        while True:
+            with self._engine.begin() as connection:
+                deleted = connection.execute(
+                    delete(RateLimitCounter).where(
+                        tuple_(RateLimitCounter.key, RateLimitCounter.window_start).in_(stale)
+                    )
+                ).rowcount
+            deleted_total += deleted
+            if deleted < self._cleanup_batch_size:
+                return deleted_total
+
+
+RATE_LIMIT_BACKENDS = ("memory", "database")
 
 
-def _get_rate_limiter() -> FixedWindowRateLimiter:
+def _get_rate_limiter() -> Union[SlidingWindowRateLimiter, DatabaseRateLimiter]:
     requests_per_window = int(os.environ.get("INGESTION_STATS_RATE_LIMIT", "60"))
     window_seconds = int(os.environ.get("INGESTION_STATS_RATE_WINDOW", "60"))
-    return FixedWindowRateLimiter(requests_per_window, window_seconds)
+    backend = os.environ.get("INGESTION_STATS_RATE_LIMIT_BACKEND", "memory").lower()
+    if backend not in RATE_LIMIT_BACKENDS:
+        raise RuntimeError(
+            f"INGESTION_STATS_RATE_LIMIT_BACKEND must be one of {list(RATE_LIMIT_BACKENDS)}, got {backend!r}"
+        )
+    if backend == "database":
+        return DatabaseRateLimiter(engine, requests_per_window, window_seconds)
+    max_keys = int(os.environ.get("INGESTION_STATS_RATE_LIMIT_MAX_KEYS", "100000"))
+    return SlidingWindowRateLimiter(requests_per_window, window_seconds, max_keys)
 
 
 _stats_rate_limiter = _get_rate_limiter()
+_stats_cache = _get_stats_cache()
+_recent_events = _get_recent_event_cache()
+_ingest_admission = _get_admission_controller()
+_retention_max_pause_seconds = float(os.environ.get("INGESTION_RETENTION_MAX_PAUSE_SECONDS", "30"))
+_batch_max_events = int(os.environ.get("INGESTION_BATCH_MAX_EVENTS", "1000"))
+_batch_max_body_bytes = int(os.environ.get("INGESTION_BATCH_MAX_BODY_BYTES", str(16 * 1024 * 1024)))
 _retention_task: Optional[asyncio.Task[None]] = None
+_jwks_refresh_task: Optional[asyncio.Task[None]] = None
+_stats_write_behind = os.environ.get("INGESTION_STATS_WRITE_BEHIND", "false").lower() in {
+    "1",
+    "true",
+    "yes",
+}
+_stats_flush_interval_seconds = float(os.environ.get("INGESTION_STATS_FLUSH_INTERVAL_SECONDS", "5"))
+_stats_flush_threshold = int(os.environ.get("INGESTION_STATS_FLUSH_THRESHOLD", "1000"))
+_stats_buffer = StatsBuffer(_stats_flush_threshold)
+_user_sketches = _get_user_sketch_cache()
+_stats_flush_task: Optional[asyncio.Task[None]] = None
+_stats_flush_loop: Optional[asyncio.AbstractEventLoop] = None
+_stats_flush_requested: Optional[asyncio.Event] = None
 _retention_interval_seconds = int(
     os.environ.get("INGESTION_RETENTION_INTERVAL_SECONDS", str(24 * 60 * 60))
 )
+_retention_chunk_size = int(os.environ.get("INGESTION_RETENTION_CHUNK_SIZE", "1000"))
+_export_chunk_size = int(os.environ.get("INGESTION_EXPORT_CHUNK_SIZE", "1000"))
+_archive_after_days = int(os.environ.get("INGESTION_ARCHIVE_AFTER_DAYS", "180"))
+
+
+def _get_event_archive() -> Optional[EventArchive]:
+    directory = os.environ.get("INGESTION_ARCHIVE_DIR")
+    return EventArchive(directory) if directory else None
+
 
+_event_archive = _get_event_archive()
 
-def _apply_retention_once() -> None:
+
+def _yield_to_ingest() -> float:
+    return _ingest_admission.throttle_background_work(_retention_max_pause_seconds)
+
+
+def _apply_retention_once(full_sweep: bool = False) -> RetentionResult:
     with SessionLocal() as db:
-        enforce_retention_policy(db)
-        db.commit()
+        result = enforce_retention_policy(db, full_sweep=full_sweep, throttle=_yield_to_ingest)
+    RETENTION_SECONDS.observe(result.elapsed_seconds, "anonymize")
+    RETENTION_ROWS.inc("anonymize", amount=result.rows)
+    if result.rows:
+        logger.info(
+            "Anonymized %d events in %d chunks in %.2fs (%.0f rows/s, %.2fs paused for ingest)%s",
+            result.rows,
+            result.chunks,
+            result.elapsed_seconds,
+            result.rows_per_second,
+            result.paused_seconds,
+            " during full sweep" if full_sweep else "",
+        )
+    if _event_archive is not None:
+        with SessionLocal() as db:
+            archived = archive_anonymized_events(db, _event_archive, throttle=_yield_to_ingest)
+        RETENTION_SECONDS.observe(archived.elapsed_seconds, "archive")
+        RETENTION_ROWS.inc("archive", amount=archived.rows)
+        if archived.rows:
+            logger.info(
+                "Archived %d anonymized events in %d chunks in %.2fs (%.0f rows/s, %.2fs paused for ingest)",
+                archived.rows,
+                archived.chunks,
+                archived.elapsed_seconds,
+                archived.rows_per_second,
+                archived.paused_seconds,
+            )
+    return result
 
 
 async def _run_retention_cycle() -> None:
@@ -144,80 +1319,1078 @@ def _start_retention_worker() -> None:
         _retention_task = loop.create_task(_retention_worker())
 
 
-@app.post("/events", response_model=schemas.EventOut, status_code=status.HTTP_201_CREATED)
+def _flush_stats_buffer() -> None:
+    pending, registers = _stats_buffer.drain()
+    if not pending:
+        return
+    try:
+        with SessionLocal() as db:
+            increment_stats(db, pending)
+            merge_user_sketches(db, registers)
+            db.commit()
+    except Exception:
+        # Put the deltas back so a failed flush never loses counts.
+        _stats_buffer.add(pending, registers)
+        raise
+
+
+def _request_stats_flush() -> None:
+    loop, requested = _stats_flush_loop, _stats_flush_requested
+    if loop is None or requested is None or loop.is_closed():
+        # No background worker is running, so flush from the calling thread.
+        try:
+            _flush_stats_buffer()
+        except Exception:  # pragma: no cover - log unexpected failures
+            logger.exception("Failed to flush buffered event stats")
+        return
+    loop.call_soon_threadsafe(requested.set)
+
+
+async def _run_stats_flush() -> None:
+    try:
+        await asyncio.to_thread(_flush_stats_buffer)
+    except Exception:  # pragma: no cover - log unexpected failures
+        logger.exception("Failed to flush buffered event stats")
+
+
+async def _stats_flush_worker(requested: asyncio.Event) -> None:
+    try:
+        while True:
+            with suppress(asyncio.TimeoutError):
+                await asyncio.wait_for(requested.wait(), timeout=_stats_flush_interval_seconds)
+            requested.clear()
+            await _run_stats_flush()
+    except asyncio.CancelledError:  # pragma: no cover - cooperative cancellation
+        pass
+
+
+def _start_stats_flush_worker() -> None:
+    global _stats_flush_task, _stats_flush_loop, _stats_flush_requested
+    if _stats_write_behind and _stats_flush_task is None:
+        _stats_flush_loop = asyncio.get_running_loop()
+        _stats_flush_requested = asyncio.Event()
+        _stats_flush_task = _stats_flush_loop.create_task(_stats_flush_worker(_stats_flush_requested))
+
+
+async def admit_ingest(_: dict = Depends(verify_jwt)) -> AsyncIterator[None]:
+    """Hold an admission slot for the duration of an ingest request, or fail fast with 503.
+
+    Depends on ``verify_jwt`` so callers are authenticated before they take a slot: tokenless
+    floods cannot shed real ingests, and token verification stays out of the latency average.
+    FastAPI caches the verdict, so the handler's own ``verify_jwt`` does not run it again.
+    """
+
+    admission = _ingest_admission
+    try:
+        await admission.acquire()
+    except IngestOverloadedError as exc:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Ingestion is overloaded, retry later",
+            headers={"Retry-After": str(exc.retry_after_seconds)},
+        )
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        admission.release(time.perf_counter() - started)
+
+
+def _event_from_schema(event_in: schemas.EventIn) -> Event:
+    return Event(
+        event_type=event_in.event_type,
+        user_id=event_in.user_id,
+        payload=jsoncodec.dumps(event_in.payload),
+        metadata_json=jsoncodec.dumps_optional(event_in.metadata),
+        event_id=event_in.event_id,
+    )
+
+
+def _resolve_event_id(event_in: schemas.EventIn, idempotency_key: Optional[str]) -> schemas.EventIn:
+    if idempotency_key is None:
+        return event_in
+    if len(idempotency_key) > 255:
+        raise HTTPException(status_code=400, detail="Idempotency-Key must be at most 255 characters")
+    if event_in.event_id is not None and event_in.event_id != idempotency_key:
+        raise HTTPException(status_code=400, detail="Idempotency-Key does not match event_id")
+    return event_in.copy(update={"event_id": idempotency_key})
+
+
+def _replayed(event_out: schemas.EventOut, response: Optional[Response]) -> schemas.EventOut:
+    if response is not None:
+        response.headers["Idempotent-Replayed"] = "true"
+    return event_out
+
+
+def _stored_event_statement(event_id: str) -> Select:
+    return select(Event).where(Event.event_id == event_id)
+
+
 def ingest_event(
     event_in: schemas.EventIn,
     _: dict = Depends(verify_jwt),
     db: Session = Depends(get_db),
+    idempotency_key: Annotated[Optional[str], Header()] = None,
+    response: Response = None,
 ) -> schemas.EventOut:
-    event = Event(
-        event_type=event_in.event_type,
-        user_id=event_in.user_id,
-        payload=json.dumps(event_in.payload),
-        metadata_json=json.dumps(event_in.metadata) if event_in.metadata is not None else None,
-    )
+    event_in = _resolve_event_id(event_in, idempotency_key)
+    if event_in.event_id is not None:
+        cached = _recent_events.get(event_in.event_id)
+        if cached is not None:
+            return _replayed(cached, response)
+
+    event = _event_from_schema(event_in)
     db.add(event)
-    db.flush()
+    try:
+        with stage_timer("event_insert"):
+            db.flush()
+    except IntegrityError:
+        # A retry of an event that is no longer (or not yet) in this worker's cache.
+        db.rollback()
+        original = None
+        if event_in.event_id is not None:
+            original = db.scalars(_stored_event_statement(event_in.event_id)).first()
+        if original is None:
+            raise
+        return _replayed(_recent_events.put(schemas.EventOut.from_orm(original)), response)
 
     if event.created_at is None:
         raise HTTPException(status_code=500, detail="Failed to persist event")
 
-    update_stats(db, event)
+    with stage_timer("update_stats"):
+        update_stats(db, event)
 
-    db.commit()
-    db.refresh(event)
-    return schemas.EventOut.from_orm(event)
+    # The flush has already populated every column EventOut needs (id from the insert,
+    # created_at and anonymized from client-side defaults). Reading them after the commit,
+    # which expires the instance, would cost another SELECT.
+    event_out = schemas.EventOut.from_orm(event)
+    with stage_timer("commit"):
+        db.commit()
+    return _recent_events.put(event_out)
 
 
-@app.get("/stats", response_model=List[schemas.EventStatOut])
-def list_stats(
-    request: Request,
-    page: int = Query(1, ge=1),
-    page_size: int = Query(100, ge=1, le=500),
+async def ingest_event_async(
+    event_in: schemas.EventIn,
+    _: dict = Depends(verify_jwt),
+    db: AsyncSession = Depends(get_async_db),
+    idempotency_key: Annotated[Optional[str], Header()] = None,
+    response: Response = None,
+) -> schemas.EventOut:
+    event_in = _resolve_event_id(event_in, idempotency_key)
+    if event_in.event_id is not None:
+        cached = _recent_events.get(event_in.event_id)
+        if cached is not None:
+            return _replayed(cached, response)
+
+    event = _event_from_schema(event_in)
+    db.add(event)
+    try:
+        with stage_timer("event_insert"):
+            await db.flush()
+    except IntegrityError:
+        await db.rollback()
+        original = None
+        if event_in.event_id is not None:
+            original = (await db.scalars(_stored_event_statement(event_in.event_id))).first()
+        if original is None:
+            raise
+        return _replayed(_recent_events.put(schemas.EventOut.from_orm(original)), response)
+
+    if event.created_at is None:
+        raise HTTPException(status_code=500, detail="Failed to persist event")
+
+    key = (event.event_type, event.created_at.date())
+    increments = {key: 1}
+    registers = _pending_register_updates({key: (event.user_id,)})
+    merged: Dict[Tuple[str, date], HyperLogLog] = {}
+    if not _stats_write_behind:
+        with stage_timer("update_stats"):
+            await increment_stats_async(db, increments)
+            merged = await merge_user_sketches_async(db, registers)
+
+    with stage_timer("commit"):
+        await db.commit()
+    if not _stats_write_behind:
+        _stats_cache.invalidate_dates([event.created_at.date()])
+        _user_sketches.store(merged)
+    elif _stats_buffer.add(increments, registers):
+        _request_stats_flush()
+    return _recent_events.put(schemas.EventOut.from_orm(event))
+
+
+app.post(
+    "/events",
+    response_model=schemas.EventOut,
+    status_code=status.HTTP_201_CREATED,
+    dependencies=[Depends(admit_ingest)],
+)(ingest_event_async if ASYNC_DATABASE_ENABLED else ingest_event)
+
+
+@app.post("/events:batch", response_model=schemas.EventBatchOut, dependencies=[Depends(admit_ingest)])
+def ingest_events_batch(
+    # Declared before the body so the token is checked before any gzip is inflated.
     _: dict = Depends(verify_jwt),
+    batch: Tuple[bytes, str] = Depends(read_batch_body),
     db: Session = Depends(get_db),
-) -> List[schemas.EventStatOut]:
+) -> schemas.EventBatchOut:
+    items = parse_event_batch(*batch)
+    try:
+        return _ingest_parsed_batch(db, items)
+    except IntegrityError:
+        # Another request stored one of these event_ids between the lookup and the insert;
+        # the second attempt finds it and reports a duplicate.
+        db.rollback()
+        return _ingest_parsed_batch(db, items)
+
+
+def _known_events(db: Session, event_ids: Iterable[str]) -> Dict[str, schemas.EventOut]:
+    """Already stored events for ``event_ids``, from the recent-id cache or one ``SELECT``."""
+
+    known: Dict[str, schemas.EventOut] = {}
+    missing = []
+    for event_id in set(event_ids):
+        cached = _recent_events.get(event_id)
+        if cached is not None:
+            known[event_id] = cached
+        else:
+            missing.append(event_id)
+    if missing:
+        for event in db.scalars(select(Event).where(Event.event_id.in_(missing))):
+            known[event.event_id] = _recent_events.put(schemas.EventOut.from_orm(event))
+    return known
+
+
+def _ingest_parsed_batch(
+    db: Session,
+    items: Sequence[Union[schemas.EventIn, str]],
+) -> schemas.EventBatchOut:
+    accepted = [item for item in items if isinstance(item, schemas.EventIn)]
+    known = _known_events(db, (item.event_id for item in accepted if item.event_id is not None))
+    fresh: List[schemas.EventIn] = []
+    fresh_ids = set()
+    for item in accepted:
+        if item.event_id is None:
+            fresh.append(item)
+        elif item.event_id not in known and item.event_id not in fresh_ids:
+            fresh_ids.add(item.event_id)
+            fresh.append(item)
+    with stage_timer("batch_insert"):
+        created = iter(insert_events(db, fresh))
+
+    # Build the response before committing: commit expires the returned rows and
+    # reading them afterwards would cost one SELECT per event.
+    results: List[schemas.EventBatchItemResult] = []
+    stored: List[schemas.EventOut] = []
+    duplicates = 0
+    for index, item in enumerate(items):
+        if not isinstance(item, schemas.EventIn):
+            results.append(schemas.EventBatchItemResult(index=index, status="rejected", error=item))
+        elif item.event_id is not None and item.event_id in known:
+            duplicates += 1
+            results.append(
+                schemas.EventBatchItemResult(index=index, status="duplicate", event=known[item.event_id])
+            )
+        else:
+            event_out = schemas.EventOut.from_orm(next(created))
+            if item.event_id is not None:
+                known[item.event_id] = event_out
+                stored.append(event_out)
+            results.append(schemas.EventBatchItemResult(index=index, status="created", event=event_out))
+    with stage_timer("commit"):
+        db.commit()
+    for event_out in stored:
+        _recent_events.put(event_out)
+    return schemas.EventBatchOut(
+        accepted=len(accepted),
+        duplicates=duplicates,
+        rejected=len(items) - len(accepted),
+        results=results,
+    )
+
+
+def _check_stats_rate_limit(request: Request, response: Optional[Response] = None) -> None:
     client_identifier = "anonymous"
     if request.client:
         client_identifier = request.client.host or client_identifier
 
     try:
-        _stats_rate_limiter.check(client_identifier)
-    except RateLimitError:
-        raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail="Rate limit exceeded")
+        limit_status = _stats_rate_limiter.check(client_identifier)
+    except RateLimitError as exc:
+        headers = {}
+        if exc.status is not None:
+            headers = {**exc.status.headers(), "Retry-After": str(math.ceil(exc.status.reset_seconds))}
+        raise HTTPException(
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Rate limit exceeded",
+            headers=headers,
+        )
+    if response is not None:
+        response.headers.update(limit_status.headers())
+
+
+async def _check_stats_rate_limit_async(request: Request, response: Optional[Response] = None) -> None:
+    if _stats_rate_limiter.shared:
+        # The shared limiter uses the sync engine; keep its round trip off the event loop.
+        await asyncio.to_thread(_check_stats_rate_limit, request, response)
+    else:
+        _check_stats_rate_limit(request, response)
+
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+def encode_stats_cursor(event_date: date, event_type: str) -> str:
+    raw = json.dumps([event_date.isoformat(), event_type], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode("ascii")
+
+
+def decode_stats_cursor(cursor: str) -> Tuple[date, str]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        event_date, event_type = json.loads(raw)
+        return date.fromisoformat(event_date), str(event_type)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid cursor")
+
+
+def _filter_stats(
+    stmt: Select,
+    date_from: Optional[date],
+    date_to: Optional[date],
+    event_type_prefix: Optional[str],
+) -> Select:
+    if date_from is not None:
+        stmt = stmt.where(EventStat.event_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(EventStat.event_date <= date_to)
+    if event_type_prefix:
+        # A half-open range instead of LIKE so the prefix can use the event_type index.
+        upper_bound = event_type_prefix[:-1] + chr(ord(event_type_prefix[-1]) + 1)
+        stmt = stmt.where(EventStat.event_type >= event_type_prefix, EventStat.event_type < upper_bound)
+    return stmt
+
+
+def _stats_page_query(
+    page: int,
+    page_size: int,
+    cursor: Optional[str] = None,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    event_type_prefix: Optional[str] = None,
+) -> Select[EventStat]:
+    stmt = select(EventStat).order_by(EventStat.event_date.desc(), EventStat.event_type.asc())
+    stmt = _filter_stats(stmt, date_from, date_to, event_type_prefix)
+
+    if cursor is not None:
+        # Keyset continuation on (event_date desc, event_type asc): cost stays constant
+        # however deep the page, unlike OFFSET which scans every skipped row.
+        # The leading ``event_date <= :last`` bound lets the planner seek the index.
+        last_date, last_type = decode_stats_cursor(cursor)
+        stmt = stmt.where(
+            EventStat.event_date <= last_date,
+            or_(EventStat.event_date < last_date, EventStat.event_type > last_type),
+        )
+    else:
+        stmt = stmt.offset((page - 1) * page_size)
+    return stmt.limit(page_size)
+
+
+def _build_stats_cache_entry(
+    stats: Sequence[EventStat],
+    page_size: int,
+    cursor: Optional[str],
+    date_from: Optional[date],
+    date_to: Optional[date],
+) -> StatsCacheEntry:
+    items = [schemas.EventStatOut.from_orm(stat) for stat in stats]
+    digest = hashlib.sha256(
+        json.dumps([(item.event_type, item.event_date.isoformat(), item.count) for item in items]).encode()
+    ).hexdigest()
+
+    next_cursor = None
+    # A page can only change if a write lands between its first possible and last row.
+    lower_date = date_from
+    if len(stats) == page_size:
+        next_cursor = encode_stats_cursor(stats[-1].event_date, stats[-1].event_type)
+        lower_date = stats[-1].event_date
+    upper_date = date_to
+    if cursor is not None:
+        cursor_date = decode_stats_cursor(cursor)[0]
+        upper_date = cursor_date if upper_date is None else min(upper_date, cursor_date)
+
+    return StatsCacheEntry(
+        items=items,
+        etag=f'"{digest[:32]}"',
+        next_cursor=next_cursor,
+        lower_date=lower_date,
+        upper_date=upper_date,
+        expires_at=time.monotonic() + _stats_cache.ttl_seconds,
+    )
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = {candidate.strip().removeprefix("W/") for candidate in if_none_match.split(",")}
+    return "*" in candidates or etag in candidates
+
+
+def _render_stats(
+    entry: StatsCacheEntry,
+    cache_hit: bool,
+    response: Optional[Response],
+    if_none_match: Optional[str],
+) -> Union[List[schemas.EventStatOut], Response]:
+    headers = {"ETag": entry.etag, "Cache-Control": "no-cache", "X-Cache": "HIT" if cache_hit else "MISS"}
+    if entry.next_cursor is not None:
+        headers[NEXT_CURSOR_HEADER] = entry.next_cursor
+    if _etag_matches(if_none_match, entry.etag):
+        if response is not None:
+            # A returned Response bypasses the injected one, so carry the quota headers over.
+            headers.update(
+                (name, value) for name, value in response.headers.items() if name.startswith("x-ratelimit-")
+            )
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    if response is not None:
+        response.headers.update(headers)
+    return entry.items
+
+
+def list_stats(
+    request: Request,
+    response: Response = None,
+    page: Annotated[int, Query(ge=1)] = 1,
+    page_size: Annotated[int, Query(ge=1, le=500)] = 100,
+    cursor: Annotated[Optional[str], Query(description="Opaque cursor from X-Next-Cursor")] = None,
+    date_from: Annotated[Optional[date], Query(alias="from")] = None,
+    date_to: Annotated[Optional[date], Query(alias="to")] = None,
+    event_type_prefix: Annotated[Optional[str], Query(max_length=64)] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    _: dict = Depends(verify_jwt),
+    db: Session = Depends(get_db),
+) -> Union[List[schemas.EventStatOut], Response]:
+    _check_stats_rate_limit(request, response)
+    key = (page, page_size, cursor, date_from, date_to, event_type_prefix)
+    entry = _stats_cache.get(key)
+    if entry is not None:
+        return _render_stats(entry, True, response, if_none_match)
+
+    generation = _stats_cache.generation
+    stats = db.execute(_stats_page_query(*key)).scalars().all()
+    entry = _build_stats_cache_entry(stats, page_size, cursor, date_from, date_to)
+    _stats_cache.put(key, entry, generation)
+    return _render_stats(entry, False, response, if_none_match)
+
+
+async def list_stats_async(
+    request: Request,
+    response: Response = None,
+    page: Annotated[int, Query(ge=1)] = 1,
+    page_size: Annotated[int, Query(ge=1, le=500)] = 100,
+    cursor: Annotated[Optional[str], Query(description="Opaque cursor from X-Next-Cursor")] = None,
+    date_from: Annotated[Optional[date], Query(alias="from")] = None,
+    date_to: Annotated[Optional[date], Query(alias="to")] = None,
+    event_type_prefix: Annotated[Optional[str], Query(max_length=64)] = None,
+    if_none_match: Annotated[Optional[str], Header()] = None,
+    _: dict = Depends(verify_jwt),
+    db: AsyncSession = Depends(get_async_db),
+) -> Union[List[schemas.EventStatOut], Response]:
+    await _check_stats_rate_limit_async(request, response)
+    key = (page, page_size, cursor, date_from, date_to, event_type_prefix)
+    entry = _stats_cache.get(key)
+    if entry is not None:
+        return _render_stats(entry, True, response, if_none_match)
+
+    generation = _stats_cache.generation
+    stats = (await db.execute(_stats_page_query(*key))).scalars().all()
+    entry = _build_stats_cache_entry(stats, page_size, cursor, date_from, date_to)
+    _stats_cache.put(key, entry, generation)
+    return _render_stats(entry, False, response, if_none_match)
+
+
+app.get("/stats", response_model=List[schemas.EventStatOut])(
+    list_stats_async if ASYNC_DATABASE_ENABLED else list_stats
+)
+
+
+RollupGranularity = Literal["day", "week", "month"]
+
+
+def _rollup_bucket(dialect_name: str, granularity: RollupGranularity):
+    """Return a SQL expression for the first day of each ``event_date`` bucket, if supported."""
+
+    if granularity == "day":
+        return EventStat.event_date
+    # Literal SQL keeps the select and GROUP BY expressions identical; bound parameters would
+    # render as distinct placeholders that PostgreSQL refuses to match.
+    if dialect_name == "sqlite":
+        modifiers = ["'weekday 0'", "'-6 days'"] if granularity == "week" else ["'start of month'"]
+        return type_coerce(func.date(EventStat.event_date, *map(literal_column, modifiers)), Date)
+    if dialect_name == "postgresql":
+        return cast(func.date_trunc(literal_column(f"'{granularity}'"), EventStat.event_date), Date)
+    return None
+
+
+def _bucket_start(event_date: date, granularity: RollupGranularity) -> date:
+    if granularity == "week":
+        return event_date - timedelta(days=event_date.weekday())
+    if granularity == "month":
+        return event_date.replace(day=1)
+    return event_date
+
+
+def _stats_rollup_query(
+    dialect_name: str,
+    granularity: RollupGranularity,
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    event_type: Optional[str] = None,
+) -> Select:
+    # Dialects without date bucketing functions group per day and are re-bucketed in Python.
+    bucket = _rollup_bucket(dialect_name, granularity)
+    if bucket is None:
+        bucket = EventStat.event_date
+    bucket = bucket.label("bucket_start")
+
+    stmt = (
+        select(bucket, EventStat.event_type, func.sum(EventStat.count).label("count"))
+        .group_by(bucket, EventStat.event_type)
+        .order_by(bucket, EventStat.event_type)
+    )
+    if date_from is not None:
+        stmt = stmt.where(EventStat.event_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(EventStat.event_date <= date_to)
+    if event_type is not None:
+        stmt = stmt.where(EventStat.event_type == event_type)
+    return stmt
+
+
+def _build_rollup(
+    rows: Iterable[Tuple[date, str, int]],
+    granularity: RollupGranularity,
+) -> schemas.StatsRollupOut:
+    buckets: Dict[Tuple[date, str], int] = {}
+    totals: Counter[str] = Counter()
+    for bucket_start, event_type, count in rows:
+        key = (_bucket_start(bucket_start, granularity), event_type)
+        buckets[key] = buckets.get(key, 0) + count
+        totals[event_type] += count
+    return schemas.StatsRollupOut(
+        granularity=granularity,
+        buckets=[
+            schemas.StatsRollupBucketOut(bucket_start=bucket_start, event_type=event_type, count=count)
+            for (bucket_start, event_type), count in sorted(buckets.items())
+        ],
+        totals=dict(sorted(totals.items())),
+        total=sum(totals.values()),
+    )
+
+
+def _check_rollup_range(date_from: Optional[date], date_to: Optional[date]) -> None:
+    if date_from is not None and date_to is not None and date_from > date_to:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="'from' must not be after 'to'")
+
+
+def stats_rollup(
+    request: Request,
+    response: Response = None,
+    granularity: Annotated[RollupGranularity, Query()] = "day",
+    date_from: Annotated[Optional[date], Query(alias="from")] = None,
+    date_to: Annotated[Optional[date], Query(alias="to")] = None,
+    event_type: Annotated[Optional[str], Query(max_length=64)] = None,
+    _: dict = Depends(verify_jwt),
+    db: Session = Depends(get_db),
+) -> schemas.StatsRollupOut:
+    _check_stats_rate_limit(request, response)
+    _check_rollup_range(date_from, date_to)
+    stmt = _stats_rollup_query(db.get_bind().dialect.name, granularity, date_from, date_to, event_type)
+    return _build_rollup(db.execute(stmt).all(), granularity)
+
+
+async def stats_rollup_async(
+    request: Request,
+    response: Response = None,
+    granularity: Annotated[RollupGranularity, Query()] = "day",
+    date_from: Annotated[Optional[date], Query(alias="from")] = None,
+    date_to: Annotated[Optional[date], Query(alias="to")] = None,
+    event_type: Annotated[Optional[str], Query(max_length=64)] = None,
+    _: dict = Depends(verify_jwt),
+    db: AsyncSession = Depends(get_async_db),
+) -> schemas.StatsRollupOut:
+    await _check_stats_rate_limit_async(request, response)
+    _check_rollup_range(date_from, date_to)
+    stmt = _stats_rollup_query(db.bind.dialect.name, granularity, date_from, date_to, event_type)
+    return _build_rollup((await db.execute(stmt)).all(), granularity)
+
+
+app.get("/stats/rollup", response_model=schemas.StatsRollupOut)(
+    stats_rollup_async if ASYNC_DATABASE_ENABLED else stats_rollup
+)
+
+
+def _unique_users_query(
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,
+    event_type: Optional[str] = None,
+) -> Select:
+    stmt = (
+        select(EventStat.event_type, EventStat.event_date, EventStat.user_sketch)
+        .where(EventStat.user_sketch.is_not(None))
+        .order_by(EventStat.event_type, EventStat.event_date)
+    )
+    if date_from is not None:
+        stmt = stmt.where(EventStat.event_date >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(EventStat.event_date <= date_to)
+    if event_type is not None:
+        stmt = stmt.where(EventStat.event_type == event_type)
+    return stmt
+
+
+class UniqueUsersAccumulator:
+    """Merges daily sketches into buckets and per-type totals as rows stream in.
+
+    Rows must arrive ordered by event type and day, so only the open bucket and the running
+    total of the current event type are held: memory stays constant per key however long the
+    range. The sync and async endpoints feed it from the same streamed query.
+    """
+
+    def __init__(self, granularity: RollupGranularity) -> None:
+        self._granularity = granularity
+        self._buckets: List[schemas.UniqueUsersBucketOut] = []
+        self._totals: Dict[str, int] = {}
+        self._event_type: Optional[str] = None
+        self._total = HyperLogLog()
+        self._bucket_start: Optional[date] = None
+        self._bucket: Optional[HyperLogLog] = None
+
+    def add(self, event_type: str, event_date: date, sketch: bytes) -> None:
+        bucket_start = _bucket_start(event_date, self._granularity)
+        day = HyperLogLog.from_bytes(sketch)
+        if event_type != self._event_type:
+            self._close_event_type()
+            self._event_type = event_type
+            self._total = HyperLogLog()
+        elif bucket_start == self._bucket_start and self._bucket is not None:
+            self._bucket.merge(day)
+            return
+        else:
+            self._close_bucket()
+        self._bucket_start, self._bucket = bucket_start, day
+
+    def _close_bucket(self) -> None:
+        if self._bucket is None:
+            return
+        self._total.merge(self._bucket)
+        self._buckets.append(
+            schemas.UniqueUsersBucketOut(
+                bucket_start=self._bucket_start,
+                event_type=self._event_type,
+                unique_users=self._bucket.estimate(),
+            )
+        )
+        self._bucket = None
+
+    def _close_event_type(self) -> None:
+        self._close_bucket()
+        if self._event_type is not None:
+            self._totals[self._event_type] = self._total.estimate()
+
+    def result(self) -> schemas.UniqueUsersOut:
+        self._close_event_type()
+        self._event_type = None
+        buckets = sorted(self._buckets, key=lambda bucket: (bucket.bucket_start, bucket.event_type))
+        return schemas.UniqueUsersOut(
+            granularity=self._granularity,
+            buckets=buckets,
+            totals=self._totals,
+            relative_error=round(RELATIVE_ERROR, 4),
+        )
+
+
+def stats_unique_users(
+    request: Request,
+    response: Response = None,
+    granularity: Annotated[RollupGranularity, Query()] = "day",
+    date_from: Annotated[Optional[date], Query(alias="from")] = None,
+    date_to: Annotated[Optional[date], Query(alias="to")] = None,
+    event_type: Annotated[Optional[str], Query(max_length=64)] = None,
+    _: dict = Depends(verify_jwt),
+    db: Session = Depends(get_db),
+) -> schemas.UniqueUsersOut:
+    _check_stats_rate_limit(request, response)
+    _check_rollup_range(date_from, date_to)
+    stmt = _unique_users_query(date_from, date_to, event_type).execution_options(yield_per=500)
+    accumulator = UniqueUsersAccumulator(granularity)
+    for row in db.execute(stmt):
+        accumulator.add(*row)
+    return accumulator.result()
+
+
+async def stats_unique_users_async(
+    request: Request,
+    response: Response = None,
+    granularity: Annotated[RollupGranularity, Query()] = "day",
+    date_from: Annotated[Optional[date], Query(alias="from")] = None,
+    date_to: Annotated[Optional[date], Query(alias="to")] = None,
+    event_type: Annotated[Optional[str], Query(max_length=64)] = None,
+    _: dict = Depends(verify_jwt),
+    db: AsyncSession = Depends(get_async_db),
+) -> schemas.UniqueUsersOut:
+    await _check_stats_rate_limit_async(request, response)
+    _check_rollup_range(date_from, date_to)
+    stmt = _unique_users_query(date_from, date_to, event_type).execution_options(yield_per=500)
+    accumulator = UniqueUsersAccumulator(granularity)
+    async for row in await db.stream(stmt):
+        accumulator.add(*row)
+    return accumulator.result()
+
+
+app.get("/stats/unique", response_model=schemas.UniqueUsersOut)(
+    stats_unique_users_async if ASYNC_DATABASE_ENABLED else stats_unique_users
+)
+
+
+@app.get("/stats/cache", response_model=schemas.StatsCacheOut)
+def stats_cache_info(_: dict = Depends(verify_jwt)) -> schemas.StatsCacheOut:
+    return schemas.StatsCacheOut(**_stats_cache.snapshot())
+
+
+@app.get("/archive/counts", response_model=schemas.ArchiveCountsOut)
+def archive_counts(
+    created_from: Annotated[Optional[datetime], Query(alias="from")] = None,
+    created_to: Annotated[Optional[datetime], Query(alias="to")] = None,
+    _: dict = Depends(verify_jwt),
+) -> schemas.ArchiveCountsOut:
+    if _event_archive is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Event archive is not configured")
+    counts = _event_archive.count_by_type(
+        _naive_utc(created_from) if created_from is not None else None,
+        _naive_utc(created_to) if created_to is not None else None,
+    )
+    return schemas.ArchiveCountsOut(counts=counts, total=sum(counts.values()))
+
+
+@app.get("/ingest/admission", response_model=schemas.AdmissionOut)
+def ingest_admission_info(_: dict = Depends(verify_jwt)) -> schemas.AdmissionOut:
+    return schemas.AdmissionOut(**_ingest_admission.snapshot())
 
-    offset = (page - 1) * page_size
-    stmt: Select[EventStat] = (
-        select(EventStat)
-        .order_by(EventStat.event_date.desc(), EventStat.event_type.asc())
-        .offset(offset)
-        .limit(page_size)
+
+def _pool_connections() -> Dict[Tuple[str, ...], float]:
+    pool = engine.pool
+    states = {}
+    for state, attribute in (("checked_out", "checkedout"), ("idle", "checkedin"), ("overflow", "overflow")):
+        reader = getattr(pool, attribute, None)
+        if reader is not None:
+            states[(state,)] = max(reader(), 0)
+    return states
+
+
+def _nonce_counter(name: str) -> Dict[Tuple[str, ...], float]:
+    # Evictions and rejections only exist for the in-memory cache; other backends omit them.
+    value = nonce_cache_stats().get(name)
+    return {} if value is None else {(): value}
+
+
+def _register_gauges() -> None:
+    # Callbacks read the module globals at scrape time, so they follow reset_application_state().
+    for gauge in (
+        Gauge(
+            "ingestion_db_pool_connections",
+            "Connections of the sync engine pool by state.",
+            _pool_connections,
+            ("state",),
+        ),
+        Gauge(
+            "ingestion_nonce_cache_size",
+            "Nonces held for replay protection.",
+            lambda: {(): nonce_cache_size()},
+        ),
+        Gauge(
+            "ingestion_nonce_cache_expirations_total",
+            "Nonces purged after their token expired.",
+            lambda: _nonce_counter("expirations"),
+            kind="counter",
+        ),
+        Gauge(
+            "ingestion_nonce_cache_evictions_total",
+            "Live nonces dropped to make room (overflow policy 'evict').",
+            lambda: _nonce_counter("evictions"),
+            kind="counter",
+        ),
+        Gauge(
+            "ingestion_nonce_cache_rejections_total",
+            "Tokens refused with 503 because the nonce cache was full (overflow policy 'reject').",
+            lambda: _nonce_counter("rejections"),
+            kind="counter",
+        ),
+        Gauge(
+            "ingestion_ingest_in_flight",
+            "Ingest requests currently being processed.",
+            lambda: {(): _ingest_admission.in_flight},
+        ),
+        Gauge(
+            "ingestion_ingest_queued",
+            "Ingest requests waiting for a slot.",
+            lambda: {(): _ingest_admission.queued},
+        ),
+        Gauge(
+            "ingestion_ingest_shed_total",
+            "Ingest requests rejected with 503 since startup.",
+            lambda: {(): _ingest_admission.shed},
+            kind="counter",
+        ),
+        Gauge(
+            "ingestion_stats_buffer_pending",
+            "Buffered write-behind stat increments.",
+            lambda: {(): _stats_buffer.pending_events},
+        ),
+    ):
+        REGISTRY.register(gauge)
+
+
+if _metrics_enabled:
+    _register_gauges()
+
+    @app.get("/metrics", include_in_schema=False)
+    def render_metrics() -> Response:
+        return Response(REGISTRY.render(), media_type=METRICS_CONTENT_TYPE)
+
+
+ExportFormat = Literal["ndjson", "csv"]
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+
+def _naive_utc(value: datetime) -> datetime:
+    # created_at is stored as naive UTC.
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _export_events_query(
+    created_from: Optional[datetime],
+    created_to: Optional[datetime],
+    event_type: Optional[str],
+) -> Select:
+    # Plain columns instead of ORM entities: nothing is added to an identity map, so memory
+    # stays flat however many rows are exported.
+    stmt = select(
+        Event.id,
+        Event.event_type,
+        Event.user_id,
+        Event.created_at,
+        Event.anonymized,
+        Event.payload,
+        Event.metadata_json,
+    ).order_by(Event.created_at, Event.id)
+    if created_from is not None:
+        stmt = stmt.where(Event.created_at >= _naive_utc(created_from))
+    if created_to is not None:
+        stmt = stmt.where(Event.created_at < _naive_utc(created_to))
+    if event_type is not None:
+        stmt = stmt.where(Event.event_type == event_type)
+    return stmt
+
+
+def _export_stats_query(
+    date_from: Optional[date],
+    date_to: Optional[date],
+    event_type_prefix: Optional[str],
+) -> Select:
+    stmt = select(EventStat.event_type, EventStat.event_date, EventStat.count).order_by(
+        EventStat.event_date, EventStat.event_type
+    )
+    return _filter_stats(stmt, date_from, date_to, event_type_prefix)
+
+
+def _event_ndjson_line(row) -> str:
+    # payload/metadata are stored as JSON text written by this service, so they are embedded
+    # verbatim rather than parsed and re-encoded for every row.
+    return (
+        f'{{"id":{row.id},"event_type":{jsoncodec.dumps(row.event_type)},'
+        f'"user_id":{jsoncodec.dumps(row.user_id)},'
+        f'"created_at":"{row.created_at.isoformat()}","anonymized":{"true" if row.anonymized else "false"},'
+        f'"payload":{row.payload or "{}"},"metadata":{row.metadata_json or "null"}}}\n'
+    )
+
+
+def _event_csv_row(row) -> tuple:
+    return (*row[:3], row.created_at.isoformat(), *row[4:])
+
+
+def _stat_ndjson_line(row) -> str:
+    return jsoncodec.dumps(
+        {"event_type": row.event_type, "event_date": row.event_date.isoformat(), "count": row.count}
+    ) + "\n"
+
+
+def _csv_text(rows: Iterable[Sequence]) -> str:
+    buffer = io.StringIO()
+    csv.writer(buffer).writerows(rows)
+    return buffer.getvalue()
+
+
+@dataclass(frozen=True)
+class ExportLayout:
+    """How one export type renders its rows as NDJSON lines or CSV records."""
+
+    name: str
+    columns: Tuple[str, ...]
+    ndjson_line: Callable[[Any], str]
+    csv_row: Callable[[Any], Sequence]
+
+
+EVENT_EXPORT = ExportLayout(
+    "events",
+    ("id", "event_type", "user_id", "created_at", "anonymized", "payload", "metadata"),
+    _event_ndjson_line,
+    _event_csv_row,
+)
+STAT_EXPORT = ExportLayout("event_stats", ("event_type", "event_date", "count"), _stat_ndjson_line, tuple)
+
+
+def _stream_export(
+    stmt: Select,
+    layout: ExportLayout,
+    export_format: ExportFormat,
+    compress: bool,
+) -> Iterator[bytes]:
+    """Yield encoded export chunks from a server-side cursor, optionally gzip-compressed."""
+
+    compressor = zlib.compressobj(wbits=31) if compress else None
+
+    def encode(text: str) -> bytes:
+        data = text.encode()
+        return compressor.compress(data) if compressor is not None else data
+
+    # The response is streamed after request dependencies have been torn down, so the
+    # generator owns its session for the lifetime of the stream.
+    with SessionLocal() as db:
+        if export_format == "csv":
+            yield encode(_csv_text([layout.columns]))
+        result = db.execute(stmt.execution_options(yield_per=_export_chunk_size))
+        for rows in result.partitions():
+            if export_format == "ndjson":
+                yield encode("".join(map(layout.ndjson_line, rows)))
+            else:
+                yield encode(_csv_text(map(layout.csv_row, rows)))
+    if compressor is not None:
+        yield compressor.flush()
+
+
+def _export_response(
+    stmt: Select,
+    layout: ExportLayout,
+    export_format: ExportFormat,
+    compress: bool,
+) -> StreamingResponse:
+    headers = {"Content-Disposition": f'attachment; filename="{layout.name}.{export_format}"'}
+    if compress:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        _stream_export(stmt, layout, export_format, compress),
+        media_type=EXPORT_MEDIA_TYPES[export_format],
+        headers=headers,
     )
-    stats = db.execute(stmt).scalars().all()
-    return [schemas.EventStatOut.from_orm(stat) for stat in stats]
+
+
+@app.get("/export/events", response_class=StreamingResponse)
+def export_events(
+    export_format: Annotated[ExportFormat, Query(alias="format")] = "ndjson",
+    created_from: Annotated[Optional[datetime], Query(alias="from")] = None,
+    created_to: Annotated[Optional[datetime], Query(alias="to")] = None,
+    event_type: Annotated[Optional[str], Query(max_length=64)] = None,
+    gzip: bool = False,
+    _: dict = Depends(verify_jwt),
+) -> StreamingResponse:
+    stmt = _export_events_query(created_from, created_to, event_type)
+    return _export_response(stmt, EVENT_EXPORT, export_format, gzip)
+
+
+@app.get("/export/stats", response_class=StreamingResponse)
+def export_stats(
+    export_format: Annotated[ExportFormat, Query(alias="format")] = "ndjson",
+    date_from: Annotated[Optional[date], Query(alias="from")] = None,
+    date_to: Annotated[Optional[date], Query(alias="to")] = None,
+    event_type_prefix: Annotated[Optional[str], Query(max_length=64)] = None,
+    gzip: bool = False,
+    _: dict = Depends(verify_jwt),
+) -> StreamingResponse:
+    stmt = _export_stats_query(date_from, date_to, event_type_prefix)
+    return _export_response(stmt, STAT_EXPORT, export_format, gzip)
+
+
+@app.on_event("startup")
+async def log_database_settings() -> None:
+    logger.info("Database engine settings: %s", await asyncio.to_thread(describe_engine, engine))
+
+
+@app.on_event("startup")
+async def warm_signing_keys() -> None:
+    global _jwks_refresh_task
+    if not os.environ.get("INGESTION_JWT_JWKS_URL"):
+        logger.warning("INGESTION_JWT_JWKS_URL is not set; skipping JWKS prefetch")
+        return
+    # Fetch keys before serving traffic so the first request never waits on the JWKS host.
+    if not await asyncio.to_thread(prefetch_signing_keys):
+        logger.warning("Starting without signing keys; the background refresh will keep retrying")
+    if _jwks_refresh_task is None:
+        _jwks_refresh_task = asyncio.get_running_loop().create_task(jwks_refresh_worker())
 
 
 @app.on_event("startup")
 async def apply_retention_policy() -> None:
     _start_retention_worker()
+    _start_stats_flush_worker()
     # Run once on startup to ensure old data is purged immediately.
     await _run_retention_cycle()
 
 
 @app.on_event("shutdown")
 async def stop_retention_policy() -> None:
-    global _retention_task
-    task = _retention_task
-    if task is None:
-        return
-    task.cancel()
-    with suppress(asyncio.CancelledError):
-        await task
+    global _retention_task, _stats_flush_task, _stats_flush_loop, _stats_flush_requested
+    for task in (_retention_task, _stats_flush_task):
+        if task is None:
+            continue
+        task.cancel()
+        with suppress(asyncio.CancelledError):
+            await task
     _retention_task = None
+    _stats_flush_task = None
+    _stats_flush_loop = None
+    _stats_flush_requested = None
+    # Drain whatever the write-behind buffer still holds so shutdown loses no counts.
+    await _run_stats_flush()
+
+
+@app.on_event("shutdown")
+async def stop_jwks_refresh() -> None:
+    global _jwks_refresh_task
+    if _jwks_refresh_task is not None:
+        _jwks_refresh_task.cancel()
+        with suppress(asyncio.CancelledError):
+            await _jwks_refresh_task
+        _jwks_refresh_task = None
+
+
+@app.on_event("shutdown")
+async def dispose_async_engine() -> None:
+    from . import database
+
+    if database.async_engine is not None:
+        await database.async_engine.dispose()
 
 
 def reset_application_state() -> None:
     """Reset mutable globals for test isolation."""
 
-    global _stats_rate_limiter
+    global _stats_rate_limiter, _stats_buffer, _stats_cache, _recent_events, _ingest_admission
+    global _user_sketches
     _stats_rate_limiter = _get_rate_limiter()
+    _stats_cache = _get_stats_cache()
+    _recent_events = _get_recent_event_cache()
+    _ingest_admission = _get_admission_controller()
+    _stats_buffer = StatsBuffer(_stats_flush_threshold)
+    _user_sketches = _get_user_sketch_cache()
@@ -0,0 +1,331 @@
+"""In-process metrics rendered in the Prometheus text exposition format."""
+from __future__ import annotations
+
+import math
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Request and database stages are mostly sub-millisecond; the upper buckets catch stalls.
+DEFAULT_BUCKETS = (
+    0.0001,
+    0.00025,
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+LabelValues = Tuple[str, ...]
+
+
+class _ShardedMetric:
+    """Base for metrics whose hot path writes only thread-local state.
+
+    Each thread gets its own shard the first time it records a value, which is the only
+    moment the registry lock is taken. Collection sums the shards; it may miss an
+    observation that is in progress, which is acceptable for monitoring.
+    """
+
+    kind = ""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str] = ()) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._local = threading.local()
+        # One accumulator dict per thread; only its owning thread ever writes to it.
+        self._shards: List[Dict[LabelValues, List[float]]] = []
+        self._lock = threading.Lock()
+
+    def _new_shard(self) -> Dict[LabelValues, List[float]]:
+        shard: Dict[LabelValues, List[float]] = {}
+        with self._lock:
+            self._shards.append(shard)
+        self._local.values = shard
+        return shard
+
+    def _width(self) -> int:
+        raise NotImplementedError
+
+    def _merged(self) -> Dict[LabelValues, List[float]]:
+        with self._lock:
+            shards = list(self._shards)
+        merged: Dict[LabelValues, List[float]] = {}
+        for shard in shards:
+            for labels, values in list(shard.items()):
+                total = merged.setdefault(labels, [0.0] * self._width())
+                for index, value in enumerate(values):
+                    total[index] += value
+        return merged
+
+    def _label_text(self, labels: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+        return _label_text(self.label_names, labels, extra)
+
+    def _header(self) -> List[str]:
+        return _header(self.name, self.documentation, self.kind)
+
+    def render(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_ShardedMetric):
+    """Monotonic total; by convention ``name`` ends in ``_total``."""
+
+    kind = "counter"
+
+    def _width(self) -> int:
+        return 1
+
+    def inc(self, *labels: str, amount: float = 1.0) -> None:
+        try:
+            values = self._local.values
+        except AttributeError:
+            values = self._new_shard()
+        slot = values.get(labels)
+        if slot is None:
+            values[labels] = [amount]
+        else:
+            slot[0] += amount
+
+    def value(self, *labels: str) -> float:
+        return self._merged().get(labels, [0.0])[0]
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, (total,) in sorted(self._merged().items()):
+            lines.append(f"{self.name}{self._label_text(labels)} {_number(total)}")
+        return lines
+
+
+class Histogram(_ShardedMetric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        label_names: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        super().__init__(name, documentation, label_names)
+        self.buckets = tuple(sorted(buckets))
+
+    def _width(self) -> int:
+        # One slot per finite bucket, one for +Inf, then the sum.
+        return len(self.buckets) + 2
+
+    def observe(self, value: float, *labels: str) -> None:
+        try:
+            values = self._local.values
+        except AttributeError:
+            values = self._new_shard()
+        slot = values.get(labels)
+        if slot is None:
+            slot = values[labels] = [0.0] * self._width()
+        slot[bisect_left(self.buckets, value)] += 1
+        slot[-1] += value
+
+    def time(self, *labels: str) -> "_Timer":
+        """Context manager observing the duration of its block."""
+
+        return _Timer(self, labels)
+
+    def count(self, *labels: str) -> int:
+        slot = self._merged().get(labels)
+        return int(sum(slot[:-1])) if slot is not None else 0
+
+    def render(self) -> List[str]:
+        lines = self._header()
+        for labels, slot in sorted(self._merged().items()):
+            cumulative = 0.0
+            for bound, hits in zip(self.buckets + (math.inf,), slot[:-1]):
+                cumulative += hits
+                bucket_labels = self._label_text(labels, ("le", "+Inf" if bound == math.inf else repr(bound)))
+                lines.append(f"{self.name}_bucket{bucket_labels} {_number(cumulative)}")
+            lines.append(f"{self.name}_sum{self._label_text(labels)} {repr(slot[-1])}")
+            lines.append(f"{self.name}_count{self._label_text(labels)} {_number(cumulative)}")
+        return lines
+
+
+class _Timer:
+    # A plain class rather than @contextmanager: this sits on every request path.
+    __slots__ = ("_histogram", "_labels", "_started")
+
+    def __init__(self, histogram: Histogram, labels: LabelValues) -> None:
+        self._histogram = histogram
+        self._labels = labels
+
+    def __enter__(self) -> None:
+        self._started = time.perf_counter()
+
+    def __exit__(self, *exc_info) -> None:
+        self._histogram.observe(time.perf_counter() - self._started, *self._labels)
+
+
+class Gauge:
+    """Value read at collection time from ``callback``, which returns ``{labels: value}``.
+
+    Pass ``kind="counter"`` for monotonic totals that are kept elsewhere (e.g. a shed count).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        documentation: str,
+        callback: Callable[[], Dict[LabelValues, float]],
+        label_names: Sequence[str] = (),
+        kind: str = "gauge",
+    ) -> None:
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self.kind = kind
+        self._callback = callback
+
+    def render(self) -> List[str]:
+        lines = _header(self.name, self.documentation, self.kind)
+        for labels, value in sorted(self._callback().items()):
+            lines.append(f"{self.name}{_label_text(self.label_names, labels)} {_number(value)}")
+        return lines
+
+
+def _header(name: str, documentation: str, kind: str) -> List[str]:
+    return [f"# HELP {name} {documentation}", f"# TYPE {name} {kind}"]
+
+
+def _label_text(names: Sequence[str], values: LabelValues, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(zip(names, values))
+    if extra is not None:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value: float) -> str:
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+class Registry:
+    def __init__(self) -> None:
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics[metric.name] = metric
+        return metric
+
+    def unregister(self, name: str) -> None:
+        with self._lock:
+            self._metrics.pop(name, None)
+
+    def metrics(self) -> Iterable:
+        with self._lock:
+            return list(self._metrics.values())
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self.metrics():
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.register(
+    Histogram(
+        "ingestion_stage_duration_seconds",
+        "Time spent in individual request stages.",
+        ("stage",),
+    )
+)
+REQUESTS = REGISTRY.register(
+    Counter(
+        "ingestion_http_requests_total",
+        "HTTP requests by route and status code.",
+        ("method", "path", "status"),
+    )
+)
+REQUEST_SECONDS = REGISTRY.register(
+    Histogram(
+        "ingestion_http_request_duration_seconds",
+        "End-to-end HTTP request latency.",
+        ("method", "path"),
+    )
+)
+RETENTION_SECONDS = REGISTRY.register(
+    Histogram(
+        "ingestion_retention_cycle_duration_seconds",
+        "Duration of retention jobs.",
+        ("job",),
+        buckets=(0.01, 0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0),
+    )
+)
+RETENTION_ROWS = REGISTRY.register(
+    Counter("ingestion_retention_rows_total", "Rows processed by retention jobs.", ("job",))
+)
+
+
+def stage_timer(stage: str):
+    """Context manager recording the duration of one request stage."""
+
+    return STAGE_SECONDS.time(stage)
+
+
+class MetricsMiddleware:
+    """ASGI middleware counting requests by route template and status code, and timing them.
+
+    Routes are labelled by their path template (``/stats``), never the raw URL, so unknown or
+    parameterised URLs cannot blow up the number of series.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self._paths: Optional[Dict[object, str]] = None
+
+    def _route_path(self, scope) -> str:
+        if self._paths is None:
+            routes = getattr(scope.get("app"), "routes", ())
+            self._paths = {route.endpoint: route.path for route in routes if hasattr(route, "endpoint")}
+        return self._paths.get(scope.get("endpoint"), "unmatched")
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status_code = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            # The router records the matched endpoint in the shared scope.
+            path = self._route_path(scope)
+            REQUESTS.inc(scope["method"], path, str(status_code))
+            REQUEST_SECONDS.observe(time.perf_counter() - started, scope["method"], path)
@@ -3,28 +3,129 @@ from __future__ import annotations
 
 from datetime import datetime
 
-from sqlalchemy import Boolean, Column, Date, DateTime, Integer, String, Text
-from sqlalchemy.orm import declarative_base
+from sqlalchemy import (
+    Boolean,
+    Column,
+    Date,
+    DateTime,
+    Index,
+    Integer,
+    LargeBinary,
+    String,
+    Text,
+    UniqueConstraint,
+    cast,
+)
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import declarative_base, deferred
+from sqlalchemy.types import TypeDecorator, UserDefinedType
 
 Base = declarative_base()
 
 
+class _JSONBText(UserDefinedType):
+    """PostgreSQL ``JSONB`` column that is written from, and read back as, JSON text.
+
+    The casts happen in SQL, so the driver never decodes documents into Python objects.
+    """
+
+    cache_ok = True
+
+    def get_col_spec(self, **kw) -> str:
+        return "JSONB"
+
+    def bind_expression(self, bindvalue):
+        return cast(bindvalue, JSONB)
+
+    def column_expression(self, colexpr):
+        return cast(colexpr, Text)
+
+
+class JSONText(TypeDecorator):
+    """JSON document the application handles as already encoded text.
+
+    Stored natively as ``JSONB`` on PostgreSQL, where it is validated and compacted by the
+    server; other databases keep it as ``TEXT``.
+    """
+
+    impl = Text
+    cache_ok = True
+
+    def load_dialect_impl(self, dialect):
+        if dialect.name == "postgresql":
+            return _JSONBText()
+        return dialect.type_descriptor(Text())
+
+
 class Event(Base):
     __tablename__ = "events"
 
     id = Column(Integer, primary_key=True, index=True)
     event_type = Column(String(64), index=True, nullable=False)
     user_id = Column(String(255), nullable=True)
-    payload = Column(Text, nullable=False, default="{}")
-    metadata_json = Column("metadata", Text, nullable=True)
+    payload = Column(JSONText, nullable=False, default="{}")
+    metadata_json = Column("metadata", JSONText, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow, nullable=False, index=True)
     anonymized = Column(Boolean, default=False, nullable=False)
+    # Optional client-supplied identifier that makes retried submissions idempotent.
+    event_id = Column(String(255), nullable=True)
+
+
+# Retention only ever looks for events that still need anonymizing; a partial index keeps
+# that lookup proportional to the pending rows instead of the whole table.
+Index(
+    "ix_events_pending_retention",
+    Event.created_at,
+    Event.id,
+    sqlite_where=Event.anonymized.is_(False),
+    postgresql_where=Event.anonymized.is_(False),
+)
+
+# NULLs are distinct in unique indexes on SQLite and PostgreSQL, so events without an id are unaffected.
+Index("uq_events_event_id", Event.event_id, unique=True)
 
 
 class EventStat(Base):
     __tablename__ = "event_stats"
+    __table_args__ = (UniqueConstraint("event_type", "event_date", name="uq_event_stats_type_date"),)
 
     id = Column(Integer, primary_key=True, index=True)
     event_type = Column(String(64), index=True, nullable=False)
     event_date = Column(Date, index=True, nullable=False)
     count = Column(Integer, default=0, nullable=False)
+    # HyperLogLog sketch of the hashed user ids seen for this key (see app/sketches.py).
+    # Deferred so that listing stats never loads it.
+    user_sketch = deferred(Column(LargeBinary, nullable=True))
+
+
+# Serves GET /stats ordering (event_date desc, event_type asc) and its keyset continuation.
+Index("ix_event_stats_date_type", EventStat.event_date.desc(), EventStat.event_type)
+
+
+class RetentionState(Base):
+    """High-water marks that let periodic jobs resume where the previous run stopped."""
+
+    __tablename__ = "retention_state"
+
+    name = Column(String(64), primary_key=True)
+    watermark = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, nullable=False)
+
+
+class RateLimitCounter(Base):
+    """Per-key request counts for fixed windows, read as a sliding window by the rate limiter."""
+
+    __tablename__ = "rate_limit_counters"
+
+    key = Column(String(255), primary_key=True)
+    window_start = Column(Integer, primary_key=True, index=True)
+    count = Column(Integer, nullable=False, default=0)
+
+
+class UsedNonce(Base):
+    """Token nonces already accepted, shared by every worker that uses the same database."""
+
+    __tablename__ = "used_nonces"
+
+    nonce = Column(String(255), primary_key=True)
+    expires_at = Column(DateTime, nullable=False, index=True)
@@ -2,7 +2,7 @@
 from __future__ import annotations
 
 from datetime import date, datetime
-from typing import Any, Dict, Optional
+from typing import Any, Dict, List, Literal, Optional
 
 from pydantic import BaseModel, Field
 
@@ -15,10 +15,16 @@ class EventIn(BaseModel):
         default=None,
         description="Optional metadata about the event, such as kiosk ID or location.",
     )
+    event_id: Optional[str] = Field(
+        None,
+        max_length=255,
+        description="Client-generated unique id; resubmitting it returns the original event",
+    )
 
 
 class EventOut(BaseModel):
     id: int
+    event_id: Optional[str] = None
     event_type: str
     created_at: datetime
     anonymized: bool
@@ -27,6 +33,20 @@ class EventOut(BaseModel):
         orm_mode = True
 
 
+class EventBatchItemResult(BaseModel):
+    index: int = Field(..., description="Position of the item in the submitted batch")
+    status: Literal["created", "duplicate", "rejected"]
+    event: Optional[EventOut] = None
+    error: Optional[str] = Field(None, description="Validation error for rejected items")
+
+
+class EventBatchOut(BaseModel):
+    accepted: int
+    duplicates: int = Field(0, description="Accepted items whose event_id was already stored")
+    rejected: int
+    results: List[EventBatchItemResult]
+
+
 class EventStatOut(BaseModel):
     event_type: str
     event_date: date
@@ -34,3 +54,54 @@ class EventStatOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class StatsRollupBucketOut(BaseModel):
+    bucket_start: date = Field(..., description="First day of the day, ISO week (Monday) or month bucket")
+    event_type: str
+    count: int
+
+
+class StatsRollupOut(BaseModel):
+    granularity: Literal["day", "week", "month"]
+    buckets: List[StatsRollupBucketOut]
+    totals: Dict[str, int] = Field(..., description="Per event type totals over the requested range")
+    total: int
+
+
+class UniqueUsersBucketOut(BaseModel):
+    bucket_start: date = Field(..., description="First day of the day, ISO week (Monday) or month bucket")
+    event_type: str
+    unique_users: int = Field(..., description="Approximate number of distinct users")
+
+
+class UniqueUsersOut(BaseModel):
+    granularity: Literal["day", "week", "month"]
+    buckets: List[UniqueUsersBucketOut]
+    totals: Dict[str, int] = Field(
+        ..., description="Approximate distinct users per event type over the whole requested range"
+    )
+    relative_error: float = Field(..., description="Standard error of each estimate, as a fraction")
+
+
+class StatsCacheOut(BaseModel):
+    hits: int
+    misses: int
+    entries: int
+
+
+class AdmissionOut(BaseModel):
+    in_flight: int = Field(..., description="Ingest requests currently being processed")
+    queued: int = Field(..., description="Ingest requests waiting for a slot")
+    max_in_flight: int
+    max_queue: int
+    admitted: int
+    shed: int = Field(..., description="Ingest requests rejected with 503 since startup")
+    latency_seconds: float = Field(..., description="Moving average of ingest request latency")
+    latency_target_seconds: float
+    congested: bool = Field(..., description="Background jobs are pausing to yield to ingestion")
+
+
+class ArchiveCountsOut(BaseModel):
+    counts: Dict[str, int] = Field(..., description="Archived events per event type")
+    total: int
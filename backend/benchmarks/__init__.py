@@ -0,0 +1 @@
+"""Benchmarks for the ingestion API. Run modules with ``python -m backend.benchmarks.<name>``."""
@@ -0,0 +1,111 @@
+"""Compare the sync and async database paths under concurrent load.
+
+Drives ``POST /events`` and ``GET /stats`` in-process through httpx's ASGI transport against a
+temporary SQLite file, with ``verify_jwt`` stubbed out so only the handlers and the database are
+measured. Settings are read at import, so each mode runs in its own interpreter. The pool
+defaults to SQLAlchemy's 5 + 10 overflow, the setting the README table was measured with; the
+stats cache and ingest admission control are disabled so every request reaches the database.
+Requires ``httpx`` and ``aiosqlite``.
+
+    python -m backend.benchmarks.async_db_bench --concurrency 1 16 64 --requests 400
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from typing import List, Sequence
+
+MODES = ("sync", "async")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure sync vs async handlers under concurrency")
+    parser.add_argument("--requests", type=int, default=400, help="Requests per row (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 16, 64], help="Concurrent clients")
+    parser.add_argument("--pool-size", type=int, default=5, help="INGESTION_DB_POOL_SIZE (default: %(default)s)")
+    parser.add_argument(
+        "--max-overflow", type=int, default=10, help="INGESTION_DB_MAX_OVERFLOW (default: %(default)s)"
+    )
+    parser.add_argument("--mode", choices=MODES, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+
+async def _run_row(client, mode: str, method: str, path: str, concurrency: int, total: int) -> None:
+    latencies: List[float] = []
+    errors = 0
+    gate = asyncio.Semaphore(concurrency)
+
+    async def one() -> None:
+        nonlocal errors
+        async with gate:
+            started = time.perf_counter()
+            try:
+                if method == "POST":
+                    response = await client.post(path, json={"event_type": "kiosk.viewed"})
+                else:
+                    response = await client.get(path)
+                ok = response.status_code < 300
+            except Exception:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(total)))
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] if latencies else 0.0
+    p99 = latencies[int(len(latencies) * 0.99)] if latencies else 0.0
+    print(
+        f"{mode:<6}{method + ' ' + path:<16}{concurrency:>12}{total / elapsed:>8.0f}"
+        f"{p50 * 1000:>10.1f}{p99 * 1000:>10.1f}{errors:>8}",
+        flush=True,
+    )
+
+
+async def _run_mode(mode: str, concurrency: Sequence[int], total: int) -> None:
+    # backend.app patches typing for pydantic 1 on Python 3.13, so it is imported before httpx/fastapi.
+    from backend.app import auth, main
+
+    import httpx  # noqa: E402
+
+    main.app.dependency_overrides[auth.verify_jwt] = lambda: {}
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        for method, path in (("POST", "/events"), ("GET", "/stats")):
+            for clients in concurrency:
+                await _run_row(client, mode, method, path, clients, total)
+
+
+def main() -> None:
+    args = parse_args()
+    if args.mode is not None:
+        asyncio.run(_run_mode(args.mode, args.concurrency, args.requests))
+        return
+
+    print(f"{'mode':<6}{'endpoint':<16}{'concurrency':>12}{'req/s':>8}{'p50 ms':>10}{'p99 ms':>10}{'errors':>8}")
+    for mode in MODES:
+        env = dict(
+            os.environ,
+            INGESTION_DATABASE_URL=f"sqlite:///{tempfile.mkdtemp(prefix='async-db-bench-')}/bench.db",
+            INGESTION_DATABASE_ASYNC="true" if mode == "async" else "false",
+            INGESTION_DB_POOL_SIZE=str(args.pool_size),
+            INGESTION_DB_MAX_OVERFLOW=str(args.max_overflow),
+            INGESTION_STATS_RATE_LIMIT="100000000",
+            INGESTION_STATS_CACHE_TTL_SECONDS="0",
+            INGESTION_INGEST_MAX_IN_FLIGHT="0",
+        )
+        command = [sys.executable, "-m", "backend.benchmarks.async_db_bench", "--mode", mode]
+        command += ["--requests", str(args.requests), "--concurrency", *map(str, args.concurrency)]
+        subprocess.run(command, env=env, check=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""Compare two ``loadgen`` result files.
+
+    python -m backend.benchmarks.compare before.json after.json
+"""
+from __future__ import annotations
+
+import argparse
+import json
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+# (label, path into the result, True when higher is better)
+ROWS: Tuple[Tuple[str, Tuple[str, ...], bool], ...] = (
+    ("throughput/s", ("throughput_per_second",), True),
+    ("p50 ms", ("latency_seconds", "p50"), False),
+    ("p95 ms", ("latency_seconds", "p95"), False),
+    ("p99 ms", ("latency_seconds", "p99"), False),
+    ("max ms", ("latency_seconds", "max"), False),
+    ("errors", ("errors",), False),
+)
+
+
+def _lookup(result: Dict[str, Any], path: Sequence[str]) -> Optional[float]:
+    value: Any = result
+    for key in path:
+        if not isinstance(value, dict) or key not in value:
+            return None
+        value = value[key]
+    return float(value)
+
+
+def compare(before: Dict[str, Any], after: Dict[str, Any]) -> List[str]:
+    if before.get("scenario") != after.get("scenario"):
+        raise SystemExit(f"Scenarios differ: {before.get('scenario')!r} vs {after.get('scenario')!r}")
+
+    lines = [f"{'metric':<14}{'before':>14}{'after':>14}{'change':>10}"]
+    for label, path, higher_is_better in ROWS:
+        old, new = _lookup(before, path), _lookup(after, path)
+        if old is None or new is None:
+            continue
+        scale = 1000.0 if path[0] == "latency_seconds" else 1.0
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        better = (new > old) == higher_is_better and new != old
+        marker = " *" if better else ""
+        lines.append(f"{label:<14}{old * scale:>14,.2f}{new * scale:>14,.2f}{change:>10}{marker}")
+    lines.append("* = improvement")
+    return lines
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Compare two loadgen JSON results")
+    parser.add_argument("before", type=Path)
+    parser.add_argument("after", type=Path)
+    args = parser.parse_args()
+    before = json.loads(args.before.read_text())
+    after = json.loads(args.after.read_text())
+    print("\n".join(compare(before, after)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""Benchmark the JSON work done per ingested event.
+
+Times the three places the API encodes or decodes JSON: parsing a batch body, encoding
+``payload``/``metadata`` for storage, and rendering a batch response. Each is measured with the
+previous standard-library calls and with ``backend.app.jsoncodec``, which uses orjson when it is
+installed.
+
+    python -m backend.benchmarks.json_bench --events 500 --rounds 200
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from datetime import datetime
+from typing import Callable, Dict, List
+
+# backend.app patches typing for pydantic 1 on Python 3.13, so it is imported before fastapi.
+from backend.app import jsoncodec, schemas
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse as StdlibJSONResponse  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure JSON encode/decode cost per event")
+    parser.add_argument("--events", type=int, default=500, help="Events per batch (default: %(default)s)")
+    parser.add_argument("--rounds", type=int, default=200, help="Timed batches per case (default: %(default)s)")
+    return parser.parse_args()
+
+
+def _sample_event(index: int) -> Dict:
+    return {
+        "event_type": "kiosk.checkout",
+        "user_id": f"visitor-{index % 97}",
+        "payload": {
+            "screen": "checkout",
+            "locale": "en-US",
+            "items": [{"sku": f"sku-{item}", "qty": item, "price": item * 1.25} for item in range(8)],
+            "flags": {"accessibility": True, "promo": None},
+        },
+        "metadata": {"kiosk_id": "kiosk-01", "captured_at": datetime(2026, 10, 17).isoformat(), "firmware": "4.2.1"},
+        "event_id": f"evt-{index}",
+    }
+
+
+def _per_event_us(func: Callable[[], object], rounds: int, events: int) -> float:
+    func()
+    started = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - started) / (rounds * events) * 1e6
+
+
+def main() -> None:
+    args = parse_args()
+    raw_events = [_sample_event(index) for index in range(args.events)]
+    body = json.dumps(raw_events).encode()
+    parsed = [schemas.EventIn.parse_obj(event) for event in raw_events]
+    response = schemas.EventBatchOut(
+        accepted=len(parsed),
+        rejected=0,
+        results=[
+            schemas.EventBatchItemResult(
+                index=index,
+                status="created",
+                event=schemas.EventOut(
+                    id=index,
+                    event_id=event.event_id,
+                    event_type=event.event_type,
+                    created_at=datetime(2026, 10, 17),
+                    anonymized=False,
+                ),
+            )
+            for index, event in enumerate(parsed)
+        ],
+    )
+    encoded_response = jsonable_encoder(response)
+
+    def stdlib_store() -> List:
+        return [(json.dumps(e.payload), json.dumps(e.metadata)) for e in parsed]
+
+    def codec_store() -> List:
+        return [(jsoncodec.dumps(e.payload), jsoncodec.dumps_optional(e.metadata)) for e in parsed]
+
+    cases = [
+        ("decode batch body", lambda: json.loads(body), lambda: jsoncodec.loads(body)),
+        ("encode for storage", stdlib_store, codec_store),
+        (
+            "render response",
+            lambda: StdlibJSONResponse(encoded_response).body,
+            lambda: jsoncodec.JSONResponse(encoded_response).body,
+        ),
+    ]
+
+    print(f"backend: {jsoncodec.BACKEND}; {args.events} events x {args.rounds} rounds")
+    print(f"{'stage':<20}{'stdlib us/event':>18}{'codec us/event':>17}{'speedup':>10}")
+    total_before = total_after = 0.0
+    for label, before, after in cases:
+        before_us = _per_event_us(before, args.rounds, args.events)
+        after_us = _per_event_us(after, args.rounds, args.events)
+        total_before += before_us
+        total_after += after_us
+        print(f"{label:<20}{before_us:>18.2f}{after_us:>17.2f}{before_us / after_us:>9.1f}x")
+    print(f"{'total':<20}{total_before:>18.2f}{total_after:>17.2f}{total_before / total_after:>9.1f}x")
+    stored = sum(len(p) + len(m) for p, m in stdlib_store()) / sum(len(p) + len(m) for p, m in codec_store())
+    print(f"stored payload+metadata bytes: {stored:.2f}x smaller")
+
+
+if __name__ == "__main__":
+    main()
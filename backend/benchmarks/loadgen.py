@@ -0,0 +1,377 @@
+"""Load generator for the ingestion API that reports latency percentiles and throughput as JSON.
+
+Every request carries its own RS256 token with a unique nonce, verified against a local
+JWKS stand-in, so ``verify_jwt`` runs its real code path. By default the app runs in-process
+behind httpx's ASGI transport on a temporary SQLite database; pass ``--base-url`` to drive a
+running server instead. Requires ``httpx`` and ``cryptography``.
+
+    python -m backend.benchmarks.loadgen ingest --requests 5000 --concurrency 32
+    python -m backend.benchmarks.loadgen batch --batch-size 100 --requests 500
+    python -m backend.benchmarks.loadgen stats --seed-stats-days 730 --output stats.json
+    python -m backend.benchmarks.loadgen auth --requests 5000
+    python -m backend.benchmarks.loadgen retention --seed-events 200000
+
+Compare two result files with ``python -m backend.benchmarks.compare before.json after.json``.
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+SCENARIOS = ("ingest", "batch", "stats", "auth", "retention")
+EVENT_TYPES = ("kiosk.viewed", "kiosk.scanned", "kiosk.checkout", "kiosk.error", "kiosk.idle")
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Drive the ingestion API and report latency as JSON")
+    parser.add_argument("scenario", choices=SCENARIOS)
+    parser.add_argument("--requests", type=int, default=2000, help="Measured requests (default: %(default)s)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients (default: %(default)s)")
+    parser.add_argument("--warmup", type=int, default=50, help="Unmeasured requests first (default: %(default)s)")
+    parser.add_argument("--batch-size", type=int, default=100, help="Events per batch request (batch scenario)")
+    parser.add_argument("--base-url", help="Drive a running server instead of the in-process app")
+    parser.add_argument(
+        "--jwks-port",
+        type=int,
+        default=0,
+        help="Port of the JWKS stand-in; fix it when the server's INGESTION_JWT_JWKS_URL points at it",
+    )
+    parser.add_argument("--database-url", help="Database to seed/use (default: a temporary SQLite file)")
+    parser.add_argument("--seed-events", type=int, default=0, help="Events to insert before the run")
+    parser.add_argument("--seed-stats-days", type=int, default=0, help="Days of event_stats rows to insert")
+    parser.add_argument(
+        "--env",
+        action="append",
+        default=[],
+        metavar="NAME=VALUE",
+        help="Application setting applied before the app is imported (repeatable)",
+    )
+    parser.add_argument("--label", default="", help="Free-form tag stored in the result")
+    parser.add_argument("--output", help="Write the JSON result here instead of stdout")
+    parser.add_argument("--seed", type=int, default=1, help="Random seed for generated data")
+    return parser.parse_args(argv)
+
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of already sorted values."""
+
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(fraction * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize_latencies(latencies: Sequence[float]) -> Dict[str, float]:
+    ordered = sorted(latencies)
+    return {
+        "mean": sum(ordered) / len(ordered) if ordered else 0.0,
+        "p50": percentile(ordered, 0.50),
+        "p95": percentile(ordered, 0.95),
+        "p99": percentile(ordered, 0.99),
+        "max": ordered[-1] if ordered else 0.0,
+    }
+
+
+def _git_commit() -> Optional[str]:
+    try:
+        output = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+            cwd=Path(__file__).resolve().parent,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return output.stdout.strip() or None
+
+
+def configure_environment(args: argparse.Namespace, jwks_url: str, issuer: str, audience: str) -> str:
+    """Apply app settings; must run before ``backend.app.main`` is imported."""
+
+    database_url = args.database_url or f"sqlite:///{tempfile.mkdtemp(prefix='ingestion-bench-')}/bench.db"
+    os.environ["INGESTION_DATABASE_URL"] = database_url
+    os.environ["INGESTION_JWT_JWKS_URL"] = jwks_url
+    os.environ["INGESTION_JWT_ISSUER"] = issuer
+    os.environ["INGESTION_JWT_AUDIENCE"] = audience
+    # One load generator is one client; keep the per-client stats limiter out of the way.
+    os.environ.setdefault("INGESTION_STATS_RATE_LIMIT", str(10**9))
+    os.environ.setdefault("INGESTION_METRICS_ENABLED", "false")
+    for item in args.env:
+        name, _, value = item.partition("=")
+        os.environ[name] = value
+    return database_url
+
+
+def seed_events(count: int, rng: random.Random, min_age_days: float = 0, max_age_days: float = 30) -> None:
+    from sqlalchemy import insert
+
+    from backend.app.database import engine
+    from backend.app.models import Event
+
+    now = datetime.utcnow()
+    chunk = 10_000
+    with engine.begin() as connection:
+        for start in range(0, count, chunk):
+            rows = [
+                {
+                    "event_type": rng.choice(EVENT_TYPES),
+                    "user_id": f"visitor-{rng.randrange(100_000)}",
+                    "payload": json.dumps({"screen": "welcome", "step": index}),
+                    "metadata_json": json.dumps({"kiosk_id": f"kiosk-{index % 50:02d}"}),
+                    "created_at": now - timedelta(days=rng.uniform(min_age_days, max_age_days)),
+                    "anonymized": False,
+                }
+                for index in range(start, min(start + chunk, count))
+            ]
+            connection.execute(insert(Event), rows)
+
+
+def seed_stats(days: int, rng: random.Random) -> None:
+    from sqlalchemy import insert
+
+    from backend.app.database import engine
+    from backend.app.models import EventStat
+
+    today = date.today()
+    rows = [
+        {
+            "event_type": event_type,
+            "event_date": today - timedelta(days=offset),
+            "count": rng.randrange(1, 10_000),
+        }
+        for offset in range(days)
+        for event_type in EVENT_TYPES
+    ]
+    with engine.begin() as connection:
+        connection.execute(insert(EventStat), rows)
+
+
+def _event_body(index: int, rng: random.Random) -> Dict[str, Any]:
+    return {
+        "event_type": rng.choice(EVENT_TYPES),
+        "user_id": f"visitor-{index}",
+        "payload": {"screen": "welcome", "locale": "en-US", "step": index},
+        "metadata": {"kiosk_id": f"kiosk-{index % 50:02d}"},
+    }
+
+
+RequestFactory = Callable[[Any, int, str], Awaitable[Any]]
+
+
+def build_request(args: argparse.Namespace, rng: random.Random) -> RequestFactory:
+    if args.scenario == "ingest":
+
+        async def send(client, index: int, token: str):
+            headers = {"Authorization": f"Bearer {token}"}
+            return await client.post("/events", json=_event_body(index, rng), headers=headers)
+
+    elif args.scenario == "batch":
+
+        async def send(client, index: int, token: str):
+            body = [_event_body(index * args.batch_size + offset, rng) for offset in range(args.batch_size)]
+            return await client.post("/events:batch", json=body, headers={"Authorization": f"Bearer {token}"})
+
+    elif args.scenario == "stats":
+        days = max(args.seed_stats_days, 1)
+
+        async def send(client, index: int, token: str):
+            # Mix of first pages, prefix filters and date windows, like a dashboard.
+            params: Dict[str, Any] = {"page_size": 50}
+            if index % 3 == 1:
+                params["event_type_prefix"] = "kiosk.s"
+            if index % 3 == 2:
+                start = date.today() - timedelta(days=rng.randrange(days))
+                params["from"] = start.isoformat()
+                params["to"] = (start + timedelta(days=30)).isoformat()
+            return await client.get("/stats", params=params, headers={"Authorization": f"Bearer {token}"})
+
+    elif args.scenario == "auth":
+
+        async def send(client, index: int, token: str):
+            return await client.get("/stats/cache", headers={"Authorization": f"Bearer {token}"})
+
+    else:
+        raise ValueError(f"{args.scenario!r} is not a request scenario")
+    return send
+
+
+async def drive(
+    client,
+    send: RequestFactory,
+    tokens: Sequence[str],
+    offset: int,
+    count: int,
+    concurrency: int,
+) -> Dict[str, Any]:
+    latencies: List[float] = []
+    statuses: Counter = Counter()
+    next_index = offset
+
+    async def worker() -> None:
+        nonlocal next_index
+        while next_index < offset + count:
+            index = next_index
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await send(client, index, tokens[index])
+                status = str(response.status_code)
+            except Exception as exc:  # noqa: BLE001 - a failed request is a data point
+                status = type(exc).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    errors = sum(total for status, total in statuses.items() if not status.startswith("2"))
+    return {
+        "requests": count,
+        "errors": errors,
+        "status_counts": dict(statuses),
+        "duration_seconds": elapsed,
+        "throughput_per_second": count / elapsed if elapsed > 0 else 0.0,
+        "latency_seconds": summarize_latencies(latencies),
+    }
+
+
+async def _wait_until_trusted(client, send: RequestFactory, minter, timeout: float = 60.0) -> None:
+    # The app only learns the signing key by fetching the JWKS in the background after the first
+    # unknown kid (rate limited on a long-running server), so hold off until tokens verify.
+    deadline = time.monotonic() + timeout
+    while True:
+        response = await send(client, 0, minter.mint())
+        if response.status_code != 401 or time.monotonic() > deadline:
+            return
+        await asyncio.sleep(0.2)
+
+
+async def run_requests(args: argparse.Namespace, minter, rng: random.Random) -> Dict[str, Any]:
+    import httpx
+
+    send = build_request(args, rng)
+    total = args.warmup + args.requests
+    print(f"Minting {total} tokens...", file=sys.stderr)
+    tokens = minter.mint_many(total)
+
+    if args.base_url:
+        client = httpx.AsyncClient(base_url=args.base_url, timeout=60)
+    else:
+        from backend.app.main import app
+
+        transport = httpx.ASGITransport(app=app)
+        client = httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60)
+    async with client:
+        await _wait_until_trusted(client, send, minter)
+        if args.warmup:
+            await drive(client, send, tokens, 0, args.warmup, args.concurrency)
+        return await drive(client, send, tokens, args.warmup, args.requests, args.concurrency)
+
+
+def run_retention(args: argparse.Namespace) -> Dict[str, Any]:
+    from backend.app.database import SessionLocal
+    from backend.app.main import enforce_retention_policy
+
+    chunk_latencies: List[float] = []
+    chunk_started = time.perf_counter()
+
+    def record_chunk() -> float:
+        nonlocal chunk_started
+        now = time.perf_counter()
+        chunk_latencies.append(now - chunk_started)
+        chunk_started = now
+        return 0.0
+
+    with SessionLocal() as db:
+        chunk_started = time.perf_counter()
+        result = enforce_retention_policy(db, full_sweep=True, throttle=record_chunk)
+    # The last chunk ends without a throttle call.
+    chunk_latencies.append(time.perf_counter() - chunk_started)
+    return {
+        "rows": result.rows,
+        "chunks": result.chunks,
+        "duration_seconds": result.elapsed_seconds,
+        "throughput_per_second": result.rows_per_second,
+        "latency_seconds": summarize_latencies(chunk_latencies),
+    }
+
+
+def main(argv: Optional[Sequence[str]] = None) -> Dict[str, Any]:
+    args = parse_args(argv)
+    rng = random.Random(args.seed)
+
+    from backend.benchmarks.tokens import JWKSStandIn, TokenMinter
+
+    # A fresh kid per run makes a long-running server fetch the stand-in's current key.
+    minter = TokenMinter(kid=f"benchmark-{os.getpid()}-{int(time.time())}")
+    with JWKSStandIn(minter.jwks(), port=args.jwks_port) as jwks:
+        database_url = configure_environment(args, jwks.url, minter.issuer, minter.audience)
+        if args.base_url:
+            print(
+                f"JWKS stand-in at {jwks.url}; the server needs INGESTION_JWT_JWKS_URL pointing here, "
+                f"INGESTION_JWT_ISSUER={minter.issuer} and INGESTION_JWT_AUDIENCE={minter.audience}",
+                file=sys.stderr,
+            )
+        if (args.seed_events or args.seed_stats_days) and args.base_url and not args.database_url:
+            raise SystemExit("Seeding a remote server needs --database-url for its database")
+
+        import backend.app.main  # noqa: F401  - creates the tables
+
+        seeding_started = time.perf_counter()
+        if args.scenario == "retention":
+            seed_events(args.seed_events or 100_000, rng, min_age_days=31, max_age_days=400)
+        elif args.seed_events:
+            seed_events(args.seed_events, rng)
+        if args.seed_stats_days:
+            seed_stats(args.seed_stats_days, rng)
+        seeding_seconds = time.perf_counter() - seeding_started
+
+        if args.scenario == "retention":
+            measured = run_retention(args)
+        else:
+            measured = asyncio.run(run_requests(args, minter, rng))
+
+    result = {
+        "scenario": args.scenario,
+        "label": args.label,
+        "transport": "http" if args.base_url else "asgi",
+        "started_at": datetime.utcnow().isoformat(timespec="seconds") + "Z",
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "config": {
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "warmup": args.warmup,
+            "batch_size": args.batch_size if args.scenario == "batch" else None,
+            "database": database_url.split("://", 1)[0],
+            "seed_events": args.seed_events,
+            "seed_stats_days": args.seed_stats_days,
+            "seeding_seconds": seeding_seconds,
+            "env": args.env,
+        },
+        **measured,
+    }
+    rendered = json.dumps(result, indent=2)
+    if args.output:
+        Path(args.output).write_text(rendered + "\n")
+    else:
+        print(rendered)
+    return result
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""Benchmark rate limiter ``check()`` across many distinct client keys.
+
+Compares the sliding-window limiter with the previous fixed-window limiter, which never
+evicted keys. The simulated clock advances so every key is seen once and then goes idle,
+like a stream of distinct client IPs.
+
+    python -m backend.benchmarks.rate_limiter_bench --keys 1000000
+"""
+from __future__ import annotations
+
+import argparse
+import threading
+import time
+import tracemalloc
+
+import backend.app  # noqa: F401  - applies the typing shim before FastAPI is imported
+from backend.app.main import RateLimitError, SlidingWindowRateLimiter
+
+
+class FixedWindowRateLimiter:
+    """The previous limiter: one entry per key ever seen, never evicted."""
+
+    def __init__(self, max_requests: int, window_seconds: int, clock) -> None:
+        self._max_requests = max_requests
+        self._window_seconds = window_seconds
+        self._counters: dict[str, tuple[int, float]] = {}
+        self._lock = threading.Lock()
+        self._clock = clock
+
+    def check(self, key: str) -> None:
+        now = self._clock()
+        with self._lock:
+            count, window_start = self._counters.get(key, (0, now))
+            if now - window_start >= self._window_seconds:
+                count = 0
+                window_start = now
+            if count >= self._max_requests:
+                raise RateLimitError(f"Rate limit exceeded for key {key}")
+            self._counters[key] = (count + 1, window_start)
+
+    def __len__(self) -> int:
+        return len(self._counters)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure rate limiter check() with many distinct keys")
+    parser.add_argument("--keys", type=int, default=1_000_000, help="Distinct keys to check (default: %(default)s)")
+    parser.add_argument(
+        "--keys-per-window",
+        type=int,
+        default=10_000,
+        help="Distinct keys arriving per rate-limit window (default: %(default)s)",
+    )
+    return parser.parse_args()
+
+
+def _drive(limiter, clock, keys: list, keys_per_window: int, window_seconds: int) -> float:
+    started = time.perf_counter()
+    for index, key in enumerate(keys):
+        clock[0] = index / keys_per_window * window_seconds
+        limiter.check(key)
+    return len(keys) / (time.perf_counter() - started)
+
+
+def _build(name: str, clock: list, window_seconds: int):
+    if name == "fixed window":
+        return FixedWindowRateLimiter(60, window_seconds, lambda: clock[0])
+    return SlidingWindowRateLimiter(60, window_seconds, clock=lambda: clock[0])
+
+
+def main() -> None:
+    args = parse_args()
+    window_seconds = 60
+    keys = [f"10.{i >> 16 & 255}.{i >> 8 & 255}.{i & 255}-{i}" for i in range(args.keys)]
+    results = {}
+    for name in ("fixed window", "sliding window"):
+        clock = [0.0]
+        rate = _drive(_build(name, clock, window_seconds), clock, keys, args.keys_per_window, window_seconds)
+        # A second pass under tracemalloc measures what the limiter retains.
+        clock = [0.0]
+        tracemalloc.start()
+        limiter = _build(name, clock, window_seconds)
+        _drive(limiter, clock, keys, args.keys_per_window, window_seconds)
+        memory = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        results[name] = (rate, len(limiter), memory)
+
+    print(f"{'limiter':<16}{'checks/s':>12}{'keys held':>12}{'memory (MiB)':>14}")
+    for name, (rate, held, memory) in results.items():
+        print(f"{name:<16}{rate:>12,.0f}{held:>12,}{memory / 2**20:>14.1f}")
+
+
+if __name__ == "__main__":
+    main()
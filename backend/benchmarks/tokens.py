@@ -0,0 +1,102 @@
+"""RS256 signing keys, a local JWKS endpoint, and token minting for load tests.
+
+Requires ``cryptography`` (``pip install "PyJWT[crypto]"``).
+"""
+from __future__ import annotations
+
+import json
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional
+
+import jwt
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jwt.algorithms import RSAAlgorithm
+
+# Mirrors backend.app.auth; kept literal so importing this module does not import the app.
+ALGORITHM = "RS256"
+INTEGRITY_CLAIM = "device_integrity"
+REQUIRED_INTEGRITY_VERDICT = "MEETS_DEVICE_INTEGRITY"
+
+DEFAULT_ISSUER = "https://issuer.benchmark.invalid/"
+DEFAULT_AUDIENCE = "laurel-benchmark"
+
+
+class TokenMinter:
+    """Signs tokens the API accepts: RS256, unique nonce, device integrity verdict."""
+
+    def __init__(
+        self,
+        issuer: str = DEFAULT_ISSUER,
+        audience: str = DEFAULT_AUDIENCE,
+        kid: str = "benchmark",
+        ttl_seconds: int = 3600,
+    ) -> None:
+        self.issuer = issuer
+        self.audience = audience
+        self.kid = kid
+        self.ttl_seconds = ttl_seconds
+        self._private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+
+    def jwks(self) -> Dict[str, List[Dict[str, str]]]:
+        jwk = json.loads(RSAAlgorithm.to_jwk(self._private_key.public_key()))
+        return {"keys": [{**jwk, "kid": self.kid, "use": "sig", "alg": ALGORITHM}]}
+
+    def mint(self, **overrides) -> str:
+        claims = {
+            "iss": self.issuer,
+            "aud": self.audience,
+            "exp": int(time.time()) + self.ttl_seconds,
+            "nonce": uuid.uuid4().hex,
+            INTEGRITY_CLAIM: REQUIRED_INTEGRITY_VERDICT,
+        }
+        claims.update(overrides)
+        return jwt.encode(claims, self._private_key, algorithm=ALGORITHM, headers={"kid": self.kid})
+
+    def mint_many(self, count: int) -> List[str]:
+        """Pre-mint tokens so RSA signing is not part of the measured request time."""
+
+        return [self.mint() for _ in range(count)]
+
+
+class JWKSStandIn:
+    """Serves a JWKS document over HTTP on localhost, standing in for the identity provider.
+
+    Use as a context manager; ``url`` is what ``INGESTION_JWT_JWKS_URL`` should point to.
+    """
+
+    def __init__(self, jwks: Dict, host: str = "127.0.0.1", port: int = 0) -> None:
+        body = json.dumps(jwks).encode()
+        self.requests = 0
+        stand_in = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self) -> None:  # noqa: N802 - http.server naming
+                stand_in.requests += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}/.well-known/jwks.json"
+
+    def __enter__(self) -> "JWKSStandIn":
+        self._thread = threading.Thread(target=self._server.serve_forever, name="jwks-stand-in", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self._server.shutdown()
+        self._server.server_close()
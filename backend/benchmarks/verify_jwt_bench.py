@@ -0,0 +1,83 @@
+"""Micro-benchmark of ``verify_jwt`` throughput with and without the token verdict cache.
+
+Tokens are signed with a freshly generated RSA key (requires ``cryptography``) and verified
+with the real PyJWT RS256 code path; only the JWKS lookup is replaced by an in-memory key.
+
+    python -m backend.benchmarks.verify_jwt_bench --iterations 2000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import time
+import uuid
+from types import SimpleNamespace
+from typing import Callable, Dict
+
+os.environ.setdefault("INGESTION_JWT_JWKS_URL", "https://jwks.invalid/keys")
+os.environ.setdefault("INGESTION_JWT_ISSUER", "https://issuer.invalid/")
+os.environ.setdefault("INGESTION_JWT_AUDIENCE", "laurel-benchmark")
+
+import jwt  # noqa: E402
+from cryptography.hazmat.primitives.asymmetric import rsa  # noqa: E402
+
+from backend.app import auth  # noqa: E402
+from backend.app.auth import HTTPAuthorizationCredentials, HTTPException  # noqa: E402
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Measure verify_jwt throughput")
+    parser.add_argument("--iterations", type=int, default=2000, help="Calls per scenario (default: %(default)s)")
+    return parser.parse_args()
+
+
+def _mint(private_key, **overrides) -> HTTPAuthorizationCredentials:
+    claims = {
+        "iss": os.environ["INGESTION_JWT_ISSUER"],
+        "aud": os.environ["INGESTION_JWT_AUDIENCE"],
+        "exp": int(time.time()) + 300,
+        "nonce": uuid.uuid4().hex,
+        auth.INTEGRITY_CLAIM: auth.REQUIRED_INTEGRITY_VERDICT,
+    }
+    claims.update(overrides)
+    token = jwt.encode(claims, private_key, algorithm=auth.ALGORITHM, headers={"kid": "bench"})
+    return HTTPAuthorizationCredentials(scheme="Bearer", credentials=token)
+
+
+def _throughput(iterations: int, make_credentials: Callable[[int], HTTPAuthorizationCredentials]) -> float:
+    credentials = [make_credentials(i) for i in range(iterations)]
+    started = time.perf_counter()
+    for item in credentials:
+        try:
+            auth.verify_jwt(item)
+        except HTTPException:
+            pass
+    return iterations / (time.perf_counter() - started)
+
+
+def main() -> None:
+    args = parse_args()
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    other_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    auth._get_signing_key = lambda token: SimpleNamespace(key=private_key.public_key())
+
+    replayed = _mint(private_key)
+    forged = _mint(other_key)
+    scenarios: Dict[str, Callable[[int], HTTPAuthorizationCredentials]] = {
+        "unique valid tokens": lambda _: _mint(private_key),
+        "replayed valid token": lambda _: replayed,
+        "forged signature flood": lambda _: forged,
+    }
+
+    print(f"{'scenario':<26}{'no cache (req/s)':>18}{'verdict cache (req/s)':>24}")
+    for name, make_credentials in scenarios.items():
+        results = []
+        for cache_size in (0, 10_000):
+            auth.reset_auth_state()
+            auth._verdict_cache = auth.TokenVerdictCache(cache_size, rejection_ttl_seconds=60)
+            results.append(_throughput(args.iterations, make_credentials))
+        print(f"{name:<26}{results[0]:>18,.0f}{results[1]:>24,.0f}")
+
+
+if __name__ == "__main__":
+    main()
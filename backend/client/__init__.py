@@ -0,0 +1,26 @@
+"""Python client for the ingestion API.
+
+``IngestionClient`` needs only ``requests``. ``AsyncIngestionClient`` additionally needs
+``httpx`` and is imported on first use, so the sync client works without it.
+"""
+from __future__ import annotations
+
+from ._core import BufferFullError, IngestionError, RetryPolicy, new_event
+from .sync import IngestionClient
+
+__all__ = [
+    "AsyncIngestionClient",
+    "BufferFullError",
+    "IngestionClient",
+    "IngestionError",
+    "RetryPolicy",
+    "new_event",
+]
+
+
+def __getattr__(name: str):
+    if name == "AsyncIngestionClient":
+        from .aio import AsyncIngestionClient
+
+        return AsyncIngestionClient
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
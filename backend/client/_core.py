@@ -0,0 +1,151 @@
+"""Pieces shared by the sync and async clients: event records, batch encoding, retry policy."""
+from __future__ import annotations
+
+import gzip
+import json
+import random
+import time
+import uuid
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Callable, Deque, Dict, List, Mapping, Optional, Tuple
+
+BATCH_PATH = "/events:batch"
+
+# Worth another attempt: the request may not have been processed, or was shed under load.
+# Retrying is safe because every event carries an event_id the server deduplicates on.
+RETRYABLE_STATUS = frozenset({408, 429, 500, 502, 503, 504})
+# Failures a later flush can get past, with the server recovered or a fresh token. A batch
+# rejected with anything else (400, 413, 415, ...) would be rejected again on every flush.
+KEEP_BUFFERED_STATUS = RETRYABLE_STATUS | {401, 403}
+
+# Called with the events of a batch the server will never accept and the error it gave.
+ErrorCallback = Callable[[List[Dict[str, Any]], Exception], None]
+
+
+class IngestionError(Exception):
+    """A batch could not be delivered."""
+
+    def __init__(self, message: str, status_code: Optional[int] = None) -> None:
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class BufferFullError(IngestionError):
+    """``send`` was called while ``max_buffered`` events were already waiting."""
+
+
+@dataclass(frozen=True)
+class RetryPolicy:
+    """Exponential backoff with full jitter, capped at ``max_delay``.
+
+    A ``Retry-After`` from the server is a lower bound on the wait.
+    """
+
+    max_attempts: int = 5
+    base_delay: float = 0.2
+    max_delay: float = 10.0
+
+    def delay(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        wait = random.uniform(0.0, ceiling)
+        if retry_after is not None:
+            wait = max(wait, min(retry_after, self.max_delay))
+        return wait
+
+
+def new_event(
+    event_type: str,
+    payload: Optional[Mapping[str, Any]] = None,
+    user_id: Optional[str] = None,
+    metadata: Optional[Mapping[str, Any]] = None,
+    event_id: Optional[str] = None,
+) -> Dict[str, Any]:
+    """Build the wire form of one event, assigning an ``event_id`` when none is given.
+
+    The id is fixed here, before the first attempt, so a batch resent after a lost response is
+    recognised by the server as a duplicate instead of being stored twice.
+    """
+
+    event: Dict[str, Any] = {
+        "event_id": event_id or uuid.uuid4().hex,
+        "event_type": event_type,
+        "payload": dict(payload or {}),
+    }
+    if user_id is not None:
+        event["user_id"] = user_id
+    if metadata is not None:
+        event["metadata"] = dict(metadata)
+    return event
+
+
+def encode_batch(
+    events: List[Dict[str, Any]],
+    compress: bool,
+    compress_min_bytes: int,
+) -> Tuple[bytes, Dict[str, str]]:
+    """Serialise ``events`` as a JSON array, gzipping bodies of at least ``compress_min_bytes``."""
+
+    body = json.dumps(events, separators=(",", ":"), default=str).encode()
+    headers = {"Content-Type": "application/json"}
+    if compress and len(body) >= compress_min_bytes:
+        # Level 5 keeps most of the size win at well under half the CPU cost of level 9.
+        body = gzip.compress(body, compresslevel=5, mtime=0)
+        headers["Content-Encoding"] = "gzip"
+    return body, headers
+
+
+def keeps_batch(exc: BaseException) -> bool:
+    """Whether a failed batch goes back to the buffer rather than being dropped."""
+
+    if not isinstance(exc, Exception):
+        # Cancelled or interrupted mid-delivery: the server never judged the batch.
+        return True
+    if isinstance(exc, IngestionError):
+        return exc.status_code is None or exc.status_code in KEEP_BUFFERED_STATUS
+    return False
+
+
+def retry_after_seconds(headers: Mapping[str, str]) -> Optional[float]:
+    value = headers.get("retry-after")
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        # The HTTP-date form is not produced by this API.
+        return None
+
+
+class EventBuffer:
+    """FIFO of pending events that remembers when its oldest event arrived.
+
+    Not thread-safe; the sync client guards it with a lock.
+    """
+
+    def __init__(self) -> None:
+        self._events: Deque[Dict[str, Any]] = deque()
+        self._oldest: Optional[float] = None
+
+    def __len__(self) -> int:
+        return len(self._events)
+
+    def append(self, event: Dict[str, Any]) -> None:
+        if not self._events:
+            self._oldest = time.monotonic()
+        self._events.append(event)
+
+    def take(self, limit: int) -> List[Dict[str, Any]]:
+        taken = [self._events.popleft() for _ in range(min(limit, len(self._events)))]
+        self._oldest = time.monotonic() if self._events else None
+        return taken
+
+    def restore(self, events: List[Dict[str, Any]]) -> None:
+        """Put an undelivered batch back at the front, ahead of newer events."""
+
+        if events:
+            self._events.extendleft(reversed(events))
+            self._oldest = time.monotonic()
+
+    def age(self) -> float:
+        return 0.0 if self._oldest is None else time.monotonic() - self._oldest
@@ -0,0 +1,194 @@
+"""Buffered asyncio client built on a pooled ``httpx.AsyncClient`` (``pip install httpx``)."""
+from __future__ import annotations
+
+import asyncio
+import inspect
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Mapping, Optional, Union
+
+import httpx
+
+from ._core import (
+    BATCH_PATH,
+    RETRYABLE_STATUS,
+    BufferFullError,
+    ErrorCallback,
+    EventBuffer,
+    IngestionError,
+    RetryPolicy,
+    encode_batch,
+    keeps_batch,
+    new_event,
+    retry_after_seconds,
+)
+
+logger = logging.getLogger(__name__)
+
+AsyncTokenSource = Union[str, Callable[[], str], Callable[[], Awaitable[str]]]
+
+
+class AsyncIngestionClient:
+    """Async counterpart of :class:`~backend.client.IngestionClient` with the same batching rules.
+
+    The interval flusher is a task on the running loop, started by the first ``send``.
+    Failed batches are kept or dropped by the same rules, and dropped ones go to ``on_error``.
+    ``token`` may be a string, or a sync or async callable called once per attempt.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        token: AsyncTokenSource,
+        *,
+        batch_size: int = 500,
+        flush_interval: Optional[float] = 1.0,
+        max_buffered: int = 10_000,
+        retry: RetryPolicy = RetryPolicy(),
+        compress: bool = True,
+        compress_min_bytes: int = 1024,
+        timeout: float = 10.0,
+        pool_size: int = 4,
+        http: Optional[httpx.AsyncClient] = None,
+        on_batch: Optional[Callable[[Dict[str, Any]], None]] = None,
+        on_error: Optional[ErrorCallback] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.retry = retry
+        self.compress = compress
+        self.compress_min_bytes = compress_min_bytes
+        self.on_batch = on_batch
+        self.on_error = on_error
+        self._token = token
+        if http is None:
+            limits = httpx.Limits(max_connections=pool_size, max_keepalive_connections=pool_size)
+            http = httpx.AsyncClient(timeout=timeout, limits=limits)
+        self._http = http
+        self._buffer = EventBuffer()
+        self._flush_lock = asyncio.Lock()
+        self._closed = False
+        self._flusher: Optional[asyncio.Task[None]] = None
+
+    async def __aenter__(self) -> "AsyncIngestionClient":
+        return self
+
+    async def __aexit__(self, *exc_info) -> None:
+        await self.aclose()
+
+    @property
+    def pending(self) -> int:
+        return len(self._buffer)
+
+    async def send(
+        self,
+        event_type: str,
+        payload: Optional[Mapping[str, Any]] = None,
+        user_id: Optional[str] = None,
+        metadata: Optional[Mapping[str, Any]] = None,
+        event_id: Optional[str] = None,
+    ) -> str:
+        if self._closed:
+            raise IngestionError("Client is closed")
+        if len(self._buffer) >= self.max_buffered:
+            raise BufferFullError(f"{self.max_buffered} events are already waiting to be sent")
+        event = new_event(event_type, payload, user_id, metadata, event_id)
+        self._buffer.append(event)
+        if self.flush_interval and self._flusher is None:
+            self._flusher = asyncio.create_task(self._flush_periodically())
+        if len(self._buffer) >= self.batch_size:
+            await self.flush()
+        return event["event_id"]
+
+    async def flush(self) -> List[Dict[str, Any]]:
+        responses = []
+        async with self._flush_lock:
+            while True:
+                batch = self._buffer.take(self.batch_size)
+                if not batch:
+                    return responses
+                try:
+                    result = await self._deliver(batch)
+                except BaseException as exc:
+                    if keeps_batch(exc):
+                        self._buffer.restore(batch)
+                        raise
+                    self._drop(batch, exc)
+                    continue
+                responses.append(result)
+                if self.on_batch is not None:
+                    self.on_batch(result)
+
+    async def aclose(self) -> None:
+        if self._closed:
+            return
+        self._closed = True
+        if self._flusher is not None:
+            async with self._flush_lock:
+                # Cancel between deliveries, never in the middle of one.
+                self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+        try:
+            await self.flush()
+        finally:
+            await self._http.aclose()
+
+    async def _flush_periodically(self) -> None:
+        interval = float(self.flush_interval or 0)
+        while True:
+            await asyncio.sleep(interval / 4)
+            if len(self._buffer) == 0 or self._buffer.age() < interval:
+                continue
+            try:
+                await self.flush()
+            except IngestionError as exc:
+                logger.warning("Background flush failed, keeping %d events buffered: %s", self.pending, exc)
+            except Exception:
+                # Anything else (an on_batch callback, say) must not end the flusher task.
+                logger.exception("Background flush failed, keeping %d events buffered", self.pending)
+
+    def _drop(self, batch: List[Dict[str, Any]], exc: Exception) -> None:
+        if self.on_error is not None:
+            self.on_error(batch, exc)
+        else:
+            logger.error("Dropping %d events the server will not accept: %s", len(batch), exc)
+
+    async def _next_token(self) -> str:
+        token = self._token() if callable(self._token) else self._token
+        if inspect.isawaitable(token):
+            token = await token
+        return token
+
+    async def _deliver(self, batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        body, headers = encode_batch(batch, self.compress, self.compress_min_bytes)
+        url = self.base_url + BATCH_PATH
+        attempt = 0
+        while True:
+            token = await self._next_token()
+            retry_after = None
+            try:
+                response = await self._http.post(
+                    url,
+                    content=body,
+                    headers={**headers, "Authorization": f"Bearer {token}"},
+                )
+            except httpx.HTTPError as exc:
+                error = IngestionError(f"Request failed: {exc}")
+            else:
+                if response.status_code < 300:
+                    return response.json()
+                error = IngestionError(
+                    f"Batch rejected with {response.status_code}: {response.text[:200]}",
+                    status_code=response.status_code,
+                )
+                if response.status_code not in RETRYABLE_STATUS:
+                    raise error
+                retry_after = retry_after_seconds(response.headers)
+            attempt += 1
+            if attempt >= self.retry.max_attempts:
+                raise error
+            await asyncio.sleep(self.retry.delay(attempt - 1, retry_after))
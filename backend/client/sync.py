@@ -0,0 +1,210 @@
+"""Buffered client built on a pooled ``requests.Session``."""
+from __future__ import annotations
+
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Mapping, Optional, Union
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from ._core import (
+    BATCH_PATH,
+    RETRYABLE_STATUS,
+    BufferFullError,
+    ErrorCallback,
+    EventBuffer,
+    IngestionError,
+    RetryPolicy,
+    encode_batch,
+    keeps_batch,
+    new_event,
+    retry_after_seconds,
+)
+
+logger = logging.getLogger(__name__)
+
+TokenSource = Union[str, Callable[[], str]]
+
+
+class IngestionClient:
+    """Buffers events and delivers them through ``POST /events:batch`` over keep-alive connections.
+
+    A batch is sent once ``batch_size`` events are waiting, or by a background thread once the
+    oldest waiting event is ``flush_interval`` seconds old. Failed batches are retried with
+    jittered backoff and keep their event ids, so the server stores each event once.
+
+    A batch that failed for a reason a later flush can get past (connection errors, the
+    retryable statuses, ``401``/``403``) goes back to the front of the buffer and the error is
+    raised. A batch the server will never accept (``400``, ``413``, ...) is handed to
+    ``on_error``, or logged, and dropped so it cannot block the events behind it.
+
+    ``token`` is either a fixed JWT or a callable returning one. The API rejects a reused nonce,
+    so anything beyond a single request needs the callable: it is called for every attempt.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        token: TokenSource,
+        *,
+        batch_size: int = 500,
+        flush_interval: Optional[float] = 1.0,
+        max_buffered: int = 10_000,
+        retry: RetryPolicy = RetryPolicy(),
+        compress: bool = True,
+        compress_min_bytes: int = 1024,
+        timeout: float = 10.0,
+        pool_size: int = 4,
+        session: Optional[requests.Session] = None,
+        on_batch: Optional[Callable[[Dict[str, Any]], None]] = None,
+        on_error: Optional[ErrorCallback] = None,
+    ) -> None:
+        self.base_url = base_url.rstrip("/")
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffered = max_buffered
+        self.retry = retry
+        self.compress = compress
+        self.compress_min_bytes = compress_min_bytes
+        self.timeout = timeout
+        self.on_batch = on_batch
+        self.on_error = on_error
+        self._token = token
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+        self._session = session
+        self._buffer = EventBuffer()
+        self._buffer_lock = threading.Lock()
+        # Serialises deliveries so batches leave in submission order.
+        self._flush_lock = threading.Lock()
+        self._closed = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        if flush_interval:
+            self._flusher = threading.Thread(target=self._flush_periodically, name="ingestion-flush", daemon=True)
+            self._flusher.start()
+
+    def __enter__(self) -> "IngestionClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    @property
+    def pending(self) -> int:
+        with self._buffer_lock:
+            return len(self._buffer)
+
+    def send(
+        self,
+        event_type: str,
+        payload: Optional[Mapping[str, Any]] = None,
+        user_id: Optional[str] = None,
+        metadata: Optional[Mapping[str, Any]] = None,
+        event_id: Optional[str] = None,
+    ) -> str:
+        """Queue one event and return its ``event_id``; sends a batch when ``batch_size`` is reached."""
+
+        if self._closed.is_set():
+            raise IngestionError("Client is closed")
+        event = new_event(event_type, payload, user_id, metadata, event_id)
+        with self._buffer_lock:
+            if len(self._buffer) >= self.max_buffered:
+                raise BufferFullError(f"{self.max_buffered} events are already waiting to be sent")
+            self._buffer.append(event)
+            full = len(self._buffer) >= self.batch_size
+        if full:
+            self.flush()
+        return event["event_id"]
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Send everything buffered, returning one ``EventBatchOut`` body per batch."""
+
+        responses = []
+        with self._flush_lock:
+            while True:
+                with self._buffer_lock:
+                    batch = self._buffer.take(self.batch_size)
+                if not batch:
+                    return responses
+                try:
+                    result = self._deliver(batch)
+                except BaseException as exc:
+                    if keeps_batch(exc):
+                        with self._buffer_lock:
+                            self._buffer.restore(batch)
+                        raise
+                    self._drop(batch, exc)
+                    continue
+                responses.append(result)
+                if self.on_batch is not None:
+                    self.on_batch(result)
+
+    def close(self) -> None:
+        """Stop the background flusher, send what is left, and release pooled connections."""
+
+        if self._closed.is_set():
+            return
+        self._closed.set()
+        if self._flusher is not None:
+            self._flusher.join()
+        try:
+            self.flush()
+        finally:
+            self._session.close()
+
+    def _flush_periodically(self) -> None:
+        interval = float(self.flush_interval or 0)
+        while not self._closed.wait(interval / 4):
+            with self._buffer_lock:
+                due = len(self._buffer) > 0 and self._buffer.age() >= interval
+            if not due:
+                continue
+            try:
+                self.flush()
+            except IngestionError as exc:
+                logger.warning("Background flush failed, keeping %d events buffered: %s", self.pending, exc)
+            except Exception:
+                # Anything else (an on_batch callback, say) must not end the flusher thread.
+                logger.exception("Background flush failed, keeping %d events buffered", self.pending)
+
+    def _drop(self, batch: List[Dict[str, Any]], exc: Exception) -> None:
+        if self.on_error is not None:
+            self.on_error(batch, exc)
+        else:
+            logger.error("Dropping %d events the server will not accept: %s", len(batch), exc)
+
+    def _deliver(self, batch: List[Dict[str, Any]]) -> Dict[str, Any]:
+        body, headers = encode_batch(batch, self.compress, self.compress_min_bytes)
+        url = self.base_url + BATCH_PATH
+        attempt = 0
+        while True:
+            token = self._token() if callable(self._token) else self._token
+            retry_after = None
+            try:
+                response = self._session.post(
+                    url,
+                    data=body,
+                    headers={**headers, "Authorization": f"Bearer {token}"},
+                    timeout=self.timeout,
+                )
+            except requests.RequestException as exc:
+                error = IngestionError(f"Request failed: {exc}")
+            else:
+                if response.status_code < 300:
+                    return response.json()
+                error = IngestionError(
+                    f"Batch rejected with {response.status_code}: {response.text[:200]}",
+                    status_code=response.status_code,
+                )
+                if response.status_code not in RETRYABLE_STATUS:
+                    raise error
+                retry_after = retry_after_seconds(response.headers)
+            attempt += 1
+            if attempt >= self.retry.max_attempts:
+                raise error
+            time.sleep(self.retry.delay(attempt - 1, retry_after))
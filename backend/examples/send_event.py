@@ -3,10 +3,18 @@ from __future__ import annotations
 
 import argparse
 import os
+import sys
 from datetime import datetime
+from pathlib import Path
 
 import requests
 
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backend.client import IngestionClient  # noqa: E402
+
 
 def parse_args() -> argparse.Namespace:
     parser = argparse.ArgumentParser(description="Send a sample kiosk event")
@@ -29,15 +37,17 @@ def parse_args() -> argparse.Namespace:
 def main() -> None:
     args = parse_args()
     headers = {"Authorization": f"Bearer {args.token}"}
-    payload = {
-        "event_type": "kiosk.screen_view",
-        "user_id": "visitor-123",
-        "payload": {"screen": "welcome", "locale": "en-US"},
-        "metadata": {"kiosk_id": "kiosk-01", "captured_at": datetime.utcnow().isoformat()},
-    }
-    response = requests.post(f"{args.api_url}/events", headers=headers, json=payload, timeout=10)
-    response.raise_for_status()
-    print("Event stored:", response.json())
+    # A single fixed token covers a single request; long-running producers pass a callable
+    # that mints a fresh token per request and leave the interval flusher on.
+    with IngestionClient(args.api_url, args.token, flush_interval=None) as client:
+        client.send(
+            "kiosk.screen_view",
+            payload={"screen": "welcome", "locale": "en-US"},
+            user_id="visitor-123",
+            metadata={"kiosk_id": "kiosk-01", "captured_at": datetime.utcnow().isoformat()},
+        )
+        for result in client.flush():
+            print("Event stored:", result["results"][0])
 
     stats = requests.get(f"{args.api_url}/stats", headers=headers, timeout=10)
     stats.raise_for_status()
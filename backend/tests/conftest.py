@@ -0,0 +1,32 @@
+from contextlib import contextmanager
+from typing import Iterator, List
+
+import pytest
+from sqlalchemy import event
+
+
+@pytest.fixture
+def count_statements():
+    """Context manager factory recording the SQL an engine sends to the database.
+
+        with count_statements(database.engine) as statements:
+            ...
+        assert len(statements) == 2
+
+    Transaction control (BEGIN/COMMIT) is not included.
+    """
+
+    @contextmanager
+    def counting(engine) -> Iterator[List[str]]:
+        statements: List[str] = []
+
+        def record(conn, cursor, statement, parameters, context, executemany) -> None:
+            statements.append(statement)
+
+        event.listen(engine, "before_cursor_execute", record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, "before_cursor_execute", record)
+
+    return counting
@@ -0,0 +1,195 @@
+import asyncio
+import gzip
+import json
+import sys
+import time
+from importlib import reload
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backend.client import IngestionClient, IngestionError, RetryPolicy
+
+NO_WAIT = RetryPolicy(max_attempts=3, base_delay=0.0)
+
+
+class FakeResponse:
+    def __init__(self, status_code, body=None, headers=None):
+        self.status_code = status_code
+        self._body = body or {}
+        self.headers = headers or {}
+        self.text = json.dumps(self._body)
+
+    def json(self):
+        return self._body
+
+
+class FakeSession:
+    """Records each POST and answers from a script of responses."""
+
+    def __init__(self, responses):
+        self.responses = list(responses)
+        self.calls = []
+        self.closed = False
+
+    def post(self, url, data, headers, timeout):
+        if headers.get("Content-Encoding") == "gzip":
+            data = gzip.decompress(data)
+        self.calls.append((url, json.loads(data), headers))
+        return self.responses.pop(0)
+
+    def close(self):
+        self.closed = True
+
+
+def test_sync_client_batches_and_retries_with_stable_event_ids():
+    accepted = {"accepted": 2, "duplicates": 0, "rejected": 0, "results": []}
+    session = FakeSession([FakeResponse(503, headers={"retry-after": "0"}), FakeResponse(200, accepted)])
+    tokens = iter(["token-1", "token-2"])
+    client = IngestionClient(
+        "http://ingest.test/",
+        lambda: next(tokens),
+        batch_size=2,
+        flush_interval=None,
+        retry=NO_WAIT,
+        compress_min_bytes=0,
+        session=session,
+    )
+
+    first = client.send("kiosk.viewed", {"screen": "home"})
+    assert session.calls == []
+    client.send("kiosk.viewed", {"screen": "map"}, event_id="fixed-id")
+
+    assert [call[0] for call in session.calls] == ["http://ingest.test/events:batch"] * 2
+    (_, sent_first, headers_first), (_, sent_retry, headers_retry) = session.calls
+    assert sent_first == sent_retry
+    assert [event["event_id"] for event in sent_retry] == [first, "fixed-id"]
+    assert headers_first["Authorization"] == "Bearer token-1"
+    assert headers_retry["Authorization"] == "Bearer token-2"
+    assert headers_retry["Content-Encoding"] == "gzip"
+    assert client.pending == 0
+
+    # An auth failure surfaces immediately and keeps the batch for the next flush.
+    session.responses = [FakeResponse(401, {"detail": "Nonce already used"})]
+    tokens = iter(["token-3"])
+    client.send("kiosk.viewed")
+    with pytest.raises(IngestionError) as excinfo:
+        client.flush()
+    assert excinfo.value.status_code == 401
+    assert client.pending == 1
+
+    session.responses = [FakeResponse(200, accepted)]
+    tokens = iter(["token-4"])
+    client.close()
+    assert client.pending == 0
+    assert session.closed
+
+
+def test_sync_client_drops_batches_the_server_will_never_accept():
+    accepted = {"accepted": 1, "duplicates": 0, "rejected": 0, "results": []}
+    session = FakeSession([FakeResponse(413, {"detail": "Batch too large"}), FakeResponse(200, accepted)])
+    dropped = []
+    client = IngestionClient(
+        "http://ingest.test",
+        "token",
+        batch_size=1,
+        flush_interval=None,
+        retry=NO_WAIT,
+        session=session,
+        on_error=lambda batch, exc: dropped.append((batch, exc.status_code)),
+    )
+
+    oversized = client.send("kiosk.viewed", {"blob": "x" * 100})
+    client.send("kiosk.viewed")
+
+    assert [(batch[0]["event_id"], status) for batch, status in dropped] == [(oversized, 413)]
+    assert len(session.calls) == 2
+    assert client.pending == 0
+
+
+def test_sync_background_flusher_survives_callback_errors():
+    accepted = {"accepted": 1, "duplicates": 0, "rejected": 0, "results": []}
+    session = FakeSession([FakeResponse(200, accepted), FakeResponse(200, accepted)])
+    delivered = []
+
+    def on_batch(result):
+        delivered.append(result)
+        if len(delivered) == 1:
+            raise RuntimeError("callback bug")
+
+    with IngestionClient(
+        "http://ingest.test", "token", flush_interval=0.02, session=session, on_batch=on_batch
+    ) as client:
+        for expected in (1, 2):
+            client.send("kiosk.viewed")
+            for _ in range(200):
+                if len(delivered) == expected:
+                    break
+                time.sleep(0.01)
+            # Delivered by the background thread, not by close().
+            assert len(delivered) == expected
+
+
+@pytest.fixture
+def app_module(tmp_path, monkeypatch):
+    monkeypatch.setenv("INGESTION_DATABASE_URL", f"sqlite:///{tmp_path / 'ingestion.db'}")
+    monkeypatch.setenv("INGESTION_RETENTION_INTERVAL_SECONDS", "3600")
+
+    from backend.app import database
+
+    reload(database)
+
+    from backend.app import main
+
+    reload(main)
+    main.reset_application_state()
+    main.app.dependency_overrides[main.verify_jwt] = lambda: {}
+
+    yield main
+
+    main.app.dependency_overrides.clear()
+    main.reset_application_state()
+
+
+def test_async_client_delivers_gzip_batches_and_replays_as_duplicates(app_module):
+    httpx = pytest.importorskip("httpx")
+    from backend.client import AsyncIngestionClient
+
+    main = app_module
+
+    batches = []
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        http = httpx.AsyncClient(transport=transport, base_url="http://ingest.test")
+        async with AsyncIngestionClient(
+            "http://ingest.test",
+            "token",
+            batch_size=50,
+            flush_interval=0.05,
+            compress_min_bytes=0,
+            http=http,
+            on_batch=batches.append,
+        ) as client:
+            ids = [await client.send("kiosk.viewed", {"index": index}) for index in range(120)]
+            # Two full batches went out on size; the interval flusher picks up the remainder.
+            for _ in range(100):
+                if len(batches) == 3:
+                    break
+                await asyncio.sleep(0.01)
+            assert client.pending == 0
+
+            await client.send("kiosk.viewed", event_id=ids[0])
+
+    asyncio.run(scenario())
+
+    assert [batch["accepted"] for batch in batches] == [50, 50, 20, 1]
+    replay = batches[-1]
+    assert replay["duplicates"] == 1
+    assert replay["results"][0]["status"] == "duplicate"
+    with main.SessionLocal() as session:
+        assert session.query(main.Event).count() == 120
@@ -1,8 +1,5 @@
-import sys
-from importlib import reload
-from pathlib import Path
-
-import sys
+import asyncio
+import json
 import sys
 from importlib import reload
 from pathlib import Path
@@ -85,3 +82,1279 @@ def test_stats_rate_limit_enforced(app_module):
     assert excinfo.value.detail == "Rate limit exceeded"
 
     main.reset_application_state()
+
+
+def test_batch_ingest_accepts_json_array_and_reports_rejections(app_module):
+    main = app_module
+    from backend.app import database
+
+    body = json.dumps(
+        [
+            {"event_type": "kiosk.scan", "user_id": "a"},
+            {"user_id": "missing-type"},
+            {"event_type": "kiosk.scan", "payload": {"step": 2}},
+        ]
+    ).encode()
+
+    with database.SessionLocal() as session:
+        result = main.ingest_events_batch(batch=(body, "application/json"), _={}, db=session)
+        stats = main.list_stats(
+            request=DummyRequest("batch"), page=1, page_size=10, _={}, db=session
+        )
+
+    assert (result.accepted, result.rejected) == (2, 1)
+    assert [item.status for item in result.results] == ["created", "rejected", "created"]
+    assert "event_type" in result.results[1].error
+    assert result.results[0].event.id != result.results[2].event.id
+    assert [(entry.event_type, entry.count) for entry in stats] == [("kiosk.scan", 2)]
+
+
+def test_batch_ingest_accepts_ndjson(app_module):
+    main = app_module
+    from backend.app import database
+
+    body = b'{"event_type": "kiosk.viewed"}\n\nnot-json\n{"event_type": "kiosk.viewed"}\n'
+
+    with database.SessionLocal() as session:
+        result = main.ingest_events_batch(batch=(body, "application/x-ndjson"), _={}, db=session)
+
+    assert [item.status for item in result.results] == ["created", "rejected", "created"]
+    assert result.results[1].error == "Invalid JSON"
+
+
+def test_batch_ingest_enforces_size_limit(app_module, monkeypatch):
+    main = app_module
+    from backend.app import database
+
+    monkeypatch.setattr(main, "_batch_max_events", 1)
+    body = json.dumps([{"event_type": "a"}, {"event_type": "b"}]).encode()
+
+    with database.SessionLocal() as session:
+        with pytest.raises(HTTPException) as excinfo:
+            main.ingest_events_batch(batch=(body, "application/json"), _={}, db=session)
+
+    assert excinfo.value.status_code == 413
+
+
+def test_batch_body_gzip_is_decoded_within_the_size_limit(app_module, monkeypatch):
+    import gzip
+
+    main = app_module
+    body = json.dumps([{"event_type": "a"}]).encode()
+
+    assert main.decode_batch_body(gzip.compress(body), "gzip") == body
+    assert main.decode_batch_body(body, None) == body
+
+    monkeypatch.setattr(main, "_batch_max_body_bytes", 1024)
+    for encoded, encoding, expected in (
+        (gzip.compress(b" " * 1_000_000), "gzip", 413),
+        (b" " * 1025, None, 413),
+        (b" " * 1025, "identity", 413),
+        (gzip.compress(body)[:-4], "gzip", 400),
+        (gzip.compress(body) * 2, "gzip", 400),
+        (body, "br", 415),
+    ):
+        with pytest.raises(HTTPException) as excinfo:
+            main.decode_batch_body(encoded, encoding)
+        assert excinfo.value.status_code == expected
+    assert main.decode_batch_body(b" " * 1024, None) == b" " * 1024
+
+    httpx = pytest.importorskip("httpx")
+    main.app.dependency_overrides[main.verify_jwt] = lambda: {}
+    consumed = []
+
+    async def chunked():
+        for _ in range(64):
+            consumed.append(1)
+            yield b" " * 256
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://ingest.test") as client:
+            statuses = []
+            for content, encoding in (
+                (b" " * 2048, "identity"),
+                (gzip.compress(b" " * 2048), "gzip"),
+                (chunked(), "identity"),
+            ):
+                headers = {"Content-Type": "application/json", "Content-Encoding": encoding}
+                response = await client.post("/events:batch", content=content, headers=headers)
+                statuses.append(response.status_code)
+            return statuses
+
+    try:
+        assert asyncio.run(scenario()) == [413, 413, 413]
+    finally:
+        main.app.dependency_overrides.clear()
+    assert len(consumed) < 64
+
+
+def test_tokenless_gzip_batches_are_rejected_before_inflating(app_module, monkeypatch):
+    import gzip
+
+    httpx = pytest.importorskip("httpx")
+    main = app_module
+    inflated = []
+    monkeypatch.setattr(main, "decode_batch_body", lambda *args: inflated.append(args))
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://ingest.test") as client:
+            return [
+                (
+                    await client.post(
+                        "/events:batch",
+                        content=body,
+                        headers={"Content-Type": "application/json", "Content-Encoding": "gzip"},
+                    )
+                ).status_code
+                for body in (b"not gzip", gzip.compress(b" " * 20_000_000))
+            ]
+
+    assert asyncio.run(scenario()) == [401, 401]
+    assert inflated == []
+
+
+def test_single_event_ingest_issues_a_fixed_number_of_statements(
+    app_module, count_statements, monkeypatch
+):
+    main = app_module
+    from backend.app import database
+
+    event_in = schemas.EventIn(event_type="kiosk.scan", user_id="u", payload={"a": 1})
+    with database.SessionLocal() as session:
+        # Warm-up: first-use queries are not the steady state.
+        main.ingest_event(event_in, {}, session)
+        with count_statements(database.engine) as statements:
+            event_out = main.ingest_event(event_in, {}, session)
+
+    # The event INSERT and the daily-stats upsert; no SELECT to reload the event.
+    assert len(statements) == 2, statements
+    assert statements[0].startswith("INSERT INTO events")
+    assert event_out.id == 2 and event_out.created_at is not None and event_out.anonymized is False
+
+    monkeypatch.setattr(main, "_stats_write_behind", True)
+    with database.SessionLocal() as session:
+        with count_statements(database.engine) as statements:
+            main.ingest_event(event_in, {}, session)
+    assert len(statements) == 1, statements
+
+
+def test_payloads_are_stored_compact_and_as_jsonb_on_postgresql(app_module):
+    main = app_module
+    from sqlalchemy import insert, select
+    from sqlalchemy.dialects import postgresql
+    from backend.app import database
+
+    event_in = schemas.EventIn(
+        event_type="kiosk.scan", payload={"screen": "café", "n": [1, 2]}, metadata={"big": 2**70}
+    )
+    with database.SessionLocal() as session:
+        main.ingest_event(event_in, {}, session)
+        row = session.execute(select(main.Event.payload, main.Event.metadata_json)).one()
+
+    assert row.payload == '{"screen":"café","n":[1,2]}'
+    assert json.loads(row.metadata_json) == {"big": 2**70}
+
+    dialect = postgresql.dialect()
+    insert_sql = str(
+        insert(main.Event).values(event_type="a", payload="{}").compile(dialect=dialect)
+    )
+    assert "CAST(%(payload)s AS JSONB)" in insert_sql
+    select_sql = str(select(main.Event.payload).compile(dialect=dialect))
+    assert "CAST(events.payload AS TEXT)" in select_sql
+
+
+def test_retried_event_id_returns_original_without_double_counting(app_module):
+    main = app_module
+    from fastapi import Response
+
+    from backend.app import database
+    from backend.app.models import Event
+
+    event_in = schemas.EventIn(event_type="kiosk.scan", event_id="evt-1")
+    with database.SessionLocal() as session:
+        first = main.ingest_event(event_in, {}, session)
+        replay = Response()
+        cached = main.ingest_event(
+            schemas.EventIn(event_type="kiosk.scan"), {}, session, "evt-1", replay
+        )
+
+        # With the recent-id cache cold (e.g. another worker), the unique index catches the retry.
+        main.reset_application_state()
+        stored = main.ingest_event(event_in, {}, session, "evt-1", Response())
+        other = main.ingest_event(schemas.EventIn(event_type="kiosk.scan"), {}, session)
+
+        with pytest.raises(HTTPException) as excinfo:
+            main.ingest_event(event_in, {}, session, "evt-2")
+        rows = session.query(Event).count()
+        counts = _stat_counts(session)
+
+    assert cached == first and stored == first
+    assert replay.headers["Idempotent-Replayed"] == "true"
+    assert other.event_id is None and other.id != first.id
+    assert excinfo.value.status_code == 400
+    assert rows == 2
+    assert counts == {"kiosk.scan": 2}
+
+
+def test_batch_ingest_reports_duplicate_event_ids(app_module):
+    main = app_module
+    from backend.app import database
+
+    with database.SessionLocal() as session:
+        main.ingest_event(schemas.EventIn(event_type="kiosk.scan", event_id="a"), {}, session)
+        main.reset_application_state()
+        body = json.dumps(
+            [
+                {"event_type": "kiosk.scan", "event_id": "a"},
+                {"event_type": "kiosk.scan", "event_id": "b"},
+                {"event_type": "kiosk.scan", "event_id": "b"},
+                {"event_type": "kiosk.scan"},
+            ]
+        ).encode()
+        result = main.ingest_events_batch(batch=(body, "application/json"), _={}, db=session)
+        counts = _stat_counts(session)
+
+    statuses = [item.status for item in result.results]
+    assert statuses == ["duplicate", "created", "duplicate", "created"]
+    assert (result.accepted, result.duplicates, result.rejected) == (4, 2, 0)
+    assert result.results[1].event == result.results[2].event
+    assert counts == {"kiosk.scan": 3}
+
+
+def test_admission_controller_queues_sheds_and_signals_congestion(app_module):
+    main = app_module
+
+    async def scenario():
+        controller = main.AdmissionController(
+            max_in_flight=1, max_queue=1, queue_timeout_seconds=0.05, latency_target_seconds=0.1
+        )
+        await controller.acquire()
+        waiting = asyncio.create_task(controller.acquire())
+        await asyncio.sleep(0)
+        assert controller.queued == 1
+        with pytest.raises(main.IngestOverloadedError):
+            await controller.acquire()
+
+        controller.release(1.0)
+        await waiting
+        assert (controller.in_flight, controller.queued) == (1, 0)
+        assert controller.congested
+        with pytest.raises(main.IngestOverloadedError) as excinfo:
+            await controller.acquire()
+        paused = controller.throttle_background_work(0.05)
+
+        controller.release(1.0)
+        return controller, excinfo.value, paused
+
+    controller, overloaded, paused = asyncio.run(scenario())
+
+    assert overloaded.retry_after_seconds >= 1
+    assert paused >= 0.05
+    assert controller.snapshot()["in_flight"] == 0
+    assert (controller.admitted, controller.shed, controller.congested) == (2, 2, False)
+    assert controller.throttle_background_work(5) < 0.05
+
+
+def test_ingest_admission_rejects_with_retry_after_and_throttles_retention(app_module):
+    main = app_module
+    from datetime import datetime, timedelta
+
+    from backend.app import database
+    from backend.app.models import Event
+
+    main._ingest_admission = main.AdmissionController(1, 0, 0.01, 0.25)
+
+    async def scenario():
+        holder = main.admit_ingest()
+        await holder.__anext__()
+        with pytest.raises(HTTPException) as excinfo:
+            await main.admit_ingest().__anext__()
+        await holder.aclose()
+        return excinfo.value
+
+    rejected = asyncio.run(scenario())
+    info = main.ingest_admission_info(_={})
+
+    stale = datetime.utcnow() - timedelta(days=31)
+    pauses = []
+    with database.SessionLocal() as session:
+        session.add_all(Event(event_type="old", user_id="u", created_at=stale) for _ in range(5))
+        session.commit()
+        result = main.enforce_retention_policy(
+            session, chunk_size=2, throttle=lambda: pauses.append(1) or 0.5
+        )
+
+    assert rejected.status_code == 503 and rejected.headers["Retry-After"] == "1"
+    assert (info.in_flight, info.queued, info.admitted, info.shed) == (0, 0, 1, 1)
+    assert (result.chunks, len(pauses), result.paused_seconds) == (3, 2, 1.0)
+
+
+def test_unauthenticated_ingests_do_not_take_admission_slots(app_module):
+    httpx = pytest.importorskip("httpx")
+    main = app_module
+    main._ingest_admission = main.AdmissionController(1, 0, 0.01, 0.25)
+
+    async def scenario():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://ingest.test") as client:
+            responses = await asyncio.gather(
+                *(client.post("/events", json={"event_type": "kiosk.scan"}) for _ in range(5))
+            )
+        return [response.status_code for response in responses]
+
+    assert asyncio.run(scenario()) == [401] * 5
+    assert main._ingest_admission.snapshot()["in_flight"] == 0
+    assert (main._ingest_admission.admitted, main._ingest_admission.shed) == (0, 0)
+
+
+def test_increment_stats_upserts_pre_aggregated_counts(app_module):
+    main = app_module
+    from datetime import date
+
+    from backend.app import database
+    from backend.app.models import EventStat
+
+    day = date(2024, 1, 2)
+    with database.SessionLocal() as session:
+        main.increment_stats(session, {("kiosk.scan", day): 3, ("kiosk.viewed", day): 1})
+        main.increment_stats(session, {("kiosk.scan", day): 2})
+        session.commit()
+
+        rows = session.query(EventStat).order_by(EventStat.event_type).all()
+
+    assert [(row.event_type, row.event_date, row.count) for row in rows] == [
+        ("kiosk.scan", day, 5),
+        ("kiosk.viewed", day, 1),
+    ]
+
+
+@pytest.fixture
+def write_behind_env(monkeypatch):
+    monkeypatch.setenv("INGESTION_STATS_WRITE_BEHIND", "true")
+    monkeypatch.setenv("INGESTION_STATS_FLUSH_THRESHOLD", "1000")
+    monkeypatch.setenv("INGESTION_STATS_FLUSH_INTERVAL_SECONDS", "3600")
+
+
+@pytest.fixture
+def write_behind_app_module(write_behind_env, app_module):
+    return app_module
+
+
+def _stat_counts(session):
+    from backend.app.models import EventStat
+
+    return {row.event_type: row.count for row in session.query(EventStat).all()}
+
+
+def test_write_behind_buffers_until_flush(write_behind_app_module):
+    main = write_behind_app_module
+    from backend.app import database
+
+    with database.SessionLocal() as session:
+        for _ in range(3):
+            _create_event(main, session, "kiosk.scan")
+        assert _stat_counts(session) == {}
+        assert main._stats_buffer.pending_events == 3
+
+        main._flush_stats_buffer()
+        session.expire_all()
+        assert _stat_counts(session) == {"kiosk.scan": 3}
+
+
+def test_write_behind_discards_rolled_back_increments(write_behind_app_module):
+    main = write_behind_app_module
+    from backend.app import database
+
+    with database.SessionLocal() as session:
+        main.insert_events(session, [schemas.EventIn(event_type="kiosk.scan")])
+        session.rollback()
+
+    assert main._stats_buffer.pending_events == 0
+
+
+def test_write_behind_flushes_on_threshold_and_shutdown(write_behind_app_module, monkeypatch):
+    main = write_behind_app_module
+    from backend.app import database
+
+    monkeypatch.setattr(main, "_stats_buffer", main.StatsBuffer(flush_threshold=2))
+    with database.SessionLocal() as session:
+        for _ in range(3):
+            _create_event(main, session, "kiosk.scan")
+        assert _stat_counts(session) == {"kiosk.scan": 2}
+
+    asyncio.run(main.stop_retention_policy())
+
+    with database.SessionLocal() as session:
+        assert _stat_counts(session) == {"kiosk.scan": 3}
+
+
+def test_retention_anonymizes_stale_events_in_chunks(app_module):
+    main = app_module
+    from datetime import datetime, timedelta
+
+    from backend.app import database
+    from backend.app.models import Event
+
+    stale = datetime.utcnow() - timedelta(days=31)
+    with database.SessionLocal() as session:
+        for idx in range(5):
+            session.add(
+                Event(event_type="old", user_id=f"u{idx}", payload='{"a": 1}', created_at=stale)
+            )
+        session.add(Event(event_type="fresh", user_id="u", payload='{"a": 1}'))
+        session.commit()
+
+        result = main.enforce_retention_policy(session, chunk_size=2)
+        events = session.query(Event).order_by(Event.id).all()
+
+    assert (result.rows, result.chunks) == (5, 3)
+    assert all(event.anonymized and event.user_id is None for event in events[:5])
+    assert all(event.payload == "{}" for event in events[:5])
+    assert not events[5].anonymized and events[5].user_id == "u"
+
+
+def test_retention_watermark_skips_processed_window_until_full_sweep(app_module):
+    main = app_module
+    from datetime import datetime, timedelta
+
+    from backend.app import database
+    from backend.app.models import Event, RetentionState
+
+    with database.SessionLocal() as session:
+        stale = datetime.utcnow() - timedelta(days=40)
+        session.add(Event(event_type="old", user_id="a", created_at=stale))
+        session.commit()
+        first = main.enforce_retention_policy(session)
+        watermark = session.get(RetentionState, main.RETENTION_WATERMARK_NAME).watermark
+
+        # A row older than the watermark is outside the incremental window.
+        backfilled = Event(event_type="old", user_id="b", created_at=watermark - timedelta(days=5))
+        session.add(backfilled)
+        session.commit()
+        incremental = main.enforce_retention_policy(session)
+        full = main.enforce_retention_policy(session, full_sweep=True)
+        session.refresh(backfilled)
+
+    assert first.rows == 1
+    assert watermark == first.watermark
+    assert incremental.rows == 0
+    assert full.rows == 1
+    assert backfilled.anonymized and backfilled.user_id is None
+
+
+def test_retention_watermark_upsert_keeps_the_latest_value_across_workers(
+    app_module, count_statements
+):
+    main = app_module
+    from datetime import datetime, timedelta
+
+    from backend.app import database
+    from backend.app.models import RetentionState
+
+    later = datetime(2024, 3, 1)
+    with database.SessionLocal() as worker_a, database.SessionLocal() as worker_b:
+        # No read-then-insert window: workers starting together on a fresh database each
+        # issue one upsert instead of racing to add the first row.
+        with count_statements(database.engine) as statements:
+            main._store_retention_watermark(worker_a, later)
+        worker_a.commit()
+        main._store_retention_watermark(worker_b, later - timedelta(days=1))
+        worker_b.commit()
+        after_race = worker_b.get(RetentionState, main.RETENTION_WATERMARK_NAME).watermark
+
+        main._store_retention_watermark(worker_b, later + timedelta(days=1))
+        worker_b.commit()
+        advanced = worker_b.get(RetentionState, main.RETENTION_WATERMARK_NAME).watermark
+
+    assert len(statements) == 1 and "ON CONFLICT" in statements[0]
+    assert after_race == later
+    assert advanced == later + timedelta(days=1)
+
+
+def test_async_handlers_share_models_with_sync_path(tmp_path, monkeypatch):
+    pytest.importorskip("aiosqlite")
+    monkeypatch.setenv("INGESTION_DATABASE_ASYNC", "true")
+    monkeypatch.setenv("INGESTION_DATABASE_URL", f"sqlite:///{tmp_path / 'ingestion.db'}")
+
+    from backend.app import database
+
+    reload(database)
+
+    from backend.app import main
+
+    reload(main)
+    main.reset_application_state()
+    assert (
+        database.async_database_url("postgresql://u:p@db/laurel")
+        == "postgresql+asyncpg://u:p@db/laurel"
+    )
+
+    async def scenario():
+        async with database.AsyncSessionLocal() as session:
+            event_in = schemas.EventIn(event_type="kiosk.scan")
+            created = await main.ingest_event_async(event_in, {}, session)
+            await main.ingest_event_async(event_in, {}, session)
+            stats = await main.list_stats_async(
+                request=DummyRequest("async"), page=1, page_size=10, _={}, db=session
+            )
+        await main.dispose_async_engine()
+        return created, stats
+
+    created, stats = asyncio.run(scenario())
+
+    assert created.event_type == "kiosk.scan"
+    assert [(entry.event_type, entry.count) for entry in stats] == [("kiosk.scan", 2)]
+    with database.SessionLocal() as session:
+        assert _stat_counts(session) == {"kiosk.scan": 2}
+
+    monkeypatch.delenv("INGESTION_DATABASE_ASYNC")
+    reload(database)
+    reload(main)
+
+
+def test_async_unique_users_streams_sketches_like_the_sync_path(tmp_path, monkeypatch):
+    pytest.importorskip("aiosqlite")
+    from datetime import date, timedelta
+
+    monkeypatch.setenv("INGESTION_DATABASE_ASYNC", "true")
+    monkeypatch.setenv("INGESTION_DATABASE_URL", f"sqlite:///{tmp_path / 'ingestion.db'}")
+
+    from backend.app import database
+
+    reload(database)
+
+    from backend.app import main
+
+    reload(main)
+    main.reset_application_state()
+
+    class _StreamOnlySession:
+        def __init__(self, session) -> None:
+            self._session = session
+
+        async def execute(self, *args, **kwargs):
+            raise AssertionError("sketch rows must be streamed, not loaded at once")
+
+        async def stream(self, *args, **kwargs):
+            return await self._session.stream(*args, **kwargs)
+
+    monday = date(2024, 1, 1)
+    with database.SessionLocal() as session:
+        for offset, users in ((0, range(0, 300)), (1, range(200, 500)), (8, range(0, 20))):
+            for event_type in ("kiosk.scan", "kiosk.viewed"):
+                key = (event_type, monday + timedelta(days=offset))
+                main.record_stat_increments(session, {key: len(users)})
+                main.record_unique_users(session, {key: [f"visitor-{index}" for index in users]})
+        session.commit()
+        expected = main.stats_unique_users(
+            request=DummyRequest("unique-sync"), granularity="week", _={}, db=session
+        )
+
+    async def scenario():
+        async with database.AsyncSessionLocal() as session:
+            result = await main.stats_unique_users_async(
+                request=DummyRequest("unique-async"),
+                granularity="week",
+                _={},
+                db=_StreamOnlySession(session),
+            )
+        await main.dispose_async_engine()
+        return result
+
+    result = asyncio.run(scenario())
+
+    assert result == expected
+    assert [bucket.event_type for bucket in result.buckets] == ["kiosk.scan", "kiosk.viewed"] * 2
+    assert result.totals["kiosk.scan"] == pytest.approx(500, rel=0.03)
+
+    monkeypatch.delenv("INGESTION_DATABASE_ASYNC")
+    reload(database)
+    reload(main)
+
+
+def test_sqlite_engine_applies_performance_pragmas(app_module, monkeypatch):
+    from backend.app import database
+
+    settings = database.describe_engine(database.engine)
+
+    assert settings["journal_mode"] == "wal"
+    assert settings["synchronous"] == 1  # NORMAL
+    assert settings["busy_timeout"] == 5000
+    assert settings["pool_size"] == 10
+
+    monkeypatch.setenv("INGESTION_SQLITE_SYNCHRONOUS", "sometimes")
+    with pytest.raises(RuntimeError):
+        database.sqlite_pragmas()
+
+
+def test_stats_keyset_pagination_and_filters(app_module):
+    main = app_module
+    from datetime import date, timedelta
+
+    from fastapi import Response
+
+    from backend.app import database
+
+    start = date(2024, 3, 1)
+    increments = {
+        (event_type, start + timedelta(days=offset)): 1
+        for offset in range(4)
+        for event_type in ("kiosk.scan", "kiosk.viewed", "pos.sale")
+    }
+    with database.SessionLocal() as session:
+        main.increment_stats(session, increments)
+        session.commit()
+
+        seen = []
+        cursor = None
+        while True:
+            response = Response()
+            page = main.list_stats(
+                request=DummyRequest(f"keyset-{len(seen)}"),
+                response=response,
+                page_size=5,
+                cursor=cursor,
+                _={},
+                db=session,
+            )
+            seen.extend((entry.event_date, entry.event_type) for entry in page)
+            cursor = response.headers.get(main.NEXT_CURSOR_HEADER)
+            if cursor is None:
+                break
+
+        filtered = main.list_stats(
+            request=DummyRequest("filtered"),
+            date_from=start + timedelta(days=1),
+            date_to=start + timedelta(days=2),
+            event_type_prefix="kiosk.",
+            _={},
+            db=session,
+        )
+
+    expected = sorted(
+        ((event_date, event_type) for event_type, event_date in increments),
+        key=lambda key: (-key[0].toordinal(), key[1]),
+    )
+    assert seen == expected
+    assert [(entry.event_date, entry.event_type) for entry in filtered] == [
+        (start + timedelta(days=2), "kiosk.scan"),
+        (start + timedelta(days=2), "kiosk.viewed"),
+        (start + timedelta(days=1), "kiosk.scan"),
+        (start + timedelta(days=1), "kiosk.viewed"),
+    ]
+
+
+def test_stats_rejects_malformed_cursor(app_module):
+    main = app_module
+    from backend.app import database
+
+    with database.SessionLocal() as session:
+        with pytest.raises(HTTPException) as excinfo:
+            main.list_stats(
+                request=DummyRequest("cursor"), cursor="not-a-cursor", _={}, db=session
+            )
+
+    assert excinfo.value.status_code == 400
+
+
+class _NoQuerySession:
+    def execute(self, *args, **kwargs):
+        raise AssertionError("cached /stats responses must not touch the database")
+
+
+def test_stats_cache_serves_hits_and_conditional_requests(app_module):
+    main = app_module
+    from fastapi import Response
+
+    from backend.app import database
+
+    with database.SessionLocal() as session:
+        _create_event(main, session, "kiosk.scan")
+        first = Response()
+        stats = main.list_stats(request=DummyRequest("cache"), response=first, _={}, db=session)
+
+    second = Response()
+    cached = main.list_stats(
+        request=DummyRequest("cache-2"), response=second, _={}, db=_NoQuerySession()
+    )
+    not_modified = main.list_stats(
+        request=DummyRequest("cache-3"),
+        if_none_match=f'W/{first.headers["ETag"]}',
+        _={},
+        db=_NoQuerySession(),
+    )
+
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert cached == stats
+    assert second.headers["ETag"] == first.headers["ETag"]
+    assert not_modified.status_code == 304
+    assert not_modified.headers["ETag"] == first.headers["ETag"]
+    assert main.stats_cache_info({}).dict() == {"hits": 2, "misses": 1, "entries": 1}
+
+
+def test_stats_cache_invalidates_only_pages_covering_written_dates(app_module):
+    main = app_module
+    from datetime import datetime, timedelta
+
+    from fastapi import Response
+
+    from backend.app import database
+
+    today = datetime.utcnow().date()
+    history = {("kiosk.scan", today - timedelta(days=offset)): 1 for offset in range(1, 5)}
+    with database.SessionLocal() as session:
+        main.increment_stats(session, {("kiosk.scan", today): 1, **history})
+        session.commit()
+
+        first_page = Response()
+        main.list_stats(
+            request=DummyRequest("p1"), response=first_page, page_size=2, _={}, db=session
+        )
+        cursor = first_page.headers[main.NEXT_CURSOR_HEADER]
+        main.list_stats(request=DummyRequest("p2"), cursor=cursor, page_size=2, _={}, db=session)
+
+        _create_event(main, session, "kiosk.scan")
+
+        refreshed = Response()
+        page = main.list_stats(
+            request=DummyRequest("p1-again"), response=refreshed, page_size=2, _={}, db=session
+        )
+
+    historical = Response()
+    main.list_stats(
+        request=DummyRequest("p2-again"),
+        response=historical,
+        cursor=cursor,
+        page_size=2,
+        _={},
+        db=_NoQuerySession(),
+    )
+
+    assert refreshed.headers["X-Cache"] == "MISS"
+    assert refreshed.headers["ETag"] != first_page.headers["ETag"]
+    assert page[0].count == 2
+    assert historical.headers["X-Cache"] == "HIT"
+
+
+class _WriteAfterReadSession:
+    """Runs the page query, then lets ``write`` commit before the reader caches the page."""
+
+    def __init__(self, session, write) -> None:
+        self._session = session
+        self._write = write
+
+    def execute(self, *args, **kwargs):
+        rows = self._session.execute(*args, **kwargs).scalars().all()
+        self._write()
+        return _ScalarsResult(rows)
+
+
+class _ScalarsResult:
+    def __init__(self, rows) -> None:
+        self._rows = rows
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self._rows
+
+
+def test_stats_cache_drops_pages_read_before_a_concurrent_write(app_module):
+    main = app_module
+    from fastapi import Response
+
+    from backend.app import database
+
+    def ingest_today():
+        with database.SessionLocal() as writer:
+            _create_event(main, writer, "kiosk.scan")
+
+    with database.SessionLocal() as session:
+        _create_event(main, session, "kiosk.scan")
+        stale = main.list_stats(
+            request=DummyRequest("race"), _={}, db=_WriteAfterReadSession(session, ingest_today)
+        )
+        fresh = Response()
+        current = main.list_stats(request=DummyRequest("race-2"), response=fresh, _={}, db=session)
+
+    assert stale[0].count == 1
+    assert fresh.headers["X-Cache"] == "MISS"
+    assert current[0].count == 2
+
+
+def test_stats_cache_keeps_pages_when_a_concurrent_write_touches_other_dates(app_module):
+    main = app_module
+    from datetime import date
+
+    from fastapi import Response
+
+    from backend.app import database
+
+    def ingest_today():
+        with database.SessionLocal() as writer:
+            _create_event(main, writer, "kiosk.scan")
+
+    with database.SessionLocal() as session:
+        main.increment_stats(session, {("kiosk.scan", date(2021, 6, 1)): 3})
+        session.commit()
+        history = {"date_from": date(2020, 1, 1), "date_to": date(2021, 12, 31)}
+        main.list_stats(
+            request=DummyRequest("history"),
+            _={},
+            db=_WriteAfterReadSession(session, ingest_today),
+            **history,
+        )
+
+    cached = Response()
+    page = main.list_stats(
+        request=DummyRequest("history-2"), response=cached, _={}, db=_NoQuerySession(), **history
+    )
+
+    assert cached.headers["X-Cache"] == "HIT"
+    assert [(entry.event_date, entry.count) for entry in page] == [(date(2021, 6, 1), 3)]
+
+
+def test_stats_rollup_groups_by_week_and_month(app_module):
+    main = app_module
+    from datetime import date, timedelta
+
+    from backend.app import database
+
+    start = date(2023, 12, 25)  # a Monday
+    increments = {}
+    for offset in range(45):
+        increments[("kiosk.scan", start + timedelta(days=offset))] = 1
+        increments[("pos.sale", start + timedelta(days=offset))] = 2
+    with database.SessionLocal() as session:
+        main.increment_stats(session, increments)
+        session.commit()
+
+        weekly = main.stats_rollup(
+            request=DummyRequest("rollup-week"),
+            granularity="week",
+            date_to=start + timedelta(days=13),
+            event_type="kiosk.scan",
+            _={},
+            db=session,
+        )
+        monthly = main.stats_rollup(
+            request=DummyRequest("rollup-month"), granularity="month", _={}, db=session
+        )
+        fallback = main._build_rollup(
+            session.execute(main._stats_rollup_query("generic", "month")).all(), "month"
+        )
+
+    assert [(bucket.bucket_start, bucket.count) for bucket in weekly.buckets] == [
+        (start, 7),
+        (start + timedelta(days=7), 7),
+    ]
+    assert weekly.totals == {"kiosk.scan": 14}
+    monthly_rows = [
+        (bucket.bucket_start, bucket.event_type, bucket.count) for bucket in monthly.buckets
+    ]
+    assert monthly_rows == [
+        (date(2023, 12, 1), "kiosk.scan", 7),
+        (date(2023, 12, 1), "pos.sale", 14),
+        (date(2024, 1, 1), "kiosk.scan", 31),
+        (date(2024, 1, 1), "pos.sale", 62),
+        (date(2024, 2, 1), "kiosk.scan", 7),
+        (date(2024, 2, 1), "pos.sale", 14),
+    ]
+    assert monthly.total == 135
+    assert fallback == monthly
+
+
+def test_unique_users_merge_across_days_and_survive_anonymization(app_module):
+    main = app_module
+    from datetime import date, datetime, timedelta
+
+    from sqlalchemy import update
+
+    from backend.app import database
+
+    monday = date(2024, 1, 1)
+    with database.SessionLocal() as session:
+        for offset, users in ((0, range(0, 600)), (1, range(300, 900)), (7, range(0, 50))):
+            key = ("kiosk.scan", monday + timedelta(days=offset))
+            main.record_stat_increments(session, {key: len(users)})
+            main.record_unique_users(session, {key: [f"visitor-{index}" for index in users]})
+        session.commit()
+
+        daily = main.stats_unique_users(
+            request=DummyRequest("unique-day"),
+            date_to=monday + timedelta(days=6),
+            _={},
+            db=session,
+        )
+        weekly = main.stats_unique_users(
+            request=DummyRequest("unique-week"), granularity="week", _={}, db=session
+        )
+
+    assert [(bucket.bucket_start, bucket.event_type) for bucket in daily.buckets] == [
+        (monday, "kiosk.scan"),
+        (monday + timedelta(days=1), "kiosk.scan"),
+    ]
+    assert [bucket.unique_users for bucket in daily.buckets] == pytest.approx([600, 600], rel=0.03)
+    # The users seen on both days are counted once in the range total.
+    assert daily.totals["kiosk.scan"] == pytest.approx(900, rel=0.03)
+    assert [bucket.unique_users for bucket in weekly.buckets] == pytest.approx([900, 50], rel=0.03)
+    assert weekly.totals["kiosk.scan"] == pytest.approx(900, rel=0.03)
+    assert weekly.relative_error == pytest.approx(0.023, abs=0.001)
+
+    today = datetime.utcnow().date()
+    with database.SessionLocal() as session:
+        repeat_visits = [
+            schemas.EventIn(event_type="kiosk.viewed", user_id=f"v{index % 40}")
+            for index in range(200)
+        ]
+        main.insert_events(session, repeat_visits)
+        session.commit()
+        for index in range(60):
+            _create_event(main, session, "kiosk.viewed", user_id=f"v{index}")
+        session.execute(update(main.Event).values(**main.ANONYMIZED_EVENT_VALUES))
+        session.commit()
+
+        result = main.stats_unique_users(
+            request=DummyRequest("unique-today"), date_from=today, _={}, db=session
+        )
+        stored = (
+            session.query(main.EventStat.user_sketch)
+            .filter(main.EventStat.event_type == "kiosk.viewed")
+            .scalar()
+        )
+
+    assert list(result.totals) == ["kiosk.viewed"]
+    assert result.totals["kiosk.viewed"] == pytest.approx(60, abs=2)
+    assert b"v1" not in stored
+
+
+def test_unique_users_travel_with_write_behind_counts(write_behind_app_module):
+    main = write_behind_app_module
+    from backend.app import database
+
+    with database.SessionLocal() as session:
+        for user in ("a", "b", "a", "c"):
+            _create_event(main, session, "kiosk.scan", user_id=user)
+        main._flush_stats_buffer()
+        result = main.stats_unique_users(request=DummyRequest("unique-wb"), _={}, db=session)
+
+    assert result.totals == {"kiosk.scan": 3}
+    assert len(main._user_sketches) == 1
+
+
+def test_stats_rollup_rejects_inverted_range(app_module):
+    main = app_module
+    from datetime import date
+
+    from backend.app import database
+
+    with database.SessionLocal() as session:
+        with pytest.raises(HTTPException) as excinfo:
+            main.stats_rollup(
+                request=DummyRequest("rollup-range"),
+                date_from=date(2024, 2, 1),
+                date_to=date(2024, 1, 1),
+                _={},
+                db=session,
+            )
+
+    assert excinfo.value.status_code == 400
+
+
+class _FakeClock:
+    def __init__(self, now: float = 0.0) -> None:
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def test_sliding_window_rate_limiter_smooths_window_edges_and_evicts_idle_keys(app_module):
+    main = app_module
+    clock = _FakeClock(9.0)
+    limiter = main.SlidingWindowRateLimiter(
+        max_requests=4, window_seconds=10, max_keys=2, clock=clock
+    )
+
+    assert [limiter.check("edge").remaining for _ in range(4)] == [3, 2, 1, 0]
+    clock.now = 11.0
+    # A fixed window would reset here; 90% of the previous window still counts.
+    with pytest.raises(main.RateLimitError) as excinfo:
+        limiter.check("edge")
+    assert excinfo.value.status.reset_seconds == pytest.approx(9.0)
+    clock.now = 15.0
+    assert limiter.check("edge").remaining == 1
+
+    limiter.check("other")
+    limiter.check("third")
+    assert len(limiter) == 2
+    clock.now = 40.0
+    limiter.check("fresh")
+    assert len(limiter) == 1
+    assert limiter.evictions == 3
+
+
+def test_sliding_window_rate_limiter_keeps_throttled_keys_under_key_churn(app_module):
+    main = app_module
+    limiter = main.SlidingWindowRateLimiter(
+        max_requests=1, window_seconds=10, max_keys=2, clock=_FakeClock(1.0)
+    )
+
+    limiter.check("abuser")
+    for index in range(5):
+        with pytest.raises(main.RateLimitError):
+            limiter.check("abuser")
+        limiter.check(f"client-{index}")
+
+    with pytest.raises(main.RateLimitError):
+        limiter.check("abuser")
+
+
+def test_stats_responses_carry_rate_limit_headers(app_module):
+    main = app_module
+    from fastapi import Response
+
+    from backend.app import database
+
+    with database.SessionLocal() as session:
+        response = Response()
+        main.list_stats(request=DummyRequest("headers"), response=response, _={}, db=session)
+        main.list_stats(request=DummyRequest("headers"), _={}, db=session)
+        with pytest.raises(HTTPException) as excinfo:
+            main.list_stats(request=DummyRequest("headers"), _={}, db=session)
+
+    assert response.headers["X-RateLimit-Limit"] == "2"
+    assert response.headers["X-RateLimit-Remaining"] == "1"
+    assert excinfo.value.headers["X-RateLimit-Remaining"] == "0"
+    assert int(excinfo.value.headers["Retry-After"]) >= 1
+
+
+def test_database_rate_limiter_is_shared_between_workers(app_module, tmp_path):
+    main = app_module
+    from sqlalchemy import create_engine, func, select
+
+    from backend.app.models import Base, RateLimitCounter
+
+    db_url = f"sqlite:///{tmp_path / 'limits.db'}"
+    engine = create_engine(db_url)
+    Base.metadata.create_all(bind=engine, tables=[RateLimitCounter.__table__])
+    clock = _FakeClock(1_000_005.0)
+    worker_a = main.DatabaseRateLimiter(
+        create_engine(db_url), 3, 10, cleanup_batch_size=1, clock=clock
+    )
+    worker_b = main.DatabaseRateLimiter(
+        create_engine(db_url), 3, 10, cleanup_batch_size=1, clock=clock
+    )
+
+    worker_a.check("shared")
+    worker_b.check("shared")
+    assert worker_a.check("shared").remaining == 0
+    with pytest.raises(main.RateLimitError):
+        worker_b.check("shared")
+
+    clock.now += 10
+    worker_a.check("next-window")
+    clock.now += 30
+    worker_b.check("much-later")
+    with engine.connect() as connection:
+        rows = connection.execute(select(func.count()).select_from(RateLimitCounter)).scalar_one()
+    assert rows == 1
+
+
+def _read_streaming_body(response) -> bytes:
+    async def collect():
+        return b"".join([chunk async for chunk in response.body_iterator])
+
+    return asyncio.run(collect())
+
+
+def test_export_events_streams_filtered_gzip_ndjson(app_module, monkeypatch):
+    main = app_module
+    import gzip
+    from datetime import datetime, timedelta, timezone
+
+    from backend.app import database
+    from backend.app.models import Event
+
+    monkeypatch.setattr(main, "_export_chunk_size", 2)
+    start = datetime(2024, 5, 1, 12, 0)
+    with database.SessionLocal() as session:
+        for offset in range(6):
+            session.add(
+                Event(
+                    event_type="kiosk.scan",
+                    user_id=f"user-{offset}",
+                    payload=json.dumps({"offset": offset, "note": 'quote " and, comma'}),
+                    created_at=start + timedelta(days=offset),
+                )
+            )
+        session.commit()
+
+    response = main.export_events(
+        created_from=(start + timedelta(days=1)).replace(tzinfo=timezone.utc),
+        created_to=start + timedelta(days=5),
+        gzip=True,
+        _={},
+    )
+    lines = gzip.decompress(_read_streaming_body(response)).decode().splitlines()
+
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert response.media_type == "application/x-ndjson"
+    rows = [json.loads(line) for line in lines]
+    assert [row["payload"]["offset"] for row in rows] == [1, 2, 3, 4]
+    assert rows[0]["user_id"] == "user-1"
+    assert rows[0]["created_at"] == "2024-05-02T12:00:00"
+    assert rows[0]["metadata"] is None
+
+
+def test_export_stats_streams_csv(app_module):
+    main = app_module
+    import csv
+    from datetime import date
+
+    from backend.app import database
+
+    with database.SessionLocal() as session:
+        increments = {
+            ("kiosk.scan", date(2024, 1, 2)): 3,
+            ("pos.sale", date(2024, 1, 1)): 5,
+            ("kiosk.scan", date(2024, 1, 1)): 1,
+        }
+        main.increment_stats(session, increments)
+        session.commit()
+
+    response = main.export_stats(export_format="csv", event_type_prefix="kiosk.", _={})
+    rows = list(csv.reader(_read_streaming_body(response).decode().splitlines()))
+    empty = main.export_stats(export_format="csv", date_from=date(2030, 1, 1), _={})
+
+    assert response.headers["Content-Disposition"] == 'attachment; filename="event_stats.csv"'
+    assert rows == [
+        ["event_type", "event_date", "count"],
+        ["kiosk.scan", "2024-01-01", "1"],
+        ["kiosk.scan", "2024-01-02", "3"],
+    ]
+    assert _read_streaming_body(empty).decode().splitlines() == ["event_type,event_date,count"]
+
+
+def test_archive_moves_old_anonymized_events_and_recovers_interrupted_chunk(app_module, tmp_path):
+    main = app_module
+    from datetime import datetime, timedelta
+
+    from backend.app import database
+    from sqlalchemy import select
+
+    from backend.app.archive import EventArchive
+    from backend.app.models import Event
+
+    archive = EventArchive(tmp_path / "archive")
+    old = datetime.utcnow() - timedelta(days=400)
+    with database.SessionLocal() as session:
+        for idx in range(5):
+            event_type = "kiosk.viewed" if idx % 2 else "kiosk.scanned"
+            created_at = old + timedelta(days=idx * 20)
+            session.add(Event(event_type=event_type, created_at=created_at, anonymized=True))
+        session.add(Event(event_type="kiosk.viewed", user_id="u", created_at=old))
+        session.add(
+            Event(event_type="kiosk.viewed", created_at=datetime.utcnow(), anonymized=True)
+        )
+        session.commit()
+
+        result = main.archive_anonymized_events(
+            session, archive, older_than_days=180, chunk_size=2
+        )
+        remaining = session.execute(select(Event.anonymized)).all()
+
+        # Simulate a crash after the archive write but before the delete committed.
+        crashed = Event(
+            event_type="kiosk.scanned", created_at=old + timedelta(days=1), anonymized=True
+        )
+        session.add(crashed)
+        session.commit()
+        archive.append([(crashed.id, crashed.event_type, crashed.created_at)])
+        recovered = main.archive_anonymized_events(session, archive, older_than_days=180)
+        left = session.execute(select(Event.anonymized)).all()
+
+    assert (result.rows, result.chunks) == (5, 3)
+    assert sorted(row.anonymized for row in remaining) == [False, True]
+    assert recovered.rows == 0
+    assert len(left) == 2
+    assert archive.count_by_type() == {"kiosk.scanned": 4, "kiosk.viewed": 2}
+
+    main._event_archive = archive
+    counts = main.archive_counts(created_from=old, created_to=old + timedelta(days=2), _={})
+    assert (counts.counts, counts.total) == ({"kiosk.scanned": 2}, 2)
+
+
+def test_archive_moves_each_row_once_when_two_archivers_race(app_module, tmp_path):
+    main = app_module
+    import threading
+    import time
+    from datetime import datetime, timedelta
+
+    from backend.app import database
+    from sqlalchemy import select
+
+    from backend.app.archive import EventArchive
+    from backend.app.models import Event
+
+    old = datetime.utcnow() - timedelta(days=400)
+    with database.SessionLocal() as session:
+        for idx in range(10):
+            created_at = old + timedelta(minutes=idx)
+            session.add(Event(event_type="x", created_at=created_at, anonymized=True))
+        session.commit()
+
+    # Separate instances open the lock file separately, as two worker processes would.
+    archives = [EventArchive(tmp_path / "archive") for _ in range(2)]
+    start = threading.Barrier(2)
+    results = []
+
+    def run(archive):
+        with database.SessionLocal() as session:
+            start.wait()
+            result = main.archive_anonymized_events(
+                session,
+                archive,
+                older_than_days=180,
+                chunk_size=2,
+                throttle=lambda: time.sleep(0.01) or 0.01,
+            )
+        results.append(result.rows)
+
+    workers = [threading.Thread(target=run, args=(archive,)) for archive in archives]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    with database.SessionLocal() as session:
+        left = session.execute(select(Event.id)).all()
+
+    assert sorted(results) == [0, 10]
+    assert left == []
+    assert archives[0].count_by_type() == {"x": 10}
+
+
+def test_metrics_endpoint_reports_stage_latency_and_pool_state(app_module):
+    main = app_module
+    from backend.app import database
+    from backend.app.metrics import STAGE_SECONDS
+
+    before = STAGE_SECONDS.count("update_stats")
+    with database.SessionLocal() as session:
+        _create_event(main, session, "kiosk.scan")
+
+    body = main.render_metrics().body.decode()
+
+    assert STAGE_SECONDS.count("update_stats") == before + 1
+    assert 'ingestion_stage_duration_seconds_count{stage="event_insert"}' in body
+    assert 'ingestion_db_pool_connections{state="checked_out"}' in body
+    assert "\ningestion_nonce_cache_size " in body
+    assert "# TYPE ingestion_nonce_cache_evictions_total counter" in body
+    assert "\ningestion_nonce_cache_rejections_total 0" in body
+    assert "\ningestion_nonce_cache_expirations_total " in body
+    assert "ingestion_ingest_shed_total 0" in body
@@ -0,0 +1,41 @@
+import sys
+import threading
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backend.app.metrics import Counter, Gauge, Histogram, Registry
+
+
+def test_per_thread_accumulators_merge_into_exposition_format():
+    registry = Registry()
+    latency = registry.register(Histogram("stage_seconds", "Stage latency.", ("stage",), buckets=(0.1, 1.0)))
+    requests = registry.register(Counter("requests_total", "Requests.", ("status",)))
+    registry.register(Gauge("queue_depth", "Queued requests.", lambda: {(): 3}))
+
+    def work():
+        for _ in range(1000):
+            latency.observe(0.05, "commit")
+            requests.inc("200")
+        latency.observe(5.0, "commit")
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    requests.inc("500", amount=2)
+
+    lines = registry.render().splitlines()
+
+    assert (latency.count("commit"), requests.value("200")) == (4004, 4000)
+    assert "# TYPE stage_seconds histogram" in lines
+    assert 'stage_seconds_bucket{stage="commit",le="0.1"} 4000' in lines
+    assert 'stage_seconds_bucket{stage="commit",le="1.0"} 4000' in lines
+    assert 'stage_seconds_bucket{stage="commit",le="+Inf"} 4004' in lines
+    assert 'stage_seconds_count{stage="commit"} 4004' in lines
+    assert 'requests_total{status="200"} 4000' in lines
+    assert 'requests_total{status="500"} 2' in lines
+    assert "queue_depth 3" in lines
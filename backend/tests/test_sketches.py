@@ -0,0 +1,53 @@
+import sys
+from pathlib import Path
+
+import pytest
+
+ROOT = Path(__file__).resolve().parents[2]
+if str(ROOT) not in sys.path:
+    sys.path.insert(0, str(ROOT))
+
+from backend.app.sketches import (
+    PRECISION,
+    RELATIVE_ERROR,
+    HyperLogLog,
+    SketchFormatError,
+    register_updates,
+)
+
+
+def _sketch(user_ids):
+    sketch = HyperLogLog()
+    for user_id in user_ids:
+        sketch.add(user_id)
+    return sketch
+
+
+def test_estimates_stay_within_a_few_standard_errors():
+    for count in (0, 1, 10, 1_000, 50_000):
+        estimate = _sketch(f"user-{index}" for index in range(count)).estimate()
+        assert abs(estimate - count) <= max(1, 3 * RELATIVE_ERROR * count)
+
+
+def test_merge_counts_overlapping_users_once_and_round_trips_through_bytes():
+    monday = _sketch(f"user-{index}" for index in range(0, 20_000))
+    tuesday = _sketch(f"user-{index}" for index in range(10_000, 30_000))
+
+    stored = HyperLogLog.from_bytes(monday.to_bytes())
+    stored.merge(HyperLogLog.from_bytes(tuesday.to_bytes()))
+
+    assert stored.estimate() == pytest.approx(30_000, rel=3 * RELATIVE_ERROR)
+    assert len(monday.to_bytes()) < 2 ** PRECISION
+    assert HyperLogLog.from_bytes(None).estimate() == 0
+
+
+def test_register_updates_match_adding_users_and_reject_foreign_sketches():
+    users = [f"user-{index}" for index in range(500)] + [None]
+    sketch = HyperLogLog()
+    assert sketch.apply(register_updates(users))
+    assert sketch.registers == _sketch(users[:-1]).registers
+    assert sketch.covers(register_updates(users[:10]))
+    assert not sketch.apply(register_updates(users[:10]))
+
+    with pytest.raises(SketchFormatError):
+        HyperLogLog.from_bytes(bytes((PRECISION + 1,)) + sketch.to_bytes()[1:])